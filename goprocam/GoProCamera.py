@@ -49,8 +49,10 @@ class GoPro:
                 time.sleep(0.1)
         self.ip_addr = self.getWebcamIP(self._webcam_device)
 
-    def __init__(self, camera="detect", ip_address="10.5.5.9", mac_address="AA:BB:CC:DD:EE:FF", debug=True, timeoutz=5, webcam_device="usb0", api_type=constants.ApiServerType.SMARTY):
+    def __init__(self, camera="detect", ip_address="10.5.5.9", mac_address="AA:BB:CC:DD:EE:FF", debug=True, timeoutz=5, webcam_device="usb0", api_type=constants.ApiServerType.SMARTY, deadline=None):
         self._poweron_attempts = None
+        # anything with clamp(seconds, step), e.g. lib.deadline.Deadline. Caps every request timeout.
+        self.deadline = deadline
         if sys.version_info[0] < 3:
             print("Needs Python v3, run again on a virtualenv or install Python 3")
             exit()
@@ -88,17 +90,11 @@ class GoPro:
 
     def KeepAlive(self):
         """Sends keep alive packet"""
-        if self._camera_model_name == "HERO8 Black" or self._camera_model_name == "HERO9 Black":
-            keep_alive_payload = "_GPHD_:1:0:2:0.000000\n".encode()
-        else:
-            keep_alive_payload = "_GPHD_:0:0:2:0.000000\n".encode()
-
         max_loops = 100000  # example large cap
         loop_count = 0
 
         while True:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            sock.sendto(keep_alive_payload, (self.ip_addr, 8554))
+            self.sendKeepAlive()
             time.sleep(2500/1000)
             if self._api_type == constants.ApiServerType.OPENGOPRO:
                 self._request("gopro/camera/keep_alive")
@@ -108,6 +104,15 @@ class GoPro:
                 print("Reached KeepAlive loop cap, exiting KeepAlive().")
                 break
 
+    def sendKeepAlive(self):
+        """Sends a single keep alive packet to the camera (port 8554)"""
+        if self._camera_model_name == "HERO8 Black" or self._camera_model_name == "HERO9 Black":
+            keep_alive_payload = "_GPHD_:1:0:2:0.000000\n".encode()
+        else:
+            keep_alive_payload = "_GPHD_:0:0:2:0.000000\n".encode()
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.sendto(keep_alive_payload, (self.ip_addr, 8554))
+
     def getPassword(self):
         """Gets password from Hero3, Hero3+ cameras"""
         try:
@@ -149,6 +154,8 @@ class GoPro:
 
         if _timeout is None:
             _timeout = self._timeout
+        if self.deadline is not None:
+            _timeout = self.deadline.clamp(_timeout, path)
 
         if param != "" and value == "":
             uri = "%s%s/%s/%s" % ("https://" if _isHTTPS else "http://",
@@ -453,14 +460,17 @@ class GoPro:
         if self.whichCam() == constants.Camera.Interface.GPControl:
             # This allows you to delete x number of files backwards. Will delete a timelapse/burst entirely as its interpreted as a single file.
             if isinstance(option, int):
+                response = ""
                 for _ in range(option):
-                    return self.gpControlCommand("storage/delete/" + "last")
+                    response = self.gpControlCommand("storage/delete/" + "last")
+                return response
             else:
                 return self.gpControlCommand("storage/delete/" + option)
         else:
             if isinstance(option, int) == True:
                 for _ in range(option):
-                    return self.sendCamera("DL")
+                    self.sendCamera("DL")
+                return
             else:
                 if option == "last":
                     return self.sendCamera("DL")
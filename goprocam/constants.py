@@ -31,6 +31,8 @@ class Status:
         VideosTaken = "39"
         PhotosTaken = "38"
         IsRecording = "8"
+        # HERO5: the encoder is running (video, time-lapse, night-lapse). IsRecording above is really IsBusy.
+        IsEncoding = "10"
         RemainingSpace = "54"
         TotalHiLights = "58"
         LastHiLight = "59"
@@ -38,6 +40,7 @@ class Status:
         SdCardInserted = "33"
         IsConnected = "31"
         GPS = "68"
+        DateTime = "40"
         BattPercent = "70"
         DigitalZoom = "75"
         SystemReady = "82"
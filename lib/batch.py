@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+# The router window used to run its chores one after the other with no overall limit, and the camera gets no
+# keep-alive while we're on the router. Now they run side by side under one budget: the most important ones
+# start first, each has its own timeout, and whatever isn't done when the budget is up gets reported, not waited on.
+# A task registered with alone=True (the clock) runs by itself, and the rest only start once it's done or timed out.
+
+import time
+import collections
+import concurrent.futures
+
+from lib.logger import logger
+from lib.watchdog import watchdog
+
+Task = collections.namedtuple("Task", ["name", "run", "priority", "timeout", "alone"])
+
+
+class TaskBatch:
+
+    def __init__(self, name, workers=3):
+        self.name = name
+        self.workers = workers
+        self.tasks = []
+        self.last_report = None
+
+    def register(self, name, run, priority=5, timeout=30, alone=False):
+        """
+        Lower priority starts first, tasks that run alone before all others. `run` is called without arguments;
+        returning False counts as failed. `timeout` is only how long we wait for it, `run` has to stop on its own.
+        """
+        self.tasks.append(Task(name, run, priority, timeout, alone))
+        self.tasks.sort(key=lambda task: (not task.alone, task.priority))
+
+    def run(self, budget):
+        """
+        Runs every task, at most `budget` seconds for the whole batch. Returns {name: outcome} with outcome one of
+        "done", "failed", "timeout" (still running, we stopped waiting) or "skipped" (never started).
+        """
+        start = time.monotonic()
+        deadline = start + budget
+        results = {task.name: "skipped" for task in self.tasks}
+        # Threads can't be killed, so a task that runs over is left behind. That's why every task has its own timeout too.
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+        submitted = []
+        try:
+            pending = {}
+            queue = list(self.tasks)
+            while queue or pending:
+                now = time.monotonic()
+                while queue and len(pending) < self.workers and now < deadline:
+                    if any(task.alone for task, _ in pending.values()) or (queue[0].alone and pending):
+                        break
+                    task = queue.pop(0)
+                    future = executor.submit(self._call, task)
+                    submitted.append(future)
+                    pending[future] = (task, min(deadline, now + task.timeout))
+                if not pending:
+                    break
+
+                watchdog.ping()
+                next_deadline = min(until for _, until in pending.values())
+                done, _ = concurrent.futures.wait(pending, timeout=min(5.0, max(0.0, next_deadline - time.monotonic())),
+                                                  return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    task, _ = pending.pop(future)
+                    results[task.name] = "done" if future.result() is not False else "failed"
+                for future, (task, until) in list(pending.items()):
+                    if time.monotonic() >= until:
+                        results[task.name] = "timeout"
+                        del pending[future]
+        finally:
+            # A task we stopped waiting on still holds its worker, so what came after it may not have started yet.
+            # Cancelled by hand: shutdown(cancel_futures=True) is Python 3.9+.
+            for future in submitted:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+        elapsed = time.monotonic() - start
+        unfinished = [name for name, outcome in results.items() if outcome != "done"]
+        self.last_report = {"seconds": round(elapsed, 1), "budget": round(budget, 1), "results": results}
+        if unfinished:
+            logger.warning(f"{self.name} batch took {elapsed:.1f}s of {budget:.0f}s. Not finished: "
+                           + ", ".join(f"{name} ({results[name]})" for name in unfinished))
+        else:
+            logger.info(f"{self.name} batch done in {elapsed:.1f}s of {budget:.0f}s.")
+        return results
+
+    def summary(self):
+        if not self.last_report:
+            return f"Last {self.name}: none yet"
+        unfinished = [name for name, outcome in self.last_report["results"].items() if outcome != "done"]
+        return (f"Last {self.name}: {self.last_report['seconds']}s of {self.last_report['budget']:.0f}s, "
+                f"unfinished: {', '.join(unfinished) or 'none'}")
+
+    @staticmethod
+    def _call(task):
+        try:
+            return task.run()
+        except Exception as e:
+            logger.error(f"Task {task.name} failed: {e}")
+            return False
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+# The GoPro clock stamps the EXIF data, and nobody corrects it. This tracks how far it drifts from the rpi clock
+# and pushes the rpi time to the camera (syncTime) when it drifts too much. Runs while the camera is already awake.
+
+import os
+import datetime
+import lib.config as config
+
+from goprocam import constants
+from lib.logger import logger
+from lib.utilities import load_json, save_json
+
+
+class CameraClock:
+
+    def __init__(self):
+        self.config = config.global_config
+        self.clock_config = self.config.camera_clock_config
+        self.history_path = os.path.join(self.config.data_path, "camera_clock.json")
+        self.history = load_json(self.history_path, [])
+
+    def check(self, gopro, status, taken=None):
+        """
+        Compares the camera clock with ours, records the drift and syncs the camera if needed.
+        `status` is the status dict we already fetched in this wake, so this costs no extra request
+        unless the camera doesn't report its time. `taken` is (shutter, saved) of the newest photo on our clock,
+        the media fallback needs it.
+        """
+        now = datetime.datetime.now()
+        camera_time = self.camera_time_from_status(status)
+        source = "status"
+        if camera_time is not None:
+            drift = (camera_time - now).total_seconds()
+        else:
+            camera_time = self.camera_time_from_media(gopro)
+            source = "media"
+            drift = self.media_drift(camera_time, taken) if camera_time is not None else None
+        if drift is None:
+            logger.warning("Could not read the GoPro clock. Skipping drift check.")
+            return None
+
+        synced = False
+        if self.config.last_time_sync is None:
+            # rpi has no RTC, so until ntpdate worked our own clock can't be trusted either
+            logger.info(f"GoPro clock drift is {drift:+.0f}s, but the rpi clock isn't synced yet. Not correcting.")
+        elif abs(drift) > self.clock_config.get("max_drift_seconds", 2):
+            logger.warning(f"GoPro clock drift is {drift:+.0f}s. Syncing camera time.")
+            synced = gopro.syncTime() != ""
+        else:
+            logger.info(f"GoPro clock drift is {drift:+.0f}s.")
+
+        self.history.append({
+            "at": now.isoformat(timespec="seconds"),
+            "drift_seconds": drift,
+            "source": source,
+            "synced": synced,
+        })
+        self.history = self.history[-self.clock_config.get("history_size", 1000):]
+        save_json(self.history_path, self.history)
+        return drift
+
+    @staticmethod
+    def camera_time_from_status(status):
+        # HERO5 reports its clock as hex bytes, like "%19%03%15%0E%1A%2B" (yy mm dd hh mm ss)
+        raw = status.get(constants.Status.STATUS.DateTime) if status else None
+        if not raw:
+            return None
+        try:
+            yy, month, day, hour, minute, second = [int(part, 16) for part in raw.split("%") if part]
+            return datetime.datetime(2000 + yy, month, day, hour, minute, second)
+        except ValueError:
+            logger.warning(f"Unexpected camera date format: {raw}")
+            return None
+
+    @staticmethod
+    def media_drift(camera_time, taken):
+        """
+        The file is stamped in whole seconds, somewhere between the shutter and the camera saying it's saved.
+        So it's only drift if it's outside that window, and only by as much. Compared with "now" it would always
+        look a few seconds behind. None if we don't know when the photo was taken.
+        """
+        if taken is None or None in taken:
+            return None
+        shutter_at, saved_at = taken
+        ahead = (camera_time - saved_at).total_seconds()
+        behind = (camera_time + datetime.timedelta(seconds=1) - shutter_at).total_seconds()
+        return ahead if ahead > 0 else behind if behind < 0 else 0.0
+
+    @staticmethod
+    def camera_time_from_media(gopro):
+        # Fallback: the newest file's modification time. Only good right after a capture.
+        media = gopro.listMedia(format=True, media_array=True)
+        if not media:
+            return None
+        # "mod" is the camera's local wall time, written as if it were UTC
+        newest = max(int(item[3]) for item in media)
+        return datetime.datetime.utcfromtimestamp(newest)
+
+camera_clock = CameraClock()
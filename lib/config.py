@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 
+import os
 import json
-import subprocess
 import datetime
 
 from lib import utilities
@@ -17,46 +17,88 @@ class Config:
 
         self.state = "WAITING"
 
-        self.state_file_path = self.config["heartbeat"]["state_file"]
         self.router_config = self.config["router"]
         self.gopro_config = self.config["gopro"]
         self.push_config = self.config["pushbullet"]
         self.photo_timer = self.config["photo_timer"]["minutes"]
-        self.keep_alive_timer = self.config["keep_alive"]["minutes"]
+        # "pi" = we wake the camera and press the shutter ourselves, "in_camera" = the camera runs its own lapse
+        self.capture_engine = self.config["photo_timer"].get("engine", "pi")
+        self.lapse_config = self.config.get("in_camera_lapse", {})
+        # Time windows (HH:MM) where a slot gets a burst or an exposure bracket instead of one frame
+        self.capture_windows = self.config["photo_timer"].get("windows", [])
+        self.keep_alive_config = self.config["keep_alive"]
+        self.keep_alive_timer = self.keep_alive_config["minutes"]
+        self.update_timer = self.config.get("send_update", {}).get("minutes", [52])
+        # Photo density by daylight (lib/plan). Off, or missing, means photo_timer every hour.
+        self.sun_plan_config = self.config.get("sun_plan", {})
+        self.preview_config = self.config.get("preview", {})
+        # Upper bounds (seconds) for each readiness wait in the capture cycle
+        self.waits_config = self.config["gopro"].get("max_waits", {})
+        # Camera calls run in a child process that gets killed and replaced when it runs past these timeouts
+        self.camera_worker_config = self.config["gopro"].get("worker", {})
+        self.camera_clock_config = self.config.get("camera_clock", {})
+        self.forecast_config = self.config.get("forecast", {})
+        self.scheduler_config = self.config.get("scheduler", {})
+        # lib/machine: how many transitions, dwell samples and days of dwell totals to keep
+        self.machine_config = self.config.get("state_machine", {})
+        # The router window: overall budget, how many chores at once, and a timeout per chore
+        self.update_window_config = self.config.get("send_update", {}).get("window", {})
+        # OFFLINE_ALERT: backoff between tries and how much radio time they may take per hour
+        self.offline_config = self.config.get("offline", {})
+        # Recording every nmcli/ping/camera/PushBullet call to a trace that lib.trace can replay
+        self.trace_config = self.config.get("trace", {})
+        # Where the small persisted files live (drift history, learned values..)
+        self.data_path = self.config.get("data_path", "/home/timelapse/data")
+        # Counters and such, saved every update window. Not heartbeat.state_file, that's the OLED's ring buffer.
+        self.state_file_path = self.config.get("state_file", os.path.join(self.data_path, "state.json"))
 
         self.sending_alert_every_20_min = 0
         self.restart_counter = 0
         self.max_error_retries = 4
         self.error_retries_counter = 0
         self.photo_capture_error_counter = 0
+        self.lapse_restart_counter = 0
+        self.keep_alive_preemptions = 0
+        self.missed_slots = 0
+        self.camera_worker_kills = 0
         self.last_offline_alert_time = None
         self.last_photo_minute = None
+        self.last_photo_target = None
+        self.next_photo_target = None
+        self.last_keep_alive_slot = None
+        self.last_update_slot = None
+        self.last_time_sync = None
         self.execution_start_time = None
         self.rpi_uptime = None
 
     def load_saved_config(self):
         logger.info(f"Loading state. This only happens after a REBOOT. Current state is [{self.state}]")
-        result = subprocess.run(["sudo", "uptime"], capture_output=True, text=True)
-        logger.info(f"Uptime: {result.stdout.strip()}")
+        self.rpi_uptime = self.uptime_seconds()
+        logger.info(f"Uptime: {self.rpi_uptime}s")
 
         try:
             with open(self.state_file_path, "r") as f:
                 loaded_state = json.load(f)
 
             # Convert string timestamps back to datetime objects
-            for key in ["last_photo_minute", "last_offline_alert_time"]:
-                if key in loaded_state:
-                    loaded_state[key] = utilities.from_iso_format_fallback(loaded_state[key])
+            if loaded_state.get("last_offline_alert_time"):
+                loaded_state["last_offline_alert_time"] = utilities.from_iso_format_fallback(loaded_state["last_offline_alert_time"])
+            # A minute (int). Older state files have a timestamp here.
+            if isinstance(loaded_state.get("last_photo_minute"), str):
+                loaded_state["last_photo_minute"] = utilities.from_iso_format_fallback(loaded_state["last_photo_minute"]).minute
 
             self.sending_alert_every_20_min = loaded_state.get("sending_alert_every_20_min", False)
             self.restart_counter = loaded_state.get("restart_counter", -1)
             self.max_error_retries = loaded_state.get("max_error_retries", 5)
             self.error_retries_counter = loaded_state.get("error_retries_counter", 0)
             self.photo_capture_error_counter = loaded_state.get("photo_capture_error_counter", 0)
+            self.lapse_restart_counter = loaded_state.get("lapse_restart_counter", 0)
+            self.keep_alive_preemptions = loaded_state.get("keep_alive_preemptions", 0)
+            self.missed_slots = loaded_state.get("missed_slots", 0)
+            self.camera_worker_kills = loaded_state.get("camera_worker_kills", 0)
             self.last_offline_alert_time = loaded_state.get("last_offline_alert_time")
             self.last_photo_minute = loaded_state.get("last_photo_minute")
             self.execution_start_time = loaded_state.get("execution_start_time", datetime.datetime.now().isoformat())
-            self.rpi_uptime = loaded_state.get("rpi_uptime", -1)
 
             logger.info("New stat is loaded and all saved variables are rehydrated.")
             return loaded_state
@@ -67,16 +109,34 @@ class Config:
             logger.error(f"Error loading state: {e}")
             return {}
 
+    def _execution_start(self):
+        # a datetime once the main loop runs, the saved string before that
+        if isinstance(self.execution_start_time, datetime.datetime):
+            return self.execution_start_time
+        return utilities.from_iso_format_fallback(self.execution_start_time)
+
+    @staticmethod
+    def uptime_seconds():
+        # /proc/uptime instead of shelling out to sudo uptime. -1 if we can't tell.
+        try:
+            with open("/proc/uptime", "r") as f:
+                return round(float(f.read().split()[0]))
+        except (OSError, ValueError, IndexError):
+            return -1
+
     def save_current_configs(self):
         data = {
             "last_photo_minute": self.last_photo_minute if self.last_photo_minute else None,
-            "last_offline_alert_time": utilities.from_iso_format_fallback(
-                self.last_offline_alert_time) if self.last_offline_alert_time else None,
+            "last_offline_alert_time": self.last_offline_alert_time.isoformat() if self.last_offline_alert_time else None,
             "photo_capture_error_counter": self.photo_capture_error_counter if self.photo_capture_error_counter else 0,
             "error_retries": self.error_retries_counter if self.error_retries_counter else 0,
             "max_error_retries": self.max_error_retries if self.max_error_retries else 5,
-            "execution_time_seconds": (datetime.datetime.now() - utilities.from_iso_format_fallback(self.execution_start_time)).total_seconds(),
+            "execution_time_seconds": (datetime.datetime.now() - self._execution_start()).total_seconds(),
             "restart_counter": self.restart_counter,
+            "lapse_restart_counter": self.lapse_restart_counter,
+            "keep_alive_preemptions": self.keep_alive_preemptions,
+            "missed_slots": self.missed_slots,
+            "camera_worker_kills": self.camera_worker_kills,
             "sending_alert_every_20_min": self.sending_alert_every_20_min
         }
 
@@ -87,4 +147,5 @@ class Config:
         except Exception as e:
             logger.error(f"Failed to save state: {e}")
 
-global_config = Config()
+# TIMELAPSE_CONFIG points somewhere else, e.g. the simulation's own copy (lib/simulation)
+global_config = Config(os.environ.get("TIMELAPSE_CONFIG", "/home/timelapse/config.json"))
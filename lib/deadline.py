@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+# One deadline per operation ("this capture is done by :03:20"), handed down from the state handlers through
+# lib.gopro, lib.session, lib.wifi and goprocam. Every layer clamps its own timeouts and retries to what's left
+# and raises DeadlineExceeded when nothing is. It also keeps track of where the time went.
+
+import math
+import time
+import datetime
+
+from lib.logger import logger
+
+
+class DeadlineExceeded(TimeoutError):
+
+    def __init__(self, deadline, step):
+        super().__init__(f"{deadline.name} ran out of its {deadline.budget:.1f}s budget at [{step}].")
+        self.deadline = deadline
+        self.step = step
+
+    def __reduce__(self):
+        # so it comes back from the camera worker as itself, not as a RuntimeError
+        return DeadlineExceeded, (self.deadline, self.step)
+
+
+class Deadline:
+    """
+    `seconds` from now, on the monotonic clock so an NTP step can't move it. None means no limit.
+    The monotonic clock is system wide, so a deadline can be sent to the camera worker as it is.
+    """
+
+    def __init__(self, seconds=None, name="operation"):
+        self.name = name
+        self.budget = math.inf if seconds is None else max(0.0, seconds)
+        self.started = time.monotonic()
+        self.expires = self.started + self.budget
+        self.spent_on = []  # (step, seconds), in order
+
+    @classmethod
+    def at(cls, when, name="operation"):
+        """Deadline at wall clock time `when` (datetime). None means no limit."""
+        if when is None:
+            return cls(None, name)
+        return cls((when - datetime.datetime.now()).total_seconds(), name)
+
+    def remaining(self):
+        return self.expires - time.monotonic()
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self, step):
+        if self.expired():
+            raise DeadlineExceeded(self, step)
+
+    def clamp(self, seconds, step="wait"):
+        """`seconds`, or less if that's all we have left. Raises DeadlineExceeded if nothing is left."""
+        self.check(step)
+        return self.remaining() if seconds is None else min(seconds, self.remaining())
+
+    def tries(self, tries, seconds_per_try, step="retry"):
+        """How many of `tries` attempts of about `seconds_per_try` still fit. At least one, unless we're out of time."""
+        self.check(step)
+        if math.isinf(self.budget) or seconds_per_try <= 0:
+            return tries
+        return max(1, min(tries, int(self.remaining() // seconds_per_try)))
+
+    def spent(self, step, seconds):
+        self.spent_on.append((step, round(seconds, 2)))
+
+    def log(self):
+        """One line: what each step took and how much of the budget is left."""
+        used = time.monotonic() - self.started
+        steps = ", ".join(f"{step} {seconds:.1f}s" for step, seconds in self.spent_on) or "no steps"
+        budget = "no limit" if math.isinf(self.budget) else f"{self.budget:.1f}s"
+        logger.info(f"Budget {self.name}: {steps}. Used {used:.1f}s of {budget}.")
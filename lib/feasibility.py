@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+
+# Moving minutes between keep_alive.minutes, photo_timer.minutes and send_update.minutes by hand is how a config
+# ends up with a keep-alive that never fits, an update window that runs into a photo or an hour where the camera's
+# Wi-Fi is left alone long enough to fall asleep. This walks every hour of the plan with worst-case latencies and
+# says so before the config goes to the Pi. No camera, no network, nothing saved: it runs in milliseconds.
+#
+#   python -m lib.feasibility [--config config.json] [--profile latency.json] [--date 2025-06-21] [--days 1] [--quiet]
+#
+# The profile is the same JSON as the simulator's (see lib.simulation.PROFILE), plus lead_seconds if you know what
+# the scheduler learned. [low, high] ranges count as high, the camera Wi-Fi's sleep as low.
+# Exits with 1 if anything would miss a slot or let the camera Wi-Fi sleep, so it can gate a config change.
+
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import collections
+
+from lib.simulation import PROFILE
+
+# One planned action, all times in ms from the start of its slot's hour. shutter is None for anything but photos.
+Step = collections.namedtuple("Step", ["kind", "slot", "planned", "start", "shutter", "end", "network", "frames"])
+Problem = collections.namedtuple("Problem", ["level", "slot", "message"])
+
+HOUR_MS = 3600 * 1000
+
+
+def worst(profile, key, default=0.0):
+    """The high end of a profile entry, in ms."""
+    value = profile.get(key, default)
+    return round(1000 * (max(value) if isinstance(value, (list, tuple)) else value))
+
+
+def soonest(profile, key, default=0.0):
+    """The low end of a profile entry, in ms. The worst case for a timeout is the shortest one."""
+    value = profile.get(key, default)
+    return round(1000 * (min(value) if isinstance(value, (list, tuple)) else value))
+
+
+def clock(ms):
+    """mm:ss.mmm within the hour."""
+    ms %= HOUR_MS
+    return f"{ms // 60000:02d}:{ms // 1000 % 60:02d}.{ms % 1000:03d}"
+
+
+class FeasibilityCheck:
+    """Lays one or more days of the capture plan out on a ms timeline and checks it."""
+
+    def __init__(self, cfg, profile=None):
+        import lib.plan as plan
+        self.plan_module = plan
+        self.config = cfg
+        self.profile = dict(PROFILE, **(profile or {}))
+        self.capture_plan = plan.CapturePlan(cfg)
+        scheduler = cfg.scheduler_config
+        waits = cfg.waits_config
+        window = cfg.update_window_config
+        # The real lead is learned from the captures, a measured profile can say what it settled on
+        self.lead = min(worst(self.profile, "lead_seconds", scheduler.get("default_lead_seconds", 6)),
+                        1000 * scheduler.get("max_lead_seconds", 45))
+        self.late = {
+            "photo": 1000 * scheduler.get("late_seconds", 30),
+            "keep_alive": 1000 * scheduler.get("keep_alive_late_seconds", 20),
+            "send_update": 1000 * scheduler.get("update_late_seconds", 60),
+        }
+        # What the planner thinks things take (it drops what doesn't fit with these) ..
+        durations = scheduler.get("durations", {})
+        self.planned_ms = {kind: 1000 * durations.get(kind, 30) for kind in ("keep_alive", "send_update")}
+        # .. and what they take with the profile's latencies
+        self.wake = worst(self.profile, "wake_seconds")
+        self.capture = worst(self.profile, "capture_seconds")
+        self.switch = worst(self.profile, "switch_seconds")
+        self.power_off = worst(self.profile, "sleep_seconds", waits.get("sleep", 3))
+        self.window = round(1000 * window.get("budget_seconds", 60))
+        self.wifi_sleep = soonest(self.profile, "camera_wifi_sleep_seconds")
+
+    def day(self, date):
+        """[(hour start, [Step])] for the 24 hours of `date`."""
+        minutes = self.capture_plan.build(date)[0]
+        midnight = datetime.datetime.combine(date, datetime.time())
+        hours = []
+        for hour in range(24):
+            steps = []
+            for minute in range(60):
+                flags = minutes[hour * 60 + minute]
+                slot = minute * 60000
+                for kind, flag in self.plan_module.FLAGS.items():
+                    if flags & flag:
+                        frames = len(self.plan_module.frame_plan(
+                            self.config.capture_windows, midnight + datetime.timedelta(hours=hour, minutes=minute))[1])
+                        planned = slot - self.lead if kind == "photo" else slot
+                        steps.append(Step(kind, slot, planned, planned, None, None, None, frames))
+            hours.append((midnight + datetime.timedelta(hours=hour), steps))
+        return hours
+
+    def run(self, start_date, days=1):
+        """
+        Checks `days` days from `start_date`. Returns ([(hour start, [Step], [Problem])], [Problem] for the whole run).
+        The day after is laid out too, so the last hour's gaps and overruns are checked against what comes next.
+        """
+        hours = []
+        for offset in range(days + 1):
+            hours.extend(self.day(start_date + datetime.timedelta(days=offset)))
+
+        # One flat timeline, in ms since the first hour, sorted like the planner does (start, then priority)
+        priority = {"photo": 0, "keep_alive": 1, "send_update": 2}
+        timeline = []
+        for index, (_, steps) in enumerate(hours):
+            for step in steps:
+                timeline.append((index, step._replace(slot=step.slot + index * HOUR_MS,
+                                                      planned=step.planned + index * HOUR_MS,
+                                                      start=step.start + index * HOUR_MS)))
+        timeline.sort(key=lambda item: (item[1].planned, priority[item[1].kind]))
+
+        problems = {index: [] for index in range(len(hours))}
+        laid_out = {index: [] for index in range(len(hours))}
+        kept = self._drop_collisions(timeline, problems)
+
+        free_at = None
+        network = "gopro"
+        last_contact = None
+        for index, step in kept:
+            # One thing at a time, like the main loop: a step that's still running pushes the next one back
+            start = step.planned if free_at is None else max(step.planned, free_at)
+            needs = "router" if step.kind == "send_update" else "gopro"
+            arrived = start + (self.switch if needs != network else 0)
+            late = start - step.planned
+            if step.kind != "photo" and late > self.late[step.kind]:
+                # the planner lets it go once it's this late
+                problems[index].append(Problem("warning", step.slot, f"{step.kind} {clock(step.slot)} is skipped, "
+                                               f"it could only start {late} ms late"))
+                continue
+            shutter = None
+            if step.kind == "photo":
+                shutter = arrived + self.wake
+                end = shutter + step.frames * self.capture + self.power_off
+                if shutter - step.slot > self.late["photo"]:
+                    problems[index].append(Problem("error", step.slot, f"photo {clock(step.slot)} misses its slot: "
+                                                   f"shutter at {clock(shutter)}, {shutter - step.slot} ms after the target"))
+                elif late:
+                    problems[index].append(Problem("warning", step.slot, f"photo {clock(step.slot)} starts {late} ms "
+                                                   f"late, the step before it is still running"))
+            elif step.kind == "keep_alive":
+                end = arrived + self.wake + self.power_off
+            else:
+                # the window's budget, then back to the GoPro Wi-Fi
+                end = arrived + self.window + self.switch
+
+            if needs == "gopro":
+                if last_contact is not None and arrived - last_contact > self.wifi_sleep:
+                    problems[index].append(Problem("error", step.slot, f"camera Wi-Fi left alone for "
+                                                   f"{arrived - last_contact} ms before {step.kind} {clock(step.slot)}, "
+                                                   f"it sleeps after {self.wifi_sleep} ms"))
+                last_contact = end
+            network = "gopro"
+            free_at = end
+            laid_out[index].append(step._replace(start=start, shutter=shutter, end=end, network=needs))
+
+        checked = hours[:days * 24]
+        results = []
+        for index, (hour_start, _) in enumerate(checked):
+            results.append((hour_start, [self._relative(s, index) for s in laid_out[index]],
+                            [p._replace(slot=p.slot - index * HOUR_MS) for p in problems[index]]))
+
+        overall = []
+        if self.config.update_timer and not any(s.kind == "send_update" for _, steps, _ in results for s in steps):
+            overall.append(Problem("error", None, "no update window fits anywhere: no time sync, no status push"))
+        if self.config.router_config.get("ssid") == self.config.gopro_config.get("ssid"):
+            overall.append(Problem("error", None, "router and GoPro have the same SSID: switching to either one "
+                                                  "can't be told apart, the router window never leaves the camera"))
+        return results, overall
+
+    def _drop_collisions(self, timeline, problems):
+        # Same rule as ActionPlanner._drop_collisions: anything still running when the next photo has to start is
+        # not planned, with the durations from config.json
+        kept = []
+        for i, (index, step) in enumerate(timeline):
+            if step.kind != "photo":
+                next_photo = next((s for _, s in timeline[i + 1:] if s.kind == "photo"), None)
+                if next_photo and step.planned + self.planned_ms[step.kind] > next_photo.planned:
+                    problems[index].append(Problem("warning", step.slot, f"{step.kind} {clock(step.slot)} is never run, "
+                                                   f"it would run into photo {clock(next_photo.slot)}"))
+                    continue
+            kept.append((index, step))
+        return kept
+
+    @staticmethod
+    def _relative(step, index):
+        shift = index * HOUR_MS
+        return step._replace(slot=step.slot - shift, planned=step.planned - shift, start=step.start - shift,
+                             shutter=step.shutter - shift if step.shutter is not None else None, end=step.end - shift)
+
+
+def timeline(steps, problems):
+    """The hour, one line per minute like specs/one_hour_cycle.txt, times as mm:ss.mmm."""
+    by_minute = collections.defaultdict(list)
+    for step in steps:
+        by_minute[step.slot // 60000].append(step)
+    flagged = {p.slot // 60000 for p in problems if p.slot is not None}
+    lines = [" min   action        start       shutter     end         network"]
+    for minute in range(60):
+        mark = "!" if minute in flagged else " "
+        if not by_minute[minute]:
+            lines.append(f" :{minute:02d}{mark}  .")
+        for step in by_minute[minute]:
+            shutter = clock(step.shutter) if step.shutter is not None else ""
+            note = f"  {step.shutter - step.slot:+d} ms" if step.shutter is not None else ""
+            if step.frames > 1 and step.kind == "photo":
+                note += f", {step.frames} frames"
+            lines.append(f" :{minute:02d}{mark}  {step.kind:<12}  {clock(step.start)}   {shutter:<9}   "
+                         f"{clock(step.end)}   {step.network:<7}{note}".rstrip())
+    return lines
+
+
+def report(results, overall, name, seconds, quiet=False):
+    problems = [p for _, _, hour_problems in results for p in hour_problems] + overall
+    errors = sum(1 for p in problems if p.level == "error")
+    warnings = len(problems) - errors
+    lines = [f"{name}: {len(results)} hours checked in {seconds * 1000:.1f} ms, {errors} errors, {warnings} warnings."]
+    lines += [f"  {p.level.upper()}: {p.message}" for p in overall]
+
+    # Hours that look the same are shown once
+    groups = collections.OrderedDict()
+    for hour_start, steps, hour_problems in results:
+        key = (tuple(steps), tuple(hour_problems))
+        groups.setdefault(key, []).append(hour_start)
+    for (steps, hour_problems), starts in groups.items():
+        if quiet and not hour_problems:
+            continue
+        hours = ", ".join(f"{s:%H}" for s in starts) if len({s.date() for s in starts}) == 1 else \
+            ", ".join(f"{s:%m-%d %H}" for s in starts)
+        lines += ["", f"Hours {hours}:"]
+        lines += [f"  {p.level.upper()}: {p.message}" for p in hour_problems]
+        if not quiet:
+            lines += timeline(steps, hour_problems)
+    return "\n".join(lines), errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check a config.json schedule against worst-case latencies.")
+    parser.add_argument("--config", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                         "config.json"))
+    parser.add_argument("--profile", help="JSON with measured latencies, see lib.simulation.PROFILE")
+    parser.add_argument("--date", type=datetime.date.fromisoformat, default=datetime.date.today())
+    parser.add_argument("--days", type=int, default=1)
+    parser.add_argument("--quiet", action="store_true", help="only the problems, no timeline")
+    args = parser.parse_args(argv)
+
+    # lib.config loads its global config on import, make that the one we check
+    os.environ.setdefault("TIMELAPSE_CONFIG", args.config)
+    from lib.config import Config
+
+    profile = None
+    if args.profile:
+        with open(args.profile, "r") as f:
+            profile = json.load(f)
+    start = time.perf_counter()
+    check = FeasibilityCheck(Config(args.config), profile)
+    results, overall = check.run(args.date, args.days)
+    text, errors = report(results, overall, args.config, time.perf_counter() - start, args.quiet)
+    print(text)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+# Guesses how many days we have left until the SD card is full and the GoPro battery is critical,
+# from the status values we already get while the camera is awake. No extra requests.
+
+import os
+import time
+import lib.config as config
+
+from goprocam import constants
+from lib.logger import logger
+from lib.utilities import load_json, save_json
+
+SECONDS_PER_DAY = 24 * 3600
+# How much a value has to go up at once to count as a refill (new card, charged battery). Smaller upticks are
+# the camera's own jitter and stay in the fit. rem_space is in KB.
+REFILL_JUMPS = {"rem_space": 1024 * 1024, "rem_photos": 100, "battery": 10}
+
+
+class Forecaster:
+
+    def __init__(self):
+        self.config = config.global_config
+        self.forecast_config = self.config.forecast_config
+        self.samples_path = os.path.join(self.config.data_path, "forecast.json")
+        saved = load_json(self.samples_path, {})
+        self.samples = saved.get("samples", [])
+        # Which alerts already went out, so we only alert when a threshold is crossed, not every hour
+        self.alerted = saved.get("alerted", {})
+
+    def sample(self, status):
+        """Records one sample from a status dict we already fetched. Does nothing if there's no status."""
+        if not status:
+            return
+        STATUS = constants.Status.STATUS
+        self.samples.append({
+            "at": time.time(),
+            "rem_space": status.get(STATUS.RemainingSpace),
+            "rem_photos": status.get(STATUS.RemPhotos),
+            "battery": status.get(STATUS.BattPercent),
+            "sd_status": status.get(STATUS.SdCardInserted),
+        })
+        window = self.forecast_config.get("window_hours", 48) * 3600
+        self.samples = [s for s in self.samples if s["at"] >= time.time() - window]
+        self._save()
+
+    def forecast(self):
+        """
+        Returns {"storage_days": .., "battery_days": .., "sd_ok": ..}. Days are None when there's no downward trend,
+        sd_ok is None when the camera didn't say.
+        """
+        critical = self.forecast_config.get("battery_critical_percent", 15)
+        jumps = dict(REFILL_JUMPS, **self.forecast_config.get("refill_jumps", {}))
+        latest = self.samples[-1] if self.samples else {}
+        # Free space is what actually runs out, the photo count is the camera's guess. That's the fallback.
+        storage_key = "rem_space" if any(s.get("rem_space") is not None for s in self.samples) else "rem_photos"
+        sd_status = latest.get("sd_status")
+        return {
+            "storage_days": self.days_until(self.samples, storage_key, 0, jumps[storage_key]),
+            "battery_days": self.days_until(self.samples, "battery", critical, jumps["battery"]),
+            "sd_ok": None if sd_status is None else sd_status == 0,
+        }
+
+    def summary(self):
+        if not self.samples:
+            return "Forecast: no samples yet"
+        result = self.forecast()
+        return (f"Card full in: [{self._days(result['storage_days'])}] "
+                f"- Battery critical in: [{self._days(result['battery_days'])}]"
+                + (" - SD CARD PROBLEM" if result["sd_ok"] is False else ""))
+
+    def alerts(self):
+        """Returns the alert messages for thresholds we just crossed. Each one fires once, until it clears again."""
+        if not self.samples:
+            return []
+        result = self.forecast()
+        checks = {
+            "storage": (result["storage_days"] is not None
+                        and result["storage_days"] < self.forecast_config.get("min_days_storage", 7),
+                        f"SD card will be full in {self._days(result['storage_days'])}."),
+            "battery": (result["battery_days"] is not None
+                        and result["battery_days"] < self.forecast_config.get("min_days_battery", 2),
+                        f"GoPro battery will be critical in {self._days(result['battery_days'])}."),
+            "sd_card": (result["sd_ok"] is False, "GoPro reports a problem with the SD card."),
+        }
+        messages = []
+        for name, (crossed, message) in checks.items():
+            if crossed and not self.alerted.get(name):
+                messages.append(message)
+            self.alerted[name] = crossed
+        self._save()
+        return messages
+
+    @staticmethod
+    def days_until(samples, key, floor, refill_jump=0):
+        """
+        Least squares line through the samples since the last refill (card swap, battery charge..),
+        then the days until it hits `floor`. None if the value isn't going down.
+        """
+        points = [(s["at"], s[key]) for s in samples if s.get(key) is not None]
+        # Anything before the last jump up by more than `refill_jump` belongs to the previous card/battery
+        for i in range(len(points) - 1, 0, -1):
+            if points[i][1] - points[i - 1][1] > refill_jump:
+                points = points[i:]
+                break
+        if len(points) < 2:
+            return None
+
+        n = len(points)
+        mean_t = sum(t for t, _ in points) / n
+        mean_v = sum(v for _, v in points) / n
+        spread = sum((t - mean_t) ** 2 for t, _ in points)
+        if spread == 0:
+            return None
+        slope = sum((t - mean_t) * (v - mean_v) for t, v in points) / spread
+        if slope >= 0:
+            return None
+
+        latest_t, latest_v = points[-1]
+        fitted_now = mean_v + slope * (latest_t - mean_t)
+        return max(0.0, (fitted_now - floor) / -slope / SECONDS_PER_DAY)
+
+    @staticmethod
+    def _days(days):
+        return "no trend" if days is None else f"{days:.1f} days"
+
+    def _save(self):
+        save_json(self.samples_path, {"samples": self.samples, "alerted": self.alerted})
+
+forecaster = Forecaster()
@@ -1,11 +1,21 @@
 #!/usr/bin/env python3
 
+import os
+import signal
+import subprocess
 import time
+import datetime
 import lib.wifi as wifi
 import lib.config as config
+import lib.clock as clock
+import lib.forecast as forecast
+import lib.session as session
+import lib.network as network
+import lib.plan as capture_plan
+from lib.deadline import Deadline, DeadlineExceeded
 from lib.logger import logger
 
-from goprocam import GoProCamera, constants
+from goprocam import constants
 
 
 class GoPro:
@@ -13,44 +23,346 @@ class GoPro:
     def __init__(self):
         self.wifi = wifi.wifi
         self.config = config.global_config
+        self.session = session.camera_session
+        self.network = network.network
 
         self.gopro_config = self.config.gopro_config
-        self.photo_capture_error_counter = config.global_config.photo_capture_error_counter
+        self.preview_config = self.config.preview_config
+        self.lapse_config = self.config.lapse_config
+        self.waits_config = self.config.waits_config
+        self.last_capture = {}
+        self.last_shutter_at = None
+        self.last_frames = []
+        self.last_plan = "single"
+        self.ev_reset_pending = False
+        # "light", "done", "aborted" or "folded" (camera left awake for the photo)
+        self.last_keep_alive = None
 
-    def take_photo(self):
+    def take_photo(self, deadline=None):
+        """
+        Wake, photo mode, shutter, sleep. Every step waits on what the camera reports (ready, mode, not busy,
+        one more photo on the card), never on a fixed sleep. The actual waits end up in self.last_capture.
+        Every wait and request is clamped to `deadline` (lib.deadline), running out of it is a failed capture.
+        """
+        start = time.monotonic()
+        deadline = deadline or Deadline(name="take_photo")
+        self.session.waits = {}
+        self.last_shutter_at = None
+        self.last_frames = []
+        with self.session.within(deadline):
+            try:
+                gopro = self.session.wake()
+                if gopro is None:
+                    # a slot missed, and counted as a capture error so a camera that never wakes gets escalated
+                    raise ConnectionError("GoPro not ready after WOL.")
+
+                logger.info("Setting camera to photo mode..")
+                # Same as goprocam's take_photo did for the HERO5: single photo sub mode
+                status = (self.session.set_mode(constants.Mode.PhotoMode, constants.Mode.SubMode.Photo.Single_H5)
+                          or self.session.probe() or {})
+                photos_before = status.get(constants.Status.STATUS.PhotosTaken)
+
+                # One frame, unless we're in a burst / bracket window. All frames come out of this single wake.
+                plan, ev_values = self.frame_plan(datetime.datetime.now())
+                self.last_plan = plan
+                self.last_frames = []
+                if self.ev_reset_pending:
+                    # didn't go through last time, and this frame would be shot at the old bracket's EV
+                    self._reset_ev(gopro)
+                current_ev = None
+                taken = None
+                try:
+                    for index, ev in enumerate(ev_values):
+                        if ev is not None and ev != current_ev:
+                            # Camera takes settings as soon as it's not busy, so this goes right after the previous frame
+                            gopro.gpControlSet(constants.Photo.EVCOMP, self.ev_option(ev))
+                            current_ev = ev
+
+                        logger.info("Taking photo now.." if index == 0 else f"Taking photo now.. frame {index + 1}/{len(ev_values)}")
+                        gopro.shutter(constants.start)
+                        shutter_at = datetime.datetime.now()
+                        if index == 0:
+                            self.last_shutter_at = shutter_at
+                        label = "capture" if index == 0 else f"capture_{index + 1}"
+                        try:
+                            saved = self.session.wait_until(
+                                label, lambda: self._photo_saved(photos_before), self.waits_config.get("capture", 8))
+                        except DeadlineExceeded:
+                            if index == 0:
+                                raise
+                            saved = None  # we have the first frame, the rest of the burst just didn't fit
+                        self.last_frames.append({"ev": ev, "at": shutter_at.isoformat(timespec="milliseconds"), "saved": bool(saved)})
+                        if saved is None:
+                            if index == 0:
+                                raise TimeoutError("GoPro didn't save the photo in time.")
+                            logger.warning(f"Frame {index + 1} of the {plan} wasn't confirmed. Skipping the rest.")
+                            break
+                        status = saved
+                        taken = (shutter_at, datetime.datetime.now())
+                        photos_before = status.get(constants.Status.STATUS.PhotosTaken)
+                finally:
+                    # Also when a frame failed: every later single frame would be shot at the bracket's EV
+                    if current_ev not in (None, 0):
+                        self._reset_ev(gopro)
+
+                # The camera is awake anyway, so the status we just got feeds the clock check and the forecast
+                try:
+                    forecast.forecaster.sample(status)
+                    clock.camera_clock.check(gopro, status, taken)
+                except Exception as e:
+                    logger.error(f"Error checking the GoPro status: {e}")
+
+                # The photo is in, powering off isn't part of the capture budget
+                with self.session.within(None):
+                    self.session.sleep()
+
+            except DeadlineExceeded:
+                # the slot ran out, that's not the camera's fault: keep the connection, the caller decides
+                raise
+            except Exception as e:
+                self.session.mark_failed(e)
+                raise e
+            finally:
+                self.last_capture = dict(self.session.waits, total=round(time.monotonic() - start, 2))
+                logger.info(f"Capture cycle took {self.last_capture['total']}s. Waits: {self.session.waits}")
+                deadline.log()
+
+    def _reset_ev(self, gopro):
+        # Outside the capture's deadline: a frame that ran out of it is exactly when this has to go through
         try:
-            logger.info("Waking up the GoPro with magic package.")
-            self.wifi.send_wol(self.gopro_config["mac"])
-            time.sleep(3)  # short sleep to let the packet settle
-            self.wifi.send_wol(self.gopro_config["mac"])
+            with self.session.within(None):
+                gopro.gpControlSet(constants.Photo.EVCOMP, constants.Photo.EvComp.Zero)
+            self.ev_reset_pending = False
+        except Exception as e:
+            logger.error(f"Could not reset the EV compensation, trying again next capture: {e}")
+            self.ev_reset_pending = True
 
-            if not self.wifi.check_network_reachable(self.gopro_config["ip"]):
-                logger.error("GoPro not reachable even after sending WOL. Possibly off already. But why?!")
-                return
+    def frame_plan(self, now):
+        """
+        Which capture mode applies right now, from the capture_windows in config.json.
+        Returns (mode, ev values), one ev value per frame. None means "leave EV alone".
+        """
+        return capture_plan.frame_plan(self.config.capture_windows, now)
 
-            self.wifi.check_network_reachable(self.gopro_config["ip"])
-            logger.info("Connecting to GoPro camera..")
+    @staticmethod
+    def ev_option(ev):
+        # gpControl wants an option index: +2.0 is "0", 0 is "4", -2.0 is "8", in 0.5 steps
+        if not -2 <= ev <= 2 or (ev * 2) != int(ev * 2):
+            raise ValueError(f"EV compensation must be between -2 and +2, in 0.5 steps. Got {ev}.")
+        return str(int(4 - ev * 2))
 
-            gopro = GoProCamera.GoPro(self.gopro_config["ip"])
-            logger.info(f"Connected to GoPro. {gopro}")
-            gopro.power_on()
+    def _photo_saved(self, photos_before):
+        # Not busy anymore and the photo counter moved. If we don't know the counter, not busy has to do.
+        status = self.session.probe()
+        if not status or status.get(constants.Status.STATUS.IsBusy) != 0:
+            return None
+        photos_now = status.get(constants.Status.STATUS.PhotosTaken)
+        if photos_before is not None and photos_now is not None and photos_now <= photos_before:
+            return None
+        return status
 
-            logger.info("Setting camera to photo mode..")
-            gopro.mode(constants.Mode.PhotoMode)
-            time.sleep(2)
+    def keep_alive(self, deadline=None):
+        """
+        Wakes the camera and puts it back to sleep, so its Wi-Fi doesn't fall asleep for good.
+        `deadline` (lib.deadline) runs out when the next photo has to start. It caps the Wi-Fi switch, every wait and
+        every request, and we look at it between steps: before the camera is up we just stop, once it's awake we
+        leave it on and the photo takes it from there (folded into the capture).
+        Mostly it doesn't come to that: the light tier just pokes the camera's Wi-Fi, and only if that gets no answer
+        (or the last full cycle is long ago) we do the whole wake and power off.
+        The caller gets us on the GoPro Wi-Fi first (NetworkPlanner.switch_for), we only look at where that left us.
+        Returns False only if we aren't on the GoPro Wi-Fi. A camera that doesn't wake is the next photo's problem:
+        take_photo raises on it, and that's counted.
+        """
+        logger.info("Attempting to keep GoPro Wi-Fi alive..")
+        self.last_keep_alive = None
+        deadline = deadline or Deadline(name="keep_alive")
+        if self.network.on != "gopro":
+            logger.warning("Cannot keep alive because we're not on the GoPro Wi-Fi.")
+            return False
 
-            logger.info("Taking photo now..")
-            gopro.take_photo()
-            time.sleep(5)
+        controller = self.session.keep_alive
+        start = time.monotonic()
+        if controller.tier() == "light":
+            ok = self.session.nudge()
+            controller.ran("light", time.monotonic() - start, ok=ok)
+            if ok:
+                self.last_keep_alive = "light"
+                logger.info("Light keep-alive answered. Camera stays asleep.")
+                return True
+            logger.info("Light keep-alive got no answer. Doing the full cycle.")
+            start = time.monotonic()
 
-            logger.info("Shutting down GoPro..")
-            gopro.power_off()
-            time.sleep(3)
+        self.session.last_awake = 0.0
+        try:
+            with self.session.within(deadline):
+                self._heavy_keep_alive(deadline)
+        finally:
+            controller.ran("heavy", time.monotonic() - start, self.session.last_awake, ok=self.last_keep_alive == "done")
+            deadline.log()
+        return True
+
+    def _heavy_keep_alive(self, deadline):
+        # WOL, photo mode, power off. Checks the deadline between steps, and the session clamps every wait to it.
+        awake = False
+        try:
+            if self._preempted(deadline, "wake"):
+                return
+            if self.session.wake() is None:
+                return
+            awake = True
+            if self._preempted(deadline, "mode", folded=True):
+                return
+            self.session.set_mode(constants.Mode.PhotoMode)
+        except DeadlineExceeded as e:
+            # the photo is due, that's not the camera's fault
+            self._preempted(deadline, e.step, folded=awake, exceeded=True)
+            return
+        except Exception as e:
+            logger.error(f"Error controlling GoPro in keep_alive: {e}")
+            self.session.mark_failed(e)
+            return
 
+        try:
+            if self._preempted(deadline, "sleep", folded=True):
+                return
+            logger.info("Coolio. Going back to sleep for now.. Still in WAITING.")
+            # checked just above, and once the power off is sent there's nothing left to hand over to the photo
+            with self.session.within(None):
+                self.session.sleep()
         except Exception as e:
-            self.photo_capture_error_counter += 1
+            logger.error(f"Error powering off GoPro in keep_alive: {e}")
+            self.session.mark_failed(e)
+            return
+        self.last_keep_alive = "done"
+        logger.info("keep_alive sequence completed.")
+
+    def _preempted(self, deadline, step, folded=False, exceeded=False):
+        # A couple of seconds of margin, the next step is never instant. `exceeded`: a step already ran into it.
+        margin = self.config.scheduler_config.get("preempt_margin_seconds", 2)
+        if not exceeded and deadline.remaining() > margin:
+            return False
+        self.config.keep_alive_preemptions += 1
+        self.last_keep_alive = "folded" if folded else "aborted"
+        logger.warning(f"Keep-alive preempted before {step}, the next photo is due. "
+                       + ("Leaving the camera awake for it." if folded else "Stopping here."))
+        return True
+
+    def supervise_lapse(self):
+        """
+        In-camera engine: the GoPro shoots the time-lapse (or night-lapse) by itself, so all we do is one
+        status request to check on it. If it's not recording anymore, we configure it and start it again.
+        Returns the status values we looked at.
+        """
+        if not self.wifi.check_network_reachable(self.gopro_config["ip"], retries=2, delay=2):
+            raise ConnectionError("GoPro not reachable for lapse supervision.")
+
+        try:
+            status = self.session.status()
+            if not status:
+                raise ConnectionError("GoPro returned no status during lapse supervision.")
+
+            forecast.forecaster.sample(status)
+            # Not IsRecording: that's status 8, busy. A camera that's just saving a file would look like it's recording.
+            recording = status.get(constants.Status.STATUS.IsEncoding) == 1
+            rem_photos = status.get(constants.Status.STATUS.RemPhotos)
+            battery = status.get(constants.Status.STATUS.BattPercent)
+            logger.info(f"Lapse supervised. Recording: [{recording}], photos left: [{rem_photos}], battery: [{battery}%]")
+
+            if battery is not None and battery <= self.lapse_config.get("min_battery_percent", 10):
+                logger.warning(f"GoPro battery is at {battery}%. The lapse won't last much longer.")
+
+            if not recording:
+                if rem_photos == 0:
+                    raise RuntimeError("Lapse stopped and the SD card is full. Can't restart it.")
+                logger.warning("Lapse is not recording anymore. Restarting it.")
+                self.start_lapse(self.session.connect())
+                self.config.lapse_restart_counter += 1
+            return status
+        except ConnectionError as e:
+            self.session.mark_failed(e)
             raise e
 
+    def start_lapse(self, gopro):
+        """Puts the camera in time-lapse / night-lapse photo mode with the configured interval and presses the shutter."""
+        lapse = self.lapse_config.get("lapse", "nightlapse")
+        interval = str(self.lapse_config.get("interval", "60"))
+
+        if lapse == "nightlapse":
+            gopro.mode(constants.Mode.MultiShotMode, constants.Mode.SubMode.MultiShot.NightLapse)
+            gopro.gpControlSet(constants.Multishot.NIGHT_LAPSE_INTERVAL, interval)
+        else:
+            gopro.mode(constants.Mode.MultiShotMode, constants.Mode.SubMode.MultiShot.TimeLapse)
+            gopro.gpControlSet(constants.Multishot.TIMELAPSE_INTERVAL, interval)
+        time.sleep(2)
+
+        gopro.shutter(constants.start)
+        logger.info(f"In-camera {lapse} started, every {interval} seconds.")
+
+    def grab_preview(self, budget_seconds=None):
+        """
+        Grabs a single keyframe from the live preview (UDP 8554, MPEG-TS) and returns it as JPEG bytes,
+        or None if nothing was decoded within the budget. The budget starts before we connect, so detection and
+        starting the stream count too. The stream is always stopped and ffmpeg is always reaped, even when the
+        budget runs out. Expects the camera to be awake already.
+        """
+        budget = self.preview_config.get("budget_seconds", 8) if budget_seconds is None else budget_seconds
+        deadline = Deadline(budget, name="preview")
+        gopro = None
+        ffmpeg = None
+        try:
+            logger.info(f"Grabbing one preview frame. Budget is {budget} seconds.")
+            with self.session.within(deadline):
+                gopro = self.session.connect()
+                gopro.livestream("start")
+            # -skip_frame nokey makes the decoder drop everything until the first keyframe
+            ffmpeg = subprocess.Popen(
+                [self.preview_config.get("ffmpeg", "ffmpeg"), "-hide_banner", "-loglevel", "error",
+                 "-skip_frame", "nokey", "-f", "mpegts", "-i", "udp://:8554",
+                 "-frames:v", "1", "-f", "image2pipe", "-vcodec", "mjpeg", "pipe:1"],
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, start_new_session=True)
+
+            while True:
+                remaining = deadline.remaining()
+                if remaining <= 0:
+                    logger.warning("No preview frame decoded within budget. Giving up.")
+                    return None
+                # The camera stops streaming if it doesn't hear from us every ~2.5 seconds
+                gopro.sendKeepAlive()
+                try:
+                    frame, _ = ffmpeg.communicate(timeout=min(2.0, remaining))
+                except subprocess.TimeoutExpired:
+                    continue
+                if ffmpeg.returncode == 0 and frame:
+                    logger.info(f"Preview frame grabbed ({len(frame)} bytes) in {budget - deadline.remaining():.1f} seconds.")
+                    return frame
+                logger.error(f"ffmpeg exited with {ffmpeg.returncode} and no frame.")
+                return None
+        except DeadlineExceeded as e:
+            logger.warning(f"No preview frame: {e}")
+            return None
+        finally:
+            self._reap(ffmpeg)
+            if gopro is not None:
+                try:
+                    gopro.livestream("stop")
+                except Exception as e:
+                    logger.error(f"Error stopping the preview stream: {e}")
+
+    @staticmethod
+    def _reap(process):
+        # ffmpeg runs in its own session, so killing the group leaves nothing behind
+        if process is None or process.poll() is not None:
+            return
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        process.wait()
+
+    def list_media(self):
+        """What's on the card, as the camera's media list (JSON string). Expects the camera to be awake."""
+        return self.session.connect().listMedia()
+
     def take_video(self):
         pass
 
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+# keep_alive.minutes was tuned by hand, because the camera's Wi-Fi goes to sleep after "around 4 or 5" minutes.
+# This learns how long the camera can really be left alone: every wake tells us how long it had been idle and
+# whether it still answered. The spacing between keep-alives creeps up after a run of good wakes (never past
+# the shortest idle time that failed, minus a margin) and is halved after any failure.
+# Most keep-alives don't need the full wake/power off cycle either: the light tier just pokes the camera's Wi-Fi,
+# and the heavy cycle only runs when that gets no answer, or every heavy_every_minutes.
+
+import os
+import datetime
+import lib.config as config
+
+from lib.logger import logger
+from lib.utilities import load_json, save_json
+
+# No spacing goes past this, whatever max_seconds says: the camera's Wi-Fi sleeps after "around 4 or 5" minutes,
+# so 240 s at the low end, less 8 s for the slowest wake and 20 s a keep-alive may run late (keep_alive_late_seconds).
+SAFE_MAX_SECONDS = 210
+
+
+class KeepAliveController:
+
+    def __init__(self):
+        self.config = config.global_config
+        self.adaptive_config = self.config.keep_alive_config.get("adaptive", {})
+        self.light_config = self.config.keep_alive_config.get("light", {})
+        self.learned_path = os.path.join(self.config.data_path, "keep_alive.json")
+        saved = load_json(self.learned_path, {})
+        self.streak = saved.get("streak", 0)                  # good wakes in a row since the last change
+        self.failed_gaps = saved.get("failed_gaps", [])       # idle seconds after which a wake failed, most recent last
+        # what an older, wider max_seconds let it learn doesn't count
+        self.spacing = min(saved.get("spacing", self.adaptive_config.get("initial_seconds", 180)), self.limit())
+        self.longest_ok = saved.get("longest_ok", 0)
+        # The keep-alives that ran: when, which tier, seconds of radio time and seconds the camera was awake
+        self.runs = [r if isinstance(r, dict) else {"at": r, "tier": "heavy"} for r in saved.get("runs", [])]
+        self.last_full_wake = None  # photo or heavy keep-alive, both do the whole WOL wake
+        self.light_failed = False
+        # Last time the camera answered (photo, keep-alive..). Not saved: after a restart we don't trust it.
+        self.last_contact = None
+
+    @property
+    def enabled(self):
+        return bool(self.adaptive_config.get("enabled"))
+
+    def contact(self, at=None):
+        self.last_contact = at or datetime.datetime.now()
+
+    def woke(self, at=None):
+        self.last_full_wake = at or datetime.datetime.now()
+        self.light_failed = False
+
+    def observe(self, idle_seconds, ok):
+        """One wake: how long the camera had been left alone and whether it woke up."""
+        if idle_seconds is None:
+            return
+        if ok:
+            self.longest_ok = max(self.longest_ok, round(idle_seconds, 1))
+            # Longer gaps only get tested once keep-alives are dropped, so any good wake counts towards stretching
+            self.streak += 1
+            if self.streak >= self.adaptive_config.get("successes_to_stretch", 5):
+                self.streak = 0
+                self.spacing = min(self.spacing + self.adaptive_config.get("step_seconds", 30), self.limit())
+                logger.info(f"Keep-alive spacing stretched to {self.spacing:.0f}s.")
+        else:
+            self.streak = 0
+            self.failed_gaps = (self.failed_gaps + [round(idle_seconds, 1)])[-20:]
+            self.spacing = max(self.adaptive_config.get("min_seconds", 120), self.spacing / 2)
+            logger.warning(f"Wake failed after {idle_seconds:.0f}s idle. Keep-alive spacing backed off to {self.spacing:.0f}s.")
+        self._save()
+
+    def limit(self):
+        """
+        The longest spacing we'd try: under the shortest idle time that ever failed, under max_seconds and never past
+        SAFE_MAX_SECONDS.
+        """
+        limit = min(self.adaptive_config.get("max_seconds", SAFE_MAX_SECONDS), SAFE_MAX_SECONDS)
+        if self.failed_gaps:
+            limit = min(limit, min(self.failed_gaps) - self.adaptive_config.get("margin_seconds", 60))
+        return max(self.adaptive_config.get("min_seconds", 120), limit)
+
+    def needed(self, contact, next_contact):
+        """
+        Whether a keep-alive is needed, given the last contact before it and the next photo/keep-alive after it.
+        If the next one still comes within the learned spacing, this one can go.
+        """
+        if not self.enabled or contact is None or next_contact is None:
+            return True
+        return (next_contact - contact).total_seconds() > self.spacing
+
+    def tier(self, now=None):
+        """"light" or "heavy" for the keep-alive that's about to run."""
+        now = now or datetime.datetime.now()
+        if not self.light_config.get("enabled") or self.light_failed or self.last_full_wake is None:
+            return "heavy"
+        if now - self.last_full_wake >= datetime.timedelta(minutes=self.light_config.get("heavy_every_minutes", 30)):
+            return "heavy"
+        return "light"
+
+    def ran(self, tier, radio_seconds, awake_seconds=0.0, ok=True, at=None):
+        """Records one keep-alive. A light one that got no answer makes the next one heavy, until a full wake works."""
+        at = at or datetime.datetime.now()
+        if tier == "light" and not ok:
+            self.light_failed = True
+        since = (at - datetime.timedelta(days=1)).isoformat()
+        self.runs = [r for r in self.runs if r["at"] >= since]
+        self.runs.append({"at": at.isoformat(timespec="seconds"), "tier": tier, "ok": ok,
+                          "radio": round(radio_seconds, 2), "awake": round(awake_seconds, 2)})
+        self._save()
+
+    def report(self, planned_per_day):
+        """
+        Keep-alives per hour (light/heavy), radio and camera-awake seconds per hour over the last day,
+        next to what the same keep-alives would have cost as heavy cycles, and how many the learned spacing saved.
+        """
+        since = (datetime.datetime.now() - datetime.timedelta(days=1)).isoformat()
+        runs = [r for r in self.runs if r["at"] >= since]
+        heavy = [r for r in runs if r["tier"] == "heavy" and "radio" in r]
+        light = sum(1 for r in runs if r["tier"] == "light")
+        radio = sum(r.get("radio", 0) for r in runs)
+        awake = sum(r.get("awake", 0) for r in runs)
+        line = (f"Keep-alive: {len(runs) / 24:.1f}/h ({light / 24:.1f} light), "
+                f"radio {radio / 24:.0f}s/h, camera awake {awake / 24:.0f}s/h")
+        if heavy:
+            # before the light tier every one of them was a heavy cycle
+            per_heavy_radio = sum(r["radio"] for r in heavy) / len(heavy)
+            per_heavy_awake = sum(r["awake"] for r in heavy) / len(heavy)
+            line += (f" (all heavy: {per_heavy_radio * len(runs) / 24:.0f}s/h, "
+                     f"{per_heavy_awake * len(runs) / 24:.0f}s/h)")
+        if self.enabled:
+            line += (f" - every {self.spacing / 60:.1f} min, "
+                     f"{max(0, planned_per_day - len(runs)) / 24:.1f}/h saved")
+        return line
+
+    def _save(self):
+        save_json(self.learned_path, {
+            "spacing": self.spacing,
+            "streak": self.streak,
+            "failed_gaps": self.failed_gaps,
+            "longest_ok": self.longest_ok,
+            "runs": self.runs,
+        })
+
+controller = KeepAliveController()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+# The handlers in lib/state say what happened (an event), this table says where we go from there.
+# Every transition is timestamped, and we keep how long we stayed in each state, so "how long were we
+# OFFLINE_ALERT yesterday" or "p95 of TAKE_PHOTO" is a look at state_metrics.json instead of grepping logs.
+
+import os
+import math
+import time
+import datetime
+import lib.config as config
+
+from lib.logger import logger
+from lib.utilities import load_json, save_json
+
+# (state, event) -> next state. "*" matches any state.
+TRANSITIONS = {
+    ("WAITING", "photo_due"): "TAKE_PHOTO",
+    ("WAITING", "update_due"): "SEND_UPDATE",
+    ("WAITING", "offline"): "OFFLINE_ALERT",
+    ("TAKE_PHOTO", "done"): "WAITING",
+    ("TAKE_PHOTO", "failed"): "ERROR",
+    ("TAKE_PHOTO", "offline"): "OFFLINE_ALERT",
+    ("SEND_UPDATE", "done"): "WAITING",
+    ("SEND_UPDATE", "failed"): "ERROR",
+    ("ERROR", "retry"): "WAITING",
+    ("ERROR", "give_up"): "OFFLINE_ALERT",
+    ("OFFLINE_ALERT", "online"): "WAITING",
+    ("*", "crash"): "ERROR",
+}
+
+# Which State method runs in which state
+HANDLERS = {
+    "WAITING": "handle_waiting",
+    "TAKE_PHOTO": "handle_taking_photo",
+    "SEND_UPDATE": "handle_sending_update",
+    "ERROR": "handle_errors",
+    "OFFLINE_ALERT": "handle_being_offline",
+}
+
+# Upper bounds (seconds) of the dwell-time histogram buckets. Anything longer goes in the last one.
+BUCKETS = [1, 2, 5, 10, 20, 30, 60, 120, 300, 600, 1800, 3600]
+
+
+class StateMachine:
+
+    def __init__(self):
+        self.config = config.global_config
+        self.machine_config = self.config.machine_config
+        self.metrics_path = os.path.join(self.config.data_path, "state_metrics.json")
+        saved = load_json(self.metrics_path, {})
+        self.counts = saved.get("transitions", {})        # "WAITING -> TAKE_PHOTO": 123
+        self.histograms = saved.get("histograms", {})     # state: count per bucket, one extra for > last bucket
+        self.samples = saved.get("samples", {})           # state: the most recent dwell times, for percentiles
+        self.daily = saved.get("daily_seconds", {})       # "2025-03-21": {state: seconds}
+        self.history = saved.get("history", [])           # the last transitions, timestamped
+        self.entered_at = datetime.datetime.now()
+        self.entered_monotonic = time.monotonic()
+
+    def handler(self, state_handler):
+        """The State method for the current state. An unknown state goes straight to ERROR."""
+        name = HANDLERS.get(self.config.state)
+        if name is None:
+            logger.error(f"Unknown state: {self.config.state}. Forcing ERROR.")
+            self.fire("crash")
+            name = HANDLERS[self.config.state]
+        return getattr(state_handler, name)
+
+    def next_state(self, state, event):
+        return TRANSITIONS.get((state, event)) or TRANSITIONS.get(("*", event))
+
+    def fire(self, event):
+        """
+        Moves on according to the table. No event (None) means we stay where we are.
+        An event the table doesn't know for this state is a bug, and goes to ERROR.
+        """
+        if event is None:
+            return self.config.state
+
+        state = self.config.state
+        target = self.next_state(state, event)
+        if target is None:
+            logger.error(f"No transition for [{event}] in [{state}]. Forcing ERROR.")
+            event, target = "crash", "ERROR"
+
+        now = datetime.datetime.now()
+        dwell = time.monotonic() - self.entered_monotonic
+        self._record(state, event, target, now, dwell)
+        logger.info(f"{state} -> {target} on [{event}] after {dwell:.1f}s.")
+
+        self.config.state = target
+        self.entered_at = now
+        self.entered_monotonic = time.monotonic()
+        return target
+
+    def _record(self, state, event, target, now, dwell):
+        key = f"{state} -> {target}"
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+        histogram = self.histograms.setdefault(state, [0] * (len(BUCKETS) + 1))
+        histogram[self.bucket(dwell)] += 1
+
+        samples = self.samples.setdefault(state, [])
+        samples.append(round(dwell, 2))
+        del samples[:-self.machine_config.get("dwell_samples", 500)]
+
+        # Split the dwell over the days it covers, so a night in OFFLINE_ALERT counts for both days
+        start = now - datetime.timedelta(seconds=dwell)
+        while start < now:
+            midnight = datetime.datetime.combine(start.date() + datetime.timedelta(days=1), datetime.time())
+            end = min(midnight, now)
+            day = self.daily.setdefault(start.date().isoformat(), {})
+            day[state] = round(day.get(state, 0) + (end - start).total_seconds(), 2)
+            start = end
+        for old in sorted(self.daily)[:-self.machine_config.get("dwell_days", 30)]:
+            del self.daily[old]
+
+        self.history.append({"at": now.isoformat(timespec="milliseconds"), "from": state,
+                             "event": event, "to": target, "dwell": round(dwell, 2)})
+        del self.history[:-self.machine_config.get("history", 50)]
+        self._save()
+
+    @staticmethod
+    def bucket(seconds):
+        for index, upper in enumerate(BUCKETS):
+            if seconds <= upper:
+                return index
+        return len(BUCKETS)
+
+    def percentile(self, state, p):
+        """p-th percentile (0-100) of the recent dwell times in `state`. None if we never left it."""
+        samples = sorted(self.samples.get(state, []))
+        if not samples:
+            return None
+        # nearest rank
+        index = min(len(samples) - 1, max(0, math.ceil(p / 100 * len(samples)) - 1))
+        return samples[index]
+
+    def seconds_on(self, day, state):
+        return self.daily.get(day.isoformat(), {}).get(state, 0)
+
+    def report(self):
+        """One line for the status push: yesterday's time in the bad states and how long photos take."""
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        p95 = self.percentile("TAKE_PHOTO", 95)
+        return (f"States: yesterday {self.seconds_on(yesterday, 'ERROR'):.0f}s in ERROR, "
+                f"{self.seconds_on(yesterday, 'OFFLINE_ALERT'):.0f}s in OFFLINE_ALERT - "
+                f"TAKE_PHOTO p95 {'-' if p95 is None else f'{p95:.1f}s'}")
+
+    def _save(self):
+        save_json(self.metrics_path, {
+            "transitions": self.counts,
+            "histograms": self.histograms,
+            "buckets": BUCKETS,
+            "samples": self.samples,
+            "daily_seconds": self.daily,
+            "history": self.history,
+        })
+
+machine = StateMachine()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+# Every SSID change goes through here. Photos and keep-alives need the GoPro Wi-Fi, update windows need the
+# router, and each switch costs 5+ seconds of settling. The hour's actions tell us the fewest switches that
+# get every one of them on the right network, so we only switch where that plan switches, we don't go to the
+# router when we can't be back for the camera in time (but never skip more than a few windows in a row), and we
+# count what it cost.
+
+import os
+import datetime
+import collections
+import lib.config as config
+import lib.wifi as wifi
+import lib.scheduler as scheduler
+import lib.keepalive as keepalive
+
+from lib.logger import logger
+from lib.utilities import load_json, save_json
+
+# What each kind of action needs
+NEEDS = {"photo": "gopro", "keep_alive": "gopro", "send_update": "router"}
+
+Switch = collections.namedtuple("Switch", ["at", "network", "reason"])
+
+
+def plan_switches(actions, current):
+    """
+    The fewest switches that put every action on its network: one at each place where the needed network
+    changes, timed for the action that needs it. `current` is the network we're on now ("gopro"/"router"/None).
+    """
+    switches = []
+    for action in actions:
+        needed = NEEDS[action.kind]
+        if needed != current:
+            switches.append(Switch(action.at, needed, action.kind))
+            current = needed
+    return switches
+
+
+class NetworkPlanner:
+
+    def __init__(self, action_planner):
+        self.config = config.global_config
+        self.wifi = wifi.wifi
+        self.action_planner = action_planner
+        self.scheduler_config = self.config.scheduler_config
+        self.metrics_path = os.path.join(self.config.data_path, "network.json")
+        saved = load_json(self.metrics_path, {})
+        self.switches = saved.get("switches", [])      # {"at", "to", "ok", "seconds"}, last day
+        self.off_gopro = saved.get("off_gopro", [])    # [left, back] ISO pairs, last day
+        self.skipped_windows = saved.get("skipped_windows", 0)  # router windows skipped in a row, see skip_window()
+        self.unplanned = 0  # switches the hour plan didn't have, since start
+        self.left_gopro_at = None
+        self.last_plan = None
+        self.on = None  # the network we were on last time we looked, so planning doesn't need nmcli
+
+    def ssid(self, network):
+        return self.config.gopro_config["ssid"] if network == "gopro" else self.config.router_config["ssid"]
+
+    def current(self):
+        ssid = (self.wifi.get_current_wifi() or "").lower()
+        self.on = next((n for n in ("gopro", "router") if ssid == self.ssid(n).lower()), None)
+        return self.on
+
+    def hour_plan(self, now):
+        """The switches for the next hour, from the planned actions. Logged whenever it changes."""
+        horizon = now + datetime.timedelta(hours=1)
+        actions = [a for a in self.action_planner.upcoming(now, count=60) if a.at < horizon]
+        switches = plan_switches(actions, self.on)
+        if switches != self.last_plan:
+            self.last_plan = switches
+            logger.info("Wi-Fi plan for the hour: "
+                        + (", ".join(f"{s.network} at {s.at:%H:%M:%S} ({s.reason})" for s in switches) or "no switches"))
+        return switches
+
+    def switch_for(self, action, deadline=None):
+        """
+        Puts us on the network `action` needs, where the hour plan says to switch. Where the plan has no switch
+        we're on that network already and nothing runs, not even iwgetid. Only a plan made on the wrong idea of
+        where we are (a dropped Wi-Fi, a failed switch) leads to a switch it doesn't have, and that's counted.
+        """
+        needed = NEEDS[action.kind]
+        planned = any(s.at == action.at and s.network == needed for s in self.last_plan or [])
+        if not planned:
+            if self.on == needed:
+                return True
+            self.unplanned += 1
+            logger.warning(f"{action.kind} at {action.at:%H:%M:%S} needs the {needed} Wi-Fi, the plan had no switch "
+                           f"for it. Unplanned switch #{self.unplanned}.")
+        return self.ensure(needed, deadline)
+
+    def skip_window(self, now=None):
+        """
+        Whether to skip the router window now because it doesn't fit (window_fits). Never more than
+        update_window.max_skipped in a row: the one after goes anyway, however short, so the clock and the
+        status push don't stop for good when the plan leaves them no room.
+        """
+        if self.window_fits(now):
+            return False
+        self.skipped_windows += 1
+        self._save()
+        if self.skipped_windows <= self.config.update_window_config.get("max_skipped", 2):
+            logger.warning(f"Not enough time for the update window before the next photo/keep-alive. Skipping it "
+                           f"({self.skipped_windows} in a row).")
+            return True
+        logger.warning(f"{self.skipped_windows - 1} update windows skipped in a row. Going anyway, "
+                       f"the next photo/keep-alive may start late.")
+        return False
+
+    def window_done(self):
+        self.skipped_windows = 0
+        self._save()
+
+    def window_fits(self, now=None):
+        """
+        Whether a router window started now is back on the GoPro Wi-Fi before the next photo/keep-alive.
+        Two switches and the window itself have to fit, otherwise we skip it instead of bouncing between SSIDs.
+        """
+        now = now or datetime.datetime.now()
+        camera_next = next((a for a in self.action_planner.upcoming(now, count=10)
+                            if NEEDS[a.kind] == "gopro" and a.at > now), None)
+        if camera_next is None:
+            return True
+        needed = 2 * self.switch_seconds() + self.scheduler_config.get("durations", {}).get("send_update", 90)
+        return (camera_next.at - now).total_seconds() >= needed
+
+    def window_budget(self, now=None):
+        """
+        How long the router window may take from now, on the router already: until we have to head back for the
+        next photo/keep-alive, never longer than the camera can be left alone, and at most update_window.budget_seconds.
+        """
+        now = now or datetime.datetime.now()
+        budget = self.config.update_window_config.get("budget_seconds", 60)
+        # one switch back to the GoPro still has to fit
+        budget = min(budget, keepalive.controller.limit() - self.switch_seconds())
+        camera_next = next((a for a in self.action_planner.upcoming(now, count=10)
+                            if NEEDS[a.kind] == "gopro" and a.at > now), None)
+        if camera_next is not None:
+            budget = min(budget, (camera_next.at - now).total_seconds() - self.switch_seconds())
+        if self.skipped_windows > self.config.update_window_config.get("max_skipped", 2):
+            # a window skip_window() wouldn't skip again still gets this much
+            return max(budget, self.config.update_window_config.get("forced_budget_seconds", 20))
+        return max(0.0, budget)
+
+    def switch_seconds(self):
+        """What a switch usually costs, from the recent ones. 10 s until we know."""
+        recent = [s["seconds"] for s in self.switches[-20:] if s.get("ok")]
+        return sum(recent) / len(recent) if recent else 10
+
+    def ensure(self, network, deadline=None):
+        """
+        Gets us on `network` ("gopro" or "router"), switching only if we're not on it already.
+        A `deadline` (lib.deadline) limits the switch, see Wifi.switch_wifi.
+        """
+        if self.current() == network:
+            logger.info(f"Already connected to {self.ssid(network)}")
+            return True
+
+        ssid = self.ssid(network)
+        now = datetime.datetime.now()
+        if network == "router" and self.left_gopro_at is None:
+            self.left_gopro_at = now
+        logger.info(f"Switching Wi-Fi to {ssid}.")
+        ok = self.wifi.switch_wifi(ssid, deadline=deadline)
+        self.on = network if ok else None
+        done = datetime.datetime.now()
+        self._record_switch(now, done, network, ok)
+        if not ok:
+            logger.error(f"Could not connect to {ssid}.")
+        return ok
+
+    def _record_switch(self, started, done, network, ok):
+        since = (done - datetime.timedelta(days=1)).isoformat()
+        self.switches = [s for s in self.switches if s["at"] >= since]
+        self.switches.append({"at": started.isoformat(timespec="seconds"), "to": network, "ok": ok,
+                              "seconds": round((done - started).total_seconds(), 1)})
+        if network == "gopro" and ok and self.left_gopro_at is not None:
+            self.off_gopro = [p for p in self.off_gopro if p[1] >= since]
+            self.off_gopro.append([self.left_gopro_at.isoformat(timespec="seconds"), done.isoformat(timespec="seconds")])
+            self.left_gopro_at = None
+        self._save()
+
+    def _save(self):
+        save_json(self.metrics_path, {"switches": self.switches, "off_gopro": self.off_gopro,
+                                      "skipped_windows": self.skipped_windows})
+
+    def report(self, hours=24):
+        """Switches and seconds off the GoPro Wi-Fi per hour, over the last `hours`."""
+        since = (datetime.datetime.now() - datetime.timedelta(hours=hours)).isoformat()
+        switches = [s for s in self.switches if s["at"] >= since]
+        failed = sum(1 for s in switches if not s["ok"])
+        off = sum((datetime.datetime.fromisoformat(back) - datetime.datetime.fromisoformat(left)).total_seconds()
+                  for left, back in self.off_gopro if back >= since)
+        line = (f"Wi-Fi: {len(switches) / hours:.1f} switches/h ({failed} failed, {self.unplanned} unplanned), "
+                f"{off / hours:.0f}s/h off GoPro")
+        if self.skipped_windows:
+            line += f", {self.skipped_windows} update windows skipped in a row"
+        return line
+
+network = NetworkPlanner(scheduler.planner)
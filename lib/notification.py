@@ -5,6 +5,14 @@
 import requests
 import datetime
 import lib.config as config
+import lib.forecast as forecast
+import lib.session as session
+import lib.scheduler as scheduler
+import lib.machine as machine
+import lib.plan as plan
+import lib.keepalive as keepalive
+import lib.network as network
+import lib.recovery as recovery
 
 from lib.logger import logger
 from lib.utilities import rpi_temp
@@ -17,6 +25,7 @@ class Notification:
         self.push_config = self.config.push_config
 
     def send_status(self):
+        """The status push. Returns True if PushBullet took it."""
         url = "https://api.pushbullet.com/v2/pushes"
         headers = {
             "Access-Token": self.push_config["api_key"],
@@ -29,16 +38,43 @@ class Notification:
             "body": f"Don't worry.. all iz good! \n{timestamp} "
                     f"- Temp is [{rpi_temp()}] "
                     f"- Restart counter: [{self.config.restart_counter}]"
+                    f" - {forecast.forecaster.summary()}"
+                    f" - Camera: {self._camera_health()}"
+                    f" - Worker kills: [{self.config.camera_worker_kills}]"
+                    f" - Missed slots: [{self.config.missed_slots}]"
+                    f" - {scheduler.scheduler.report()}"
+                    f" - {plan.capture_plan.summary()}"
+                    f" - {network.network.report()}"
+                    f" - {machine.machine.report()}"
+                    f" - {recovery.recovery.report()}"
         }
+        if self.config.capture_engine == "in_camera":
+            data["body"] += f" - Lapse restarts: [{self.config.lapse_restart_counter}]"
+        else:
+            data["body"] += (f" - Keep-alive preemptions: [{self.config.keep_alive_preemptions}]"
+                             f" - {keepalive.controller.report(plan.capture_plan.count('keep_alive'))}")
+        sent = False
         try:
-            resp = requests.post(url, headers=headers, json=data)
-            if resp.status_code == 200:
+            resp = requests.post(url, headers=headers, json=data, timeout=self.push_config.get("timeout_seconds", 10))
+            sent = resp.status_code == 200
+            if sent:
                 logger.info(f"Push notification sent successfully --> [STATUS] {timestamp} -- {data}")
             else:
                 logger.error(f"This is PushBullet's error: {resp.status_code}, {resp.text}")
         except Exception as e:
             logger.error(f"Error sending status: {e}")
 
+        # We only have internet in this window, so this is where the forecast alerts go out
+        for message in forecast.forecaster.alerts():
+            self.send_alert(title="GoPro running out", message=message)
+        return sent
+
+    @staticmethod
+    def _camera_health():
+        health = session.camera_session.health()
+        return (f"[{health['model']} / {health['interface']}] last OK [{health['last_success']}] "
+                f"failures [{health['consecutive_failures']}] detections [{health['detections']}]")
+
     def send_alert(self, title, message):
         logger.error(f"[ALERT] {title}: {message}")
         url = "https://api.PushBullet.com/v2/pushes"
@@ -52,7 +88,7 @@ class Notification:
             "body": f"{message}"
         }
         try:
-            resp = requests.post(url, headers=headers, json=data)
+            resp = requests.post(url, headers=headers, json=data, timeout=self.push_config.get("timeout_seconds", 10))
             if resp.status_code == 200:
                 logger.info(f"Push notification sent successfully --> [ALERT] {title} -- {message}")
             else:
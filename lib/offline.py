@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+# OFFLINE_ALERT used to try the router and then the GoPro Wi-Fi every 10 seconds, each with up to 5 nmcli connects,
+# for hours, with the log to match. Now the tries back off exponentially (30 s, 1 min, 2 min.. up to 30 min) and
+# every try starts with the cheap checks: one HTTP request to the camera, are we on its Wi-Fi anyway, is its SSID in
+# the scan results. Only if the SSID is there do we switch, and never for more than radio_seconds_per_hour.
+# The backoff is saved, so a restart in the middle of a bad night doesn't start hammering from scratch.
+
+import os
+import time
+import datetime
+import lib.config as config
+import lib.wifi as wifi
+import lib.network as network
+import lib.session as session
+
+from lib.deadline import Deadline, DeadlineExceeded
+from lib.logger import logger
+from lib.utilities import load_json, save_json
+
+
+def _parse(value):
+    return datetime.datetime.fromisoformat(value) if value else None
+
+
+class OfflineRecovery:
+
+    def __init__(self):
+        self.config = config.global_config
+        self.offline_config = self.config.offline_config
+        self.backoff_config = self.offline_config.get("backoff", {})
+        self.wifi = wifi.wifi
+        self.network = network.network
+        self.session = session.camera_session
+        self.state_path = os.path.join(self.config.data_path, "offline.json")
+        saved = load_json(self.state_path, {})
+        self.failures = saved.get("failures", 0)              # failed tries in a row
+        self.next_attempt = _parse(saved.get("next_attempt"))
+        self.since = _parse(saved.get("since"))               # first failed try of this episode
+        self.radio = saved.get("radio", [])                   # [at, seconds] per try, last hour
+        self.last_result = None
+
+    def backoff(self):
+        """Seconds until the next try, after `failures` failed ones."""
+        initial = self.backoff_config.get("initial_seconds", 30)
+        factor = self.backoff_config.get("factor", 2)
+        return min(initial * factor ** max(self.failures - 1, 0), self.backoff_config.get("max_seconds", 1800))
+
+    def due(self, now=None):
+        now = now or datetime.datetime.now()
+        return self.next_attempt is None or now >= self.next_attempt
+
+    def radio_seconds(self, now=None):
+        """Radio time the tries took in the last hour."""
+        since = ((now or datetime.datetime.now()) - datetime.timedelta(hours=1)).isoformat()
+        return sum(seconds for at, seconds in self.radio if at >= since)
+
+    def attempt(self, now=None):
+        """One try at getting back on the GoPro Wi-Fi, cheapest checks first. True if we're back."""
+        now = now or datetime.datetime.now()
+        start = time.monotonic()
+        try:
+            self.last_result = self._try(now)
+        finally:
+            self._record_radio(now, time.monotonic() - start)
+
+        if self.last_result == "online":
+            logger.info(f"GoPro Wi-Fi is back after {self.failures} failed tries.")
+            self.reset()
+            return True
+
+        self.failures += 1
+        self.since = self.since or now
+        self.next_attempt = now + datetime.timedelta(seconds=self.backoff())
+        logger.warning(f"Still offline ({self.last_result}). Try #{self.failures} failed, "
+                       f"next one at {self.next_attempt:%H:%M:%S}. Radio this hour: {self.radio_seconds(now):.0f}s.")
+        self._save()
+        return False
+
+    def _try(self, now):
+        # One HTTP request: if the camera answers, we're on its Wi-Fi and it's up
+        if self.session.probe() is not None:
+            return "online"
+        if self.network.current() == "gopro":
+            return "online"  # on its Wi-Fi, the camera is just asleep
+
+        ssid = self.network.ssid("gopro")
+        visible = self.wifi.visible_ssids()
+        if visible is not None and ssid not in visible:
+            return "SSID not in range"
+
+        cap = self.offline_config.get("radio_seconds_per_hour", 120)
+        if self.radio_seconds(now) >= cap:
+            return f"radio budget of {cap}s/h used up"
+
+        deadline = Deadline(self.offline_config.get("switch_budget_seconds", 45), "offline switch")
+        try:
+            return "online" if self.network.ensure("gopro", deadline) else "switch failed"
+        except DeadlineExceeded:
+            return "switch ran out of time"
+
+    def reset(self):
+        """Back online, from here or from anywhere else (a photo made it)."""
+        if self.failures == 0 and self.next_attempt is None:
+            return
+        self.failures = 0
+        self.next_attempt = None
+        self.since = None
+        self._save()
+
+    def summary(self):
+        """For the alerts."""
+        if not self.failures:
+            return "No failed tries yet."
+        return (f"{self.failures} failed tries since {self.since:%H:%M}, last: {self.last_result or 'unknown'}. "
+                f"Next try at {self.next_attempt:%H:%M}.")
+
+    def _record_radio(self, now, seconds):
+        since = (now - datetime.timedelta(hours=1)).isoformat()
+        self.radio = [r for r in self.radio if r[0] >= since]
+        self.radio.append([now.isoformat(timespec="seconds"), round(seconds, 1)])
+
+    def _save(self):
+        save_json(self.state_path, {
+            "failures": self.failures,
+            "next_attempt": self.next_attempt.isoformat(timespec="seconds") if self.next_attempt else None,
+            "since": self.since.isoformat(timespec="seconds") if self.since else None,
+            "radio": self.radio,
+        })
+
+offline = OfflineRecovery()
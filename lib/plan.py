@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+# The same photo minutes every hour means black frames at 3 am and too few at sunrise and sunset.
+# This works out sunrise and sunset for our spot (plain astronomy, no network) and compiles one plan per day:
+# a byte per minute of the day saying photo / keep-alive / update. The planner just indexes into it.
+
+import os
+import re
+import math
+import json
+import hashlib
+import datetime
+import lib.config as config
+
+from lib.logger import logger
+from lib.utilities import load_json, save_json
+
+PHOTO = 1
+KEEP_ALIVE = 2
+SEND_UPDATE = 4
+FLAGS = {"photo": PHOTO, "keep_alive": KEEP_ALIVE, "send_update": SEND_UPDATE}
+
+MINUTES_PER_DAY = 24 * 60
+ANY_FLAG = re.compile(b"[^\x00]")  # the empty minutes are most of the day, the regex skips them in C
+
+
+def sun_times(day, latitude, longitude, zenith=90.833):
+    """
+    Local sunrise and sunset (naive datetimes, system time zone) for `day`, NOAA's approximation.
+    Good to a minute or two, which is all we need. Midnight sun gives (00:00, 24:00), polar night (None, None).
+    """
+    gamma = 2 * math.pi / 365 * (day.timetuple().tm_yday - 1 + 0.5)
+    eqtime = 229.18 * (0.000075 + 0.001868 * math.cos(gamma) - 0.032077 * math.sin(gamma)
+                       - 0.014615 * math.cos(2 * gamma) - 0.040849 * math.sin(2 * gamma))
+    decl = (0.006918 - 0.399912 * math.cos(gamma) + 0.070257 * math.sin(gamma) - 0.006758 * math.cos(2 * gamma)
+            + 0.000907 * math.sin(2 * gamma) - 0.002697 * math.cos(3 * gamma) + 0.00148 * math.sin(3 * gamma))
+
+    lat = math.radians(latitude)
+    cos_ha = math.cos(math.radians(zenith)) / (math.cos(lat) * math.cos(decl)) - math.tan(lat) * math.tan(decl)
+    midnight = datetime.datetime.combine(day, datetime.time())
+    if cos_ha > 1:
+        return None, None
+    if cos_ha < -1:
+        return midnight, midnight + datetime.timedelta(days=1)
+
+    ha = math.degrees(math.acos(cos_ha))
+    utc_midnight = datetime.datetime.combine(day, datetime.time(), tzinfo=datetime.timezone.utc)
+
+    def local(minutes_utc):
+        # via a timestamp, so the system time zone (and DST) does the conversion
+        return datetime.datetime.fromtimestamp((utc_midnight + datetime.timedelta(minutes=minutes_utc)).timestamp())
+
+    return local(720 - 4 * (longitude + ha) - eqtime), local(720 - 4 * (longitude - ha) - eqtime)
+
+
+def frame_plan(windows, now):
+    """
+    Which capture mode applies at `now`, from photo_timer.windows in config.json.
+    Returns (mode, ev values), one ev value per frame. None means "leave EV alone".
+    """
+    clock_time = now.strftime("%H:%M")
+    for window in windows:
+        start, end = window["from"], window["to"]
+        inside = start <= clock_time < end if start <= end else (clock_time >= start or clock_time < end)
+        if not inside:
+            continue
+        if window.get("mode") == "bracket":
+            return "bracket", [float(ev) for ev in window.get("ev", [-1, 0, 1])]
+        if window.get("mode") == "burst":
+            return "burst", [None] * int(window.get("frames", 3))
+    return "single", [None]
+
+
+class CapturePlan:
+    """
+    Which minutes of a day get a photo, a keep-alive or an update window. Compiled once per day and cached.
+    Without a sun_plan in config.json it's the old fixed lists (photo_timer, keep_alive, send_update) every hour.
+    """
+
+    def __init__(self, cfg=None):
+        self.config = cfg or config.global_config
+        self.plan_path = os.path.join(self.config.data_path, "capture_plan.json")
+        self.days = {}  # date -> (bytearray of MINUTES_PER_DAY flags, sunrise, sunset)
+
+    def at(self, moment):
+        """The flags for the minute `moment` falls in."""
+        return self.day(moment.date())[0][moment.hour * 60 + moment.minute]
+
+    def has(self, moment, kind):
+        return bool(self.at(moment) & FLAGS[kind])
+
+    def next_planned(self, moment, horizon):
+        """The first minute from `moment` (second 0) on with anything planned, None if there's none before `horizon`."""
+        while moment < horizon:
+            midnight = datetime.datetime.combine(moment.date(), datetime.time())
+            match = ANY_FLAG.search(self.day(moment.date())[0], moment.hour * 60 + moment.minute)
+            if match:
+                found = midnight + datetime.timedelta(minutes=match.start())
+                return found if found < horizon else None
+            moment = midnight + datetime.timedelta(days=1)
+        return None
+
+    def day(self, date):
+        compiled = self.days.get(date)
+        if compiled is None:
+            compiled = self.compile(date)
+            # yesterday and today are all the planner looks at
+            self.days = {d: v for d, v in self.days.items() if d >= date - datetime.timedelta(days=1)}
+            self.days[date] = compiled
+        return compiled
+
+    def compile(self, date):
+        fingerprint = self._fingerprint(date)
+        saved = load_json(self.plan_path, {})
+        if saved.get("date") == date.isoformat() and saved.get("fingerprint") == fingerprint:
+            return (bytearray(bytes.fromhex(saved["minutes"])),) + self.sun(date)
+
+        minutes, sunrise, sunset = self.build(date)
+        photos = sum(1 for flags in minutes if flags & PHOTO)
+        logger.info(f"Capture plan for {date}: {photos} photos"
+                    + (f", sunrise {sunrise:%H:%M}, sunset {sunset:%H:%M}." if sunrise else "."))
+        save_json(self.plan_path, {
+            "date": date.isoformat(),
+            "fingerprint": fingerprint,
+            "sunrise": sunrise.isoformat(timespec="minutes") if sunrise else None,
+            "sunset": sunset.isoformat(timespec="minutes") if sunset else None,
+            "photos": photos,
+            "minutes": minutes.hex(),
+        })
+        return minutes, sunrise, sunset
+
+    def sun(self, date):
+        """(sunrise, sunset) when the sun plan is on, (None, None) otherwise."""
+        sun_config = self.config.sun_plan_config
+        if not sun_config.get("enabled"):
+            return None, None
+        return sun_times(date, sun_config["latitude"], sun_config["longitude"])
+
+    def build(self, date):
+        """The day's (minutes, sunrise, sunset) straight from config.json. Not cached, nothing saved."""
+        sun_config = self.config.sun_plan_config
+        sunrise, sunset = self.sun(date)
+        minutes = bytearray(MINUTES_PER_DAY)
+        # keep_alive.minutes only fit between the photo_timer minutes. With the photos wherever the sun puts them,
+        # a keep-alive goes in wherever the camera would otherwise go longer than this without hearing from us.
+        gap = sun_config.get("keep_alive_gap_minutes", 3)
+        last_contact = -gap
+        for minute in range(MINUTES_PER_DAY):
+            if sun_config.get("enabled"):
+                every = sun_config.get("every_minutes", {}).get(self.period(minute, date, sunrise, sunset), 0)
+                photo = bool(every) and (minute - sun_config.get("offset", 3)) % every == 0
+            else:
+                photo = minute % 60 in self.config.photo_timer
+            if photo:
+                minutes[minute] |= PHOTO
+                last_contact = minute
+            elif sun_config.get("enabled"):
+                if minute - last_contact >= gap:
+                    minutes[minute] |= KEEP_ALIVE
+                    last_contact = minute
+            elif minute % 60 in self.config.keep_alive_timer:
+                minutes[minute] |= KEEP_ALIVE
+            if minute % 60 in self.config.update_timer:
+                minutes[minute] |= SEND_UPDATE
+        return minutes, sunrise, sunset
+
+    def period(self, minute, date, sunrise, sunset):
+        """"night", "golden" or "day" for a minute of the day."""
+        if sunrise is None:
+            return "night"
+        midnight = datetime.datetime.combine(date, datetime.time())
+        rise = (sunrise - midnight).total_seconds() / 60
+        set_ = (sunset - midnight).total_seconds() / 60
+        golden = self.config.sun_plan_config.get("golden_hour_minutes", 60)
+        if abs(minute - rise) <= golden or abs(minute - set_) <= golden:
+            return "golden"
+        return "day" if rise < minute < set_ else "night"
+
+    def count(self, kind, date=None):
+        """How many minutes of the day have `kind` planned."""
+        minutes = self.day(date or datetime.date.today())[0]
+        return sum(1 for flags in minutes if flags & FLAGS[kind])
+
+    def summary(self):
+        _, sunrise, sunset = self.day(datetime.date.today())
+        photos = self.count("photo")
+        if sunrise is None:
+            return f"Plan: {photos} photos today"
+        return f"Plan: {photos} photos today, sunrise {sunrise:%H:%M}, sunset {sunset:%H:%M}"
+
+    def _fingerprint(self, date):
+        # Anything that changes the plan. A config change recompiles, even on the same day.
+        inputs = [date.isoformat(), self.config.sun_plan_config, self.config.photo_timer,
+                  self.config.keep_alive_timer, self.config.update_timer]
+        return hashlib.sha1(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+capture_plan = CapturePlan()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+# A restart (watchdog, crash, reboot) used to start from scratch: WAITING, no idea which slot was the last one
+# taken, no idea what was planned next. Now every capture and every new plan leaves a small checkpoint, and on
+# start we pick up from it: the exact last capture, the other slots already done, what the camera was, and if a
+# photo slot is live right now we go straight to TAKE_PHOTO. How long a restart costs us (restart to the first
+# photo in the can) is kept per restart, so we can see it and make it shorter.
+
+import os
+import datetime
+import lib.config as config
+import lib.session as session
+import lib.scheduler as scheduler
+
+from lib.logger import logger
+from lib.utilities import load_json, save_json
+
+
+def _parse(value):
+    return datetime.datetime.fromisoformat(value) if value else None
+
+
+def _iso(value):
+    return value.isoformat(timespec="seconds") if value else None
+
+
+class Recovery:
+
+    def __init__(self):
+        self.config = config.global_config
+        self.session = session.camera_session
+        self.scheduler = scheduler.scheduler
+        self.checkpoint_path = os.path.join(self.config.data_path, "recovery.json")
+        self.saved = load_json(self.checkpoint_path, {})
+        # One entry per start: when, which state we resumed in, and seconds until the first photo (None until then)
+        self.restarts = self.saved.get("restarts", [])
+        self.next_action = None
+        self.started_at = None
+
+    def restore(self, now=None):
+        """
+        Puts back what the checkpoint knows and returns the state to start in:
+        TAKE_PHOTO if a photo slot that wasn't taken is due now, WAITING otherwise.
+        """
+        now = now or datetime.datetime.now()
+        self.started_at = now
+        saved = self.saved
+
+        self.config.last_photo_target = _parse(saved.get("last_photo_target"))
+        self.config.last_keep_alive_slot = _parse(saved.get("last_keep_alive_slot"))
+        self.config.last_update_slot = _parse(saved.get("last_update_slot"))
+        if self.config.last_photo_target:
+            self.config.last_photo_minute = self.config.last_photo_target.minute
+        self._restore_session(saved.get("session") or {})
+
+        next_action = saved.get("next_action")
+        if next_action:
+            logger.info(f"Before the restart, next up was {next_action['kind']} at {next_action['at']}.")
+
+        state = "WAITING"
+        target = self.scheduler.next_target(now, self.config.last_photo_target)
+        if target is not None and self.scheduler.wake_time(target) <= now:
+            self.config.next_photo_target = target
+            state = "TAKE_PHOTO"
+        logger.info(f"Recovered. Last photo was {_iso(self.config.last_photo_target) or 'never'}. "
+                    + (f"Slot {target:%H:%M:%S} is live, going straight to TAKE_PHOTO." if state == "TAKE_PHOTO"
+                       else "Resuming in WAITING."))
+
+        since = (now - datetime.timedelta(days=7)).isoformat()
+        self.restarts = [r for r in self.restarts if r["at"] >= since]
+        self.restarts.append({"at": _iso(now), "state": state, "uptime": self.config.rpi_uptime,
+                              "first_photo_seconds": None})
+        self._save()
+        return state
+
+    def _restore_session(self, fingerprint):
+        # Same camera (IP and MAC) as before the restart? Then we know what it is and when it last answered.
+        if not fingerprint:
+            return
+        if (fingerprint.get("ip"), fingerprint.get("mac")) != (self.config.gopro_config["ip"], self.config.gopro_config["mac"]):
+            logger.info("The camera in config.json isn't the one from before the restart. Starting the session fresh.")
+            return
+        self.session.model = fingerprint.get("model")
+        self.session.interface = fingerprint.get("interface")
+        self.session.last_success = _parse(fingerprint.get("last_success"))
+
+    def planned(self, action):
+        """The next action, as the planner has it. Only written when it changes."""
+        if action == self.next_action:
+            return
+        self.next_action = action
+        self._save()
+
+    def slot_done(self):
+        """A keep-alive or update slot was handled. Nothing to measure, but a restart shouldn't redo it."""
+        self._save()
+
+    def captured(self, target, shutter_at):
+        """A photo is in. The first one after a start is the restart's cost."""
+        pending = self.restarts[-1] if self.restarts and self.restarts[-1]["first_photo_seconds"] is None else None
+        if pending is not None and self.started_at is not None and shutter_at is not None:
+            pending["first_photo_seconds"] = round((shutter_at - self.started_at).total_seconds(), 1)
+            pending["slot"] = _iso(target)
+            logger.info(f"First photo {pending['first_photo_seconds']}s after the restart.")
+        self._save()
+
+    def report(self):
+        measured = sorted(r["first_photo_seconds"] for r in self.restarts if r.get("first_photo_seconds") is not None)
+        if not self.restarts:
+            return "Restarts (7d): none"
+        if not measured:
+            return f"Restarts (7d): {len(self.restarts)}, no photo after any of them yet"
+        last = next(r["first_photo_seconds"] for r in reversed(self.restarts) if r.get("first_photo_seconds") is not None)
+        return (f"Restarts (7d): {len(self.restarts)}, restart to photo median {measured[len(measured) // 2]:.0f}s, "
+                f"last {last:.0f}s")
+
+    def _save(self):
+        action = self.next_action
+        save_json(self.checkpoint_path, {
+            "last_photo_target": _iso(self.config.last_photo_target),
+            "last_keep_alive_slot": _iso(self.config.last_keep_alive_slot),
+            "last_update_slot": _iso(self.config.last_update_slot),
+            "next_action": {"kind": action.kind, "at": _iso(action.at), "slot": _iso(action.slot)} if action else None,
+            "session": {
+                "ip": self.config.gopro_config["ip"],
+                "mac": self.config.gopro_config["mac"],
+                "model": self.session.model,
+                "interface": self.session.interface,
+                "last_success": _iso(self.session.last_success),
+            },
+            "restarts": self.restarts,
+        })
+
+recovery = Recovery()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+
+# Photos used to land anywhere between 5 seconds early and 4 seconds late, because we only looked at the clock
+# every 10 seconds and the wake sequence takes as long as it takes. This learns how long it takes from the start
+# of TAKE_PHOTO until the shutter fires, and tells us when to start so the shutter fires on the target second.
+
+import os
+import time
+import datetime
+import collections
+import lib.config as config
+import lib.plan as plan
+import lib.keepalive as keepalive
+
+from lib.logger import logger
+from lib.watchdog import watchdog
+from lib.utilities import load_json, save_json
+
+
+class CaptureScheduler:
+
+    def __init__(self):
+        self.config = config.global_config
+        self.scheduler_config = self.config.scheduler_config
+        self.plan = plan.capture_plan
+        self.records_path = os.path.join(self.config.data_path, "captures.json")
+        # One record per photo slot: target time, when we started, when the shutter fired, the error..
+        self.records = load_json(self.records_path, [])
+
+    def lead_seconds(self):
+        """How many seconds before the target we start. Median of the recent wake-to-shutter latencies."""
+        latencies = sorted(r["latency"] for r in self.records[-self.scheduler_config.get("history", 50):]
+                           if r.get("latency") is not None)
+        if not latencies:
+            return self.scheduler_config.get("default_lead_seconds", 6)
+        middle = len(latencies) // 2
+        median = latencies[middle] if len(latencies) % 2 else (latencies[middle - 1] + latencies[middle]) / 2
+        return min(max(median, 0), self.scheduler_config.get("max_lead_seconds", 45))
+
+    def next_target(self, now, last_target=None):
+        """
+        The next photo slot (a photo minute in today's plan, second 0) that's not taken yet.
+        A slot stays valid until `late_seconds` after its target, so a busy loop makes it late, not missed.
+        """
+        late = datetime.timedelta(seconds=self.scheduler_config.get("late_seconds", 30))
+        candidate = now.replace(second=0, microsecond=0) - datetime.timedelta(minutes=1)
+        for _ in range(24 * 60):
+            if self.plan.has(candidate, "photo") and candidate + late >= now and candidate != last_target:
+                return candidate
+            candidate += datetime.timedelta(minutes=1)
+        return None
+
+    def wake_time(self, target):
+        return target - datetime.timedelta(seconds=self.lead_seconds())
+
+    def record(self, target, started, shutter_at, **extra):
+        """Stores one capture and logs how far off the target the shutter fired."""
+        record = {
+            "target": target.isoformat(timespec="seconds"),
+            "started": started.isoformat(timespec="milliseconds"),
+            "shutter_at": shutter_at.isoformat(timespec="milliseconds") if shutter_at else None,
+            "latency": round((shutter_at - started).total_seconds(), 2) if shutter_at else None,
+            "error": round((shutter_at - target).total_seconds(), 2) if shutter_at else None,
+        }
+        record.update(extra)
+        if shutter_at:
+            logger.info(f"Slot {target.strftime('%H:%M:%S')}: shutter fired {record['error']:+.2f}s off target, "
+                        f"{record['latency']:.2f}s after start.")
+        else:
+            logger.warning(f"Slot {target.strftime('%H:%M:%S')}: no shutter.")
+        self.records.append(record)
+        self.records = self.records[-self.scheduler_config.get("records_size", 2000):]
+        save_json(self.records_path, self.records)
+        return record
+
+    def report(self, hours=24):
+        """Timing error over the last `hours`, for the status push."""
+        since = (datetime.datetime.now() - datetime.timedelta(hours=hours)).isoformat()
+        errors = [abs(r["error"]) for r in self.records if r["target"] >= since and r.get("error") is not None]
+        missed = sum(1 for r in self.records if r["target"] >= since and r.get("error") is None)
+        if not errors:
+            return f"Timing: no captures in {hours}h"
+        within = sum(1 for e in errors if e <= 1.0)
+        return (f"Timing: {within}/{len(errors)} within 1s, mean {sum(errors) / len(errors):.1f}s, "
+                f"max {max(errors):.1f}s, {missed} without shutter, lead {self.lead_seconds():.1f}s")
+
+
+# kind: "photo", "keep_alive" or "send_update". at: when to start (wall clock). slot: the minute it belongs to.
+Action = collections.namedtuple("Action", ["kind", "at", "slot"])
+
+# When two actions want the same second, this goes first
+PRIORITY = {"photo": 0, "keep_alive": 1, "send_update": 2}
+
+
+class ActionPlanner:
+    """
+    Works out what's next (photo, keep-alive, update window) straight from the config and sleeps until then,
+    instead of waking up every 10 seconds to look at the clock.
+    Keep-alives and updates that would still be running when a photo has to start are simply not planned,
+    so they can't eat a photo slot.
+    """
+
+    def __init__(self, capture_scheduler):
+        self.config = config.global_config
+        self.scheduler_config = self.config.scheduler_config
+        self.capture_scheduler = capture_scheduler
+        self.plan = capture_scheduler.plan
+        self.keep_alive = keepalive.controller
+        self.looked_at = None
+        # Slots the planner dropped on purpose (collisions, keep-alives not needed), so they don't count as missed
+        self.skipped = set()
+        self.missed = set()
+
+    def upcoming(self, now, count=3):
+        """
+        The next `count` actions, earliest first. Due actions that are a bit late are still in, anything later
+        than that is missed (logged and counted in config.missed_slots).
+        """
+        late = {
+            "photo": self.scheduler_config.get("late_seconds", 30),
+            "keep_alive": self.scheduler_config.get("keep_alive_late_seconds", 20),
+            "send_update": self.scheduler_config.get("update_late_seconds", 60),
+        }
+        done = {
+            "photo": self.config.last_photo_target,
+            "keep_alive": self.config.last_keep_alive_slot,
+            "send_update": self.config.last_update_slot,
+        }
+
+        actions = []
+        # Same lead for every photo in here, no need to sort the latencies for each one
+        lead = datetime.timedelta(seconds=self.capture_scheduler.lead_seconds())
+        minute = datetime.timedelta(minutes=1)
+        horizon = now + datetime.timedelta(days=1)
+        # From where we looked last time, so slots that went by while the loop was busy elsewhere get noticed
+        start = now.replace(second=0, microsecond=0) - minute
+        # The first look after a start can't know what happened before it, that's lib.recovery's business
+        first_look = self.looked_at is None
+        if not first_look:
+            start = max(min(start, self.looked_at.replace(second=0, microsecond=0)), now - datetime.timedelta(days=1))
+        self.looked_at = now
+        missed = []
+        slot = self.plan.next_planned(start, horizon)
+        # Keep going until the last action is a photo, so every keep-alive/update knows which photo comes after it
+        while slot is not None and (len(actions) < count + 1 or actions[-1].kind != "photo"):
+            flags = self.plan.at(slot)
+            for kind, flag in plan.FLAGS.items():
+                if not flags & flag or slot == done[kind]:
+                    continue
+                if slot + datetime.timedelta(seconds=late[kind]) < now:
+                    if not first_look and (kind, slot) not in self.skipped and (kind, slot) not in self.missed:
+                        missed.append(Action(kind, slot, slot))
+                    continue
+                at = slot - lead if kind == "photo" else slot
+                actions.append(Action(kind, at, slot))
+            slot = self.plan.next_planned(slot + minute, horizon)
+        self._count_missed(missed, now)
+
+        actions.sort(key=lambda action: (action.at, PRIORITY[action.kind]))
+        return self._drop_unneeded_keep_alives(self._drop_collisions(actions))[:count]
+
+    def _drop_collisions(self, actions):
+        # Anything that would still run when the next photo needs to start is skipped. The photo wakes the camera anyway.
+        durations = self.scheduler_config.get("durations", {})
+        planned = []
+        for i, action in enumerate(actions):
+            if action.kind != "photo":
+                ends = action.at + datetime.timedelta(seconds=durations.get(action.kind, 30))
+                next_photo = next((a for a in actions[i + 1:] if a.kind == "photo"), None)
+                if next_photo and ends > next_photo.at:
+                    logger.debug(f"Not planning {action.kind} at {action.at:%H:%M:%S}, it would run into the next photo.")
+                    self.skipped.add((action.kind, action.slot))
+                    continue
+            planned.append(action)
+        return planned
+
+    def _drop_unneeded_keep_alives(self, actions):
+        # A keep-alive can go if the next photo/keep-alive still comes within the learned spacing since the last
+        # contact. If that one gets dropped too, it passed the same check against the same contact, so it's safe.
+        contact = self.keep_alive.last_contact
+        planned = []
+        for i, action in enumerate(actions):
+            if action.kind == "keep_alive":
+                following = next((a.at for a in actions[i + 1:] if a.kind in ("photo", "keep_alive")), None)
+                if not self.keep_alive.needed(contact, following):
+                    logger.debug(f"Skipping keep-alive at {action.at:%H:%M:%S}, the camera can be left alone until then.")
+                    self.skipped.add((action.kind, action.slot))
+                    continue
+            if action.kind in ("photo", "keep_alive"):
+                contact = action.at
+            planned.append(action)
+        return planned
+
+    def _count_missed(self, missed, now):
+        # Every missed slot once, with one log line for all of them (a night in OFFLINE_ALERT misses a lot)
+        if missed:
+            self.config.missed_slots += len(missed)
+            self.missed.update((a.kind, a.slot) for a in missed)
+            logger.warning(f"Missed {len(missed)} slot(s), the loop was busy when they were due: "
+                           + ", ".join(f"{a.kind} {a.slot:%H:%M}" for a in missed[:10])
+                           + (" .." if len(missed) > 10 else ""))
+        since = now - datetime.timedelta(days=1, minutes=1)
+        self.skipped = {s for s in self.skipped if s[1] >= since}
+        self.missed = {s for s in self.missed if s[1] >= since}
+
+    def sleep_until(self, at):
+        """
+        Sleeps until the wall clock time `at`, but at most max_idle_seconds in one go. time.sleep runs on the
+        monotonic clock, so an NTP step from sync_time can't stretch or skip it. Afterwards we look at the wall
+        clock again: True when `at` was reached, False when the caller should re-plan and wait some more.
+        """
+        remaining = (at - datetime.datetime.now()).total_seconds()
+        if remaining <= 0:
+            return True
+
+        watchdog.ping()
+        chunk = min(remaining, self.scheduler_config.get("max_idle_seconds", 30))
+        time.sleep(chunk)
+
+        wall_left = (at - datetime.datetime.now()).total_seconds()
+        if abs(wall_left - (remaining - chunk)) > 1:
+            logger.info(f"Wall clock moved by {(remaining - chunk) - wall_left:+.1f}s while waiting. Re-planning.")
+        return wall_left <= 0.05
+
+scheduler = CaptureScheduler()
+planner = ActionPlanner(scheduler)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+
+import time
+import datetime
+import json
+import contextlib
+import urllib.request
+import lib.wifi as wifi
+import lib.config as config
+import lib.keepalive as keepalive
+
+from goprocam import GoProCamera, constants
+from lib.deadline import DeadlineExceeded
+from lib.logger import logger
+from lib.watchdog import watchdog
+
+# A camera on its own Wi-Fi answers in milliseconds, this is only how long "no answer" takes after power off
+SLEEP_PROBE_SECONDS = 0.3
+
+
+class CameraSession:
+    """
+    The one GoPro connection everybody shares (capture, keep-alive, lapse supervision..).
+    The camera is detected once and then reused. If a request fails, we drop the connection
+    and reconnect lazily on the next wake.
+    """
+
+    def __init__(self):
+        self.config = config.global_config
+        self.wifi = wifi.wifi
+        self.gopro_config = self.config.gopro_config
+        self.waits_config = self.config.waits_config
+
+        self.camera = None
+        self.model = None
+        self.interface = None
+        self.connected_at = None
+        self.last_success = None
+        self.last_failure = None
+        self.consecutive_failures = 0
+        self.detections = 0
+        # How long we actually waited for each readiness condition, last time around
+        self.waits = {}
+        self.keep_alive = keepalive.controller
+        self.awake_since = None
+        # Seconds between the camera being ready and us powering it off, last time around
+        self.last_awake = 0.0
+        # The deadline of the operation we're in (lib.deadline), see within()
+        self.deadline = None
+
+    @contextlib.contextmanager
+    def within(self, deadline):
+        """Everything in this block (waits, probes, goprocam requests) is clamped to `deadline`."""
+        previous, self.deadline = self.deadline, deadline
+        if self.camera is not None:
+            self.camera.deadline = deadline
+        try:
+            yield deadline
+        finally:
+            self.deadline = previous
+            if self.camera is not None:
+                self.camera.deadline = previous
+
+    def wake(self):
+        """
+        WOL until the camera says it's ready. Returns the camera, or None if it never got ready.
+        Raises DeadlineExceeded if the deadline we're in (within()) runs out first.
+        """
+        logger.info("Waking up the GoPro with magic package.")
+        last_wol = 0
+
+        def ready():
+            nonlocal last_wol
+            # re-send the magic packet every couple of seconds, until it answers
+            if time.monotonic() - last_wol >= 2:
+                self.wifi.send_wol(self.gopro_config["mac"])
+                last_wol = time.monotonic()
+            status = self.probe()
+            return status if status and status.get(constants.Status.STATUS.SystemReady) == 1 else None
+
+        last_contact = self.keep_alive.last_contact
+        idle = (datetime.datetime.now() - last_contact).total_seconds() if last_contact else None
+        # A wake cut short by the deadline raises before this, it says nothing about how long the camera can be left alone
+        woke = self.wait_until("wake", ready, self.waits_config.get("wake", 15)) is not None
+        self.keep_alive.observe(idle, woke)
+        if not woke:
+            logger.error("GoPro not ready even after sending WOL. Possibly off already. But why?!")
+            return None
+
+        self.awake_since = time.monotonic()
+        self.keep_alive.woke()
+        camera = self.connect()
+        self.mark_ok()
+        return camera
+
+    def connect(self):
+        """Returns the shared camera. Detection only happens here, the first time or after a failure."""
+        if self.camera is None:
+            logger.info("Connecting to GoPro camera..")
+            camera = GoProCamera.GoPro(ip_address=self.gopro_config["ip"], mac_address=self.gopro_config["mac"],
+                                       deadline=self.deadline)
+            if not camera.whichCam():
+                raise ConnectionError("GoPro was not detected.")
+            self.camera = camera
+            self.interface = camera.whichCam()
+            self.model = camera.infoCamera(constants.Camera.Name)
+            self.connected_at = datetime.datetime.now()
+            self.detections += 1
+            logger.info(f"Connected to GoPro. Model [{self.model}] over [{self.interface}]. Detection #{self.detections}.")
+        return self.camera
+
+    def sleep(self):
+        logger.info("Shutting down GoPro..")
+        self.connect().power_off()
+        self.mark_ok()
+        if self.awake_since is not None:
+            self.last_awake = round(time.monotonic() - self.awake_since, 2)
+            self.awake_since = None
+        # Nothing depends on it, but we want to know the camera really went down. The first probe that gets no
+        # answer ends the wait, and a camera that's down can only answer by timing out, so that timeout is short.
+        went_down = self.wait_until("sleep", lambda: self.probe(timeout=SLEEP_PROBE_SECONDS) is None,
+                                    self.waits_config.get("sleep", 3))
+        if went_down is None:
+            logger.warning("GoPro still answers after power off.")
+
+    def set_mode(self, mode, submode="0"):
+        """Changes the mode and waits until the camera reports it."""
+        camera = self.connect()
+        camera.mode(mode, submode)
+        status = self.wait_until(
+            "mode", lambda: self.probe_matching(constants.Status.STATUS.Mode, int(mode)), self.waits_config.get("mode", 5))
+        if status is None:
+            logger.warning(f"GoPro didn't confirm mode {mode}. Carrying on anyway.")
+        return status
+
+    def probe_matching(self, key, value):
+        status = self.probe()
+        return status if status and status.get(key) == value else None
+
+    def probe(self, timeout=1.0):
+        """
+        Cheapest way to ask the camera anything: one status request with a short timeout, no goprocam detection.
+        Returns the status dict, or None if the camera doesn't answer.
+        """
+        if self.deadline is not None:
+            timeout = self.deadline.clamp(timeout, "probe")
+        try:
+            raw = urllib.request.urlopen(f"http://{self.gopro_config['ip']}/gp/gpControl/status", timeout=timeout).read()
+            return json.loads(raw).get(constants.Status.Status, {})
+        except Exception:
+            return None
+
+    def nudge(self):
+        """
+        The light keep-alive: goprocam's keep-alive datagram (the payload for the detected model), then one status
+        request and, if the camera is powered down, one ping. No WOL, no power on and no detection: without a
+        detected camera there's no datagram. True if the camera's Wi-Fi answered either way.
+        """
+        if self.camera is not None:
+            try:
+                self.camera.sendKeepAlive()
+            except OSError as e:
+                logger.warning(f"Couldn't send the keep-alive datagram: {e}")
+        answered = self.probe() is not None or self.wifi.check_network_reachable(self.gopro_config["ip"], retries=1, delay=0)
+        if answered:
+            self.keep_alive.contact()
+        return answered
+
+    def wait_until(self, label, condition, max_wait, interval=0.25):
+        """
+        Polls `condition` until it returns something truthy, at most `max_wait` seconds.
+        Returns that value (or None on timeout) and records how long we actually waited under `label`.
+        If the deadline we're in is up before `max_wait`, that's a DeadlineExceeded instead of None.
+        """
+        start = time.monotonic()
+        limit = max_wait if self.deadline is None else self.deadline.clamp(max_wait, label)
+        while True:
+            result = condition()
+            elapsed = time.monotonic() - start
+            if result or elapsed >= limit:
+                self.waits[label] = round(elapsed, 2)
+                if self.deadline is not None:
+                    self.deadline.spent(label, elapsed)
+                if not result and limit < max_wait:
+                    raise DeadlineExceeded(self.deadline, label)
+                return result or None
+            watchdog.ping()
+            time.sleep(min(interval, max(0.0, limit - elapsed)))
+
+    def status(self):
+        """A single gp/gpControl/status request. Returns {} if the camera didn't answer."""
+        raw = self.connect().getStatusRaw()
+        if not raw:
+            return {}
+        self.mark_ok()
+        return json.loads(raw).get(constants.Status.Status, {})
+
+    def mark_ok(self):
+        self.last_success = datetime.datetime.now()
+        self.consecutive_failures = 0
+        self.keep_alive.contact(self.last_success)
+
+    def mark_failed(self, error):
+        logger.warning(f"GoPro session failed: {error}. Will reconnect on next use.")
+        self.last_failure = datetime.datetime.now()
+        self.consecutive_failures += 1
+        self.camera = None
+
+    def health(self):
+        return {
+            "connected": self.camera is not None,
+            "model": self.model,
+            "interface": self.interface,
+            "connected_at": self.connected_at.isoformat(timespec="seconds") if self.connected_at else None,
+            "last_success": self.last_success.isoformat(timespec="seconds") if self.last_success else None,
+            "last_failure": self.last_failure.isoformat(timespec="seconds") if self.last_failure else None,
+            "consecutive_failures": self.consecutive_failures,
+            "detections": self.detections,
+        }
+
+camera_session = CameraSession()
@@ -0,0 +1,591 @@
+#!/usr/bin/env python3
+
+# Runs the real main loop (timelapse.Timelapse, lib.state.State and everything under them) against a virtual clock,
+# with fake Wi-Fi, camera and PushBullet backends. Sleeps and waits take no real time, so six months of operation take
+# about a minute, and missed slots or keep-alives that never fit show up here instead of after weeks in the field.
+#
+#   python -m lib.simulation --days 180 [--config config.json] [--profile latency.json] [--seed 1] [--json]
+#
+# The fakes draw their latencies (uniform between [low, high] seconds) and failures from a profile, see PROFILE.
+# It needs its own config (temporary data_path, no camera worker process), so lib is only imported in run(),
+# after TIMELAPSE_CONFIG points to that copy.
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import bisect
+import argparse
+import datetime
+import tempfile
+import contextlib
+import concurrent.futures
+import urllib.error
+import urllib.request
+
+# Seconds are [low, high] and drawn uniformly, failures are probabilities per attempt
+PROFILE = {
+    "wake_seconds": [3, 8],
+    "wake_failure": 0.01,
+    "capture_seconds": [1.0, 2.5],
+    "switch_seconds": [5, 12],
+    "switch_failure": 0.02,
+    "scan_seconds": [2, 4],
+    "ntp_seconds": [1, 5],
+    "ntp_failure": 0.05,
+    "push_seconds": [0.5, 2],
+    "push_failure": 0.02,
+    # The camera's Wi-Fi goes down for good after this long without hearing from us, until someone resets it.
+    # The README has it at "around 4 or 5" minutes and handle_errors gives up on it after 5, so the low end.
+    "camera_wifi_sleep_seconds": 240,
+    "camera_reset_hours": 12,
+}
+
+
+SIMULATION_MAX_IDLE_SECONDS = 3600
+
+
+class SimulationOver(BaseException):
+    # BaseException, so the main loop's `except Exception` doesn't swallow the end of the simulation
+    pass
+
+
+class VirtualClock:
+    """Wall clock and monotonic clock in one. sleep() and advance() move it forward, nothing takes real time."""
+
+    def __init__(self, start, end):
+        self.now = start
+        self.end = end
+        self.origin = start
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now - self.origin + 1000.0
+
+    def advance(self, seconds):
+        self.now += max(0.0, seconds)
+
+    def sleep(self, seconds):
+        # Real time always moves a little. A sleep shorter than what a float of ~1.7e9 can add would never move
+        # the clock, and a wait polling up to its limit would spin on it forever.
+        self.advance(max(seconds, 0.001))
+        if self.now >= self.end:
+            raise SimulationOver()
+
+
+class FakeCamera:
+    """
+    A HERO5 as far as we can tell: asleep (Wi-Fi up, HTTP down) until a WOL, awake after a random wake time,
+    a shutter makes it busy for the capture time and adds a photo. Its Wi-Fi dies if nobody talks to it for
+    camera_wifi_sleep_seconds, and comes back camera_reset_hours later (someone went and reset it).
+    """
+
+    def __init__(self, clock, rng, profile):
+        self.clock = clock
+        self.rng = rng
+        self.profile = profile
+        self.wifi = None
+        self.awake = False
+        self.awake_since = None
+        self.ready_at = None
+        self.mode = 0
+        self.photos = 0
+        self.busy_until = 0.0
+        self.last_contact = clock.time()
+        self.dead_since = None
+        self.shots = []          # when the shutter fired, virtual epoch seconds
+        self.wakes = 0
+        self.deaf_until = 0.0    # a failed wake: the camera ignores WOL for a while
+        self.awake_seconds = 0.0
+        self.wifi_deaths = 0
+
+    def alive(self):
+        """Whether the camera's own Wi-Fi is up."""
+        now = self.clock.time()
+        if self.dead_since is not None:
+            if now - self.dead_since < self.profile["camera_reset_hours"] * 3600:
+                return False
+            self.dead_since = None
+            self.last_contact = now
+        if not self.awake and now - self.last_contact > self.profile["camera_wifi_sleep_seconds"]:
+            self.dead_since = now
+            self.wifi_deaths += 1
+            return False
+        return True
+
+    def reachable(self):
+        return self.alive() and self.wifi.on_gopro()
+
+    def touch(self):
+        if self.reachable():
+            self.last_contact = self.clock.time()
+            return True
+        return False
+
+    def wol(self):
+        if not self.touch() or self.awake or self.ready_at is not None or self.clock.time() < self.deaf_until:
+            return
+        self.wakes += 1
+        if self.rng.random() < self.profile["wake_failure"]:
+            # longer than any wake we wait for, so the whole wake fails
+            self.deaf_until = self.clock.time() + 60
+        else:
+            self.ready_at = self.clock.time() + self.rng.uniform(*self.profile["wake_seconds"])
+
+    def status(self):
+        from goprocam import constants
+        if not self.touch():
+            return None
+        now = self.clock.time()
+        if not self.awake:
+            if self.ready_at is None or now < self.ready_at:
+                return None
+            self.awake, self.awake_since, self.ready_at = True, now, None
+        STATUS = constants.Status.STATUS
+        moment = datetime.datetime.fromtimestamp(now)
+        return {
+            STATUS.SystemReady: 1,
+            STATUS.Mode: self.mode,
+            STATUS.IsBusy: 1 if now < self.busy_until else 0,
+            STATUS.PhotosTaken: self.photos,
+            STATUS.RemPhotos: 5000 - self.photos,
+            STATUS.BattPercent: 100,
+            STATUS.DateTime: "%" + "%".join(f"{v:02X}" for v in (moment.year - 2000, moment.month, moment.day,
+                                                                  moment.hour, moment.minute, moment.second)),
+        }
+
+    def shutter(self):
+        if self.status() is None or self.clock.time() < self.busy_until:
+            return
+        self.photos += 1
+        self.shots.append(self.clock.time())
+        self.busy_until = self.clock.time() + self.rng.uniform(*self.profile["capture_seconds"])
+
+    def power_off(self):
+        if self.awake and self.touch():
+            self.awake_seconds += self.clock.time() - self.awake_since
+            self.awake = False
+        self.ready_at = None
+
+    def urlopen(self, url, timeout=None, **kwargs):
+        # Stands in for urllib.request.urlopen, i.e. lib.session.probe. Only the status endpoint answers.
+        status = self.status() if "/gp/gpControl/status" in url else None
+        if status is None:
+            self.clock.advance(min(timeout or 1.0, 0.3))
+            raise urllib.error.URLError("no answer")
+        return _Response(json.dumps({"status": status, "settings": {}}).encode())
+
+
+class InlineExecutor:
+    """
+    Stands in for lib.batch's ThreadPoolExecutor: runs each task right away, on the virtual clock. Threads would
+    wait on real condition variables, about 50 ms of wall time per update window. The tasks take their time one
+    after the other (the pessimistic side), and one that runs past its timeout still counts as done.
+    """
+
+    def __init__(self, max_workers=None, thread_name_prefix=""):
+        pass
+
+    def submit(self, fn, *args, **kwargs):
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+class InlineFutures:
+    """lib.batch's concurrent.futures, with InlineExecutor. Everything submitted is done by the time it's waited on."""
+
+    FIRST_COMPLETED = concurrent.futures.FIRST_COMPLETED
+    ThreadPoolExecutor = InlineExecutor
+
+    @staticmethod
+    def wait(futures, timeout=None, return_when=None):
+        return set(futures), set()
+
+
+class _Concurrent:
+    futures = InlineFutures
+
+
+class _Response:
+
+    def __init__(self, body):
+        self.body = body
+
+    def read(self):
+        return self.body
+
+
+class FakeGoProClient:
+    """What goprocam's GoPro object does for us, on the fake camera."""
+
+    def __init__(self, camera, deadline=None, **kwargs):
+        self.camera = camera
+        self.deadline = deadline
+
+    def whichCam(self):
+        return "gpcontrol" if self.camera.status() is not None else ""
+
+    def infoCamera(self, option=""):
+        return "HERO5 Black"
+
+    def mode(self, mode, submode="0"):
+        if self.camera.status() is not None:
+            self.camera.mode = int(mode)
+
+    def shutter(self, param):
+        self.camera.shutter()
+
+    def gpControlSet(self, param, value):
+        return "{}" if self.camera.status() is not None else ""
+
+    def power_off(self):
+        self.camera.power_off()
+
+    def getStatusRaw(self):
+        status = self.camera.status()
+        return json.dumps({"status": status}) if status is not None else ""
+
+    def listMedia(self):
+        return json.dumps({"media": []})
+
+    def syncTime(self):
+        return "{}"
+
+    def sendKeepAlive(self):
+        self.camera.touch()
+
+
+class FakeWifi:
+    """Stands in for lib.wifi's nmcli/ping side. Keeps count of the radio time it took."""
+
+    def __init__(self, clock, rng, profile, config, camera):
+        self.clock = clock
+        self.rng = rng
+        self.profile = profile
+        self.config = config
+        self.camera = camera
+        self.ssid = config.gopro_config["ssid"]
+        self.radio_seconds = 0.0
+        self.switches = 0
+        self.failed_switches = 0
+
+    def on_gopro(self):
+        return self.ssid == self.config.gopro_config["ssid"]
+
+    def _spend(self, seconds, deadline=None):
+        if deadline is not None:
+            seconds = min(seconds, max(0.0, deadline.remaining()))
+        self.radio_seconds += seconds
+        self.clock.advance(seconds)
+        return seconds
+
+    def get_current_wifi(self):
+        return self.ssid
+
+    def switch_wifi(self, target_ssid, deadline=None):
+        self.switches += 1
+        needed = self.rng.uniform(*self.profile["switch_seconds"])
+        spent = self._spend(needed, deadline)
+        ok = spent >= needed and self.rng.random() >= self.profile["switch_failure"]
+        if target_ssid == self.config.gopro_config["ssid"]:
+            ok = ok and self.camera.alive()
+        self.ssid = target_ssid if ok else None
+        if not ok:
+            self.failed_switches += 1
+        return ok
+
+    def ensure_wifi_connected(self, ssid):
+        return self.ssid == ssid or self.switch_wifi(ssid)
+
+    def check_network_reachable(self, ip, retries=5, delay=4, deadline=None):
+        if ip == self.config.gopro_config["ip"] and self.camera.touch():
+            self._spend(0.05)
+            return True
+        self._spend(retries * (1 + delay) - delay, deadline)
+        return False
+
+    def send_wol(self, mac_address):
+        self.camera.wol()
+
+    def visible_ssids(self, timeout=15):
+        self._spend(self.rng.uniform(*self.profile["scan_seconds"]))
+        visible = {self.config.router_config["ssid"]}
+        if self.camera.alive():
+            visible.add(self.config.gopro_config["ssid"])
+        return visible
+
+    def restart_wifi(self):
+        self._spend(15)
+        self.ssid = None
+        self.ensure_wifi_connected(self.config.gopro_config["ssid"])
+
+    def keep_alive(self):
+        return self.ensure_wifi_connected(self.config.gopro_config["ssid"])
+
+
+class FakePushBullet:
+    """Stands in for requests.post in lib.notification. Needs the router Wi-Fi, like the real thing."""
+
+    def __init__(self, clock, rng, profile, wifi):
+        self.clock = clock
+        self.rng = rng
+        self.profile = profile
+        self.wifi = wifi
+        self.pushes = {}
+
+    def post(self, url, headers=None, json=None, timeout=None):
+        self.clock.advance(self.rng.uniform(*self.profile["push_seconds"]))
+        title = (json or {}).get("title", "")
+        ok = self.wifi.ssid == self.wifi.config.router_config["ssid"] and self.rng.random() >= self.profile["push_failure"]
+        if ok:
+            self.pushes[title] = self.pushes.get(title, 0) + 1
+        return _PushResponse(200 if ok else 503)
+
+    def sync_time(self, timeout=20):
+        # ntpdate, same conditions
+        self.clock.advance(self.rng.uniform(*self.profile["ntp_seconds"]))
+        return self.wifi.ssid == self.wifi.config.router_config["ssid"] and self.rng.random() >= self.profile["ntp_failure"]
+
+
+class _PushResponse:
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.text = "" if status_code == 200 else "unavailable"
+
+
+@contextlib.contextmanager
+def virtual_time(clock):
+    """time.time/monotonic/sleep and datetime.now/today all read `clock` inside this block."""
+    real = (time.time, time.monotonic, time.sleep, datetime.datetime, datetime.date)
+
+    class ClockedDatetime(datetime.datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return cls.fromtimestamp(clock.time(), tz)
+
+        @classmethod
+        def today(cls):
+            return cls.now()
+
+    class ClockedDate(datetime.date):
+        @classmethod
+        def today(cls):
+            return ClockedDatetime.now().date()
+
+    time.time, time.monotonic, time.sleep = clock.time, clock.monotonic, clock.sleep
+    datetime.datetime, datetime.date = ClockedDatetime, ClockedDate
+    try:
+        yield
+    finally:
+        time.time, time.monotonic, time.sleep, datetime.datetime, datetime.date = real
+
+
+def simulation_config(config_path, workdir, max_idle_seconds=SIMULATION_MAX_IDLE_SECONDS):
+    """The config to simulate: `config_path` with its files in `workdir` and camera calls in-process."""
+    with open(config_path, "r") as f:
+        sim_config = json.load(f)
+    sim_config["data_path"] = os.path.join(workdir, "data")
+    sim_config["state_file"] = os.path.join(workdir, "state.json")
+    sim_config.setdefault("gopro", {}).setdefault("worker", {})["enabled"] = False
+    sim_config.pop("trace", None)
+    # FakeWifi tells the networks apart by SSID. The same placeholder for both would make every router switch a
+    # camera switch, failing whenever the camera is down.
+    router, gopro = sim_config.setdefault("router", {}), sim_config.setdefault("gopro", {})
+    if router.get("ssid") == gopro.get("ssid"):
+        router["ssid"], gopro["ssid"] = "sim-router", "sim-gopro"
+    if max_idle_seconds is not None:
+        # max_idle_seconds is there for NTP steps, and the virtual clock never steps. Waking up every 30 s only to
+        # re-plan the same thing would be most of the run time.
+        sim_config.setdefault("scheduler", {})["max_idle_seconds"] = max_idle_seconds
+    path = os.path.join(workdir, "config.json")
+    with open(path, "w") as f:
+        json.dump(sim_config, f, indent=2)
+    return path
+
+
+def run(days=180, config_path=None, profile=None, seed=1, start=None, verbose=False):
+    """Simulates `days` of operation and returns the numbers (see summarize)."""
+    profile = dict(PROFILE, **(profile or {}))
+    config_path = config_path or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.json")
+    start = start or datetime.datetime(2025, 3, 1)
+    # The state file is rewritten every update window. On a disk each truncate waits for writeback, tens of ms of
+    # wall time each: most of a long run. Memory-backed when there is one.
+    workdir = tempfile.mkdtemp(prefix="timelapse-sim-", dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+    os.environ["TIMELAPSE_CONFIG"] = simulation_config(config_path, workdir)
+    os.environ.pop("NOTIFY_SOCKET", None)
+
+    import logging
+    import goprocam.GoProCamera as GoProCamera
+    import lib.config as config
+    import lib.wifi as wifi
+    import lib.state as state
+    import lib.batch as batch
+    import lib.notification as notification
+    import lib.utilities as utilities
+    import lib.machine as machine
+    import lib.plan as plan
+    from lib.logger import logger
+    from timelapse import Timelapse
+
+    if config.global_config.config_path != os.environ["TIMELAPSE_CONFIG"]:
+        raise RuntimeError("lib was imported before the simulation could point it to its own config. "
+                           "Run it in a fresh interpreter: python -m lib.simulation")
+    if not verbose:
+        logger.setLevel(logging.CRITICAL)
+
+    clock = VirtualClock(start.timestamp(), (start + datetime.timedelta(days=days)).timestamp())
+    rng = random.Random(seed)
+    camera = FakeCamera(clock, rng, profile)
+    fake_wifi = FakeWifi(clock, rng, profile, config.global_config, camera)
+    camera.wifi = fake_wifi
+    pushbullet = FakePushBullet(clock, rng, profile, fake_wifi)
+
+    dwell = {}
+    record = machine.machine._record
+
+    def recording(state_name, event, target, now, seconds):
+        dwell.setdefault(state_name, []).append(seconds)
+        record(state_name, event, target, now, seconds)
+
+    # Everything holds the same Wifi object, so faking it in one place fakes it for all
+    for name in ("get_current_wifi", "switch_wifi", "ensure_wifi_connected", "check_network_reachable",
+                 "send_wol", "visible_ssids", "restart_wifi", "keep_alive"):
+        setattr(wifi.wifi, name, getattr(fake_wifi, name))
+    machine.machine._record = recording
+    patches = [
+        (GoProCamera, "GoPro", lambda **kwargs: FakeGoProClient(camera, **kwargs)),
+        (urllib.request, "urlopen", camera.urlopen),
+        (notification, "requests", pushbullet),
+        (notification, "rpi_temp", lambda: "NORMAL - 45.0"),
+        (state, "sync_time", pushbullet.sync_time),
+        (batch, "concurrent", _Concurrent),
+    ]
+    # The small JSON files are written all the time but only read at start, keep them in memory
+    files = {}
+    for module in list(sys.modules.values()):
+        if getattr(module, "__name__", "").startswith("lib.") and getattr(module, "save_json", None) is utilities.save_json:
+            patches.append((module, "save_json", files.__setitem__))
+            patches.append((module, "load_json", files.get))
+    originals = [(module, name, getattr(module, name)) for module, name, _ in patches]
+    for module, name, value in patches:
+        setattr(module, name, value)
+
+    wall_start = time.perf_counter()
+    try:
+        with virtual_time(clock):
+            try:
+                Timelapse().main_loop()
+            except SimulationOver:
+                pass
+    finally:
+        for module, name, value in originals:
+            setattr(module, name, value)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return summarize(start, days, clock, camera, fake_wifi, pushbullet, dwell, plan.capture_plan,
+                     config.global_config.scheduler_config, time.perf_counter() - wall_start)
+
+
+def summarize(start, days, clock, camera, fake_wifi, pushbullet, dwell, capture_plan, scheduler_config, wall_seconds):
+    """Slot-hit rate and shutter error, radio and camera-awake time, and dwell per state."""
+    late = scheduler_config.get("late_seconds", 30)
+    slots = []
+    minute = start
+    end = start + datetime.timedelta(days=days)
+    while minute < end:
+        if capture_plan.has(minute, "photo"):
+            slots.append(minute.timestamp())
+        minute += datetime.timedelta(minutes=1)
+
+    # A slot is hit if a shutter fired between its target and `late_seconds` after. Early shots count too, up to a minute.
+    errors = []
+    shots = camera.shots
+    for slot in slots:
+        index = bisect.bisect_left(shots, slot - 60)
+        if index < len(shots) and shots[index] <= slot + late:
+            errors.append(shots[index] - slot)
+    errors.sort()
+    hours = days * 24
+    return {
+        "days": days,
+        "wall_seconds": round(wall_seconds, 1),
+        "slots": len(slots),
+        "hits": len(errors),
+        "hit_rate": round(len(errors) / len(slots), 4) if slots else None,
+        "shutter_error_seconds": {"p50": percentile(sorted(abs(e) for e in errors), 50),
+                                  "p95": percentile(sorted(abs(e) for e in errors), 95)},
+        "radio_seconds_per_hour": round(fake_wifi.radio_seconds / hours, 1),
+        "switches": fake_wifi.switches,
+        "failed_switches": fake_wifi.failed_switches,
+        "camera_awake_seconds_per_hour": round(camera.awake_seconds / hours, 1),
+        "wakes": camera.wakes,
+        "camera_wifi_deaths": camera.wifi_deaths,
+        "pushes": pushbullet.pushes,
+        "dwell": dwell_stats(dwell),
+    }
+
+
+def percentile(values, p):
+    return round(values[min(len(values) - 1, int(p / 100 * len(values)))], 2) if values else None
+
+
+def dwell_stats(dwell):
+    """{state: [seconds per visit]} -> count, total hours, p50 and p95 per state."""
+    return {state: {"count": len(values), "total_hours": round(sum(values) / 3600, 1),
+                    "p50": percentile(sorted(values), 50), "p95": percentile(sorted(values), 95)}
+            for state, values in sorted(dwell.items())}
+
+
+def report(result):
+    lines = [
+        f"{result['days']} days simulated in {result['wall_seconds']}s.",
+        f"Slots: {result['hits']}/{result['slots']} hit ({100 * (result['hit_rate'] or 0):.2f}%), shutter error "
+        f"p50 {result['shutter_error_seconds']['p50']}s p95 {result['shutter_error_seconds']['p95']}s",
+        f"Radio: {result['radio_seconds_per_hour']}s/h, {result['switches']} switches ({result['failed_switches']} failed)",
+        f"Camera: awake {result['camera_awake_seconds_per_hour']}s/h, {result['wakes']} wakes, "
+        f"Wi-Fi died {result['camera_wifi_deaths']} times",
+        f"Pushes: {result['pushes']}",
+    ]
+    return "\n".join(lines + dwell_lines(result["dwell"]))
+
+
+def dwell_lines(stats_by_state):
+    lines = ["Dwell:"]
+    for state, stats in stats_by_state.items():
+        lines.append(f"  {state:<14} {stats['count']:>7} times, {stats['total_hours']:>8}h total, "
+                     f"p50 {stats['p50']}s, p95 {stats['p95']}s")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate the time-lapse main loop on a virtual clock.")
+    parser.add_argument("--days", type=float, default=180)
+    parser.add_argument("--config", help="config.json to simulate (default: the repo's)")
+    parser.add_argument("--profile", help="JSON with latency/failure overrides, see PROFILE")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print the numbers as JSON")
+    parser.add_argument("--verbose", action="store_true", help="keep the log on")
+    args = parser.parse_args(argv)
+
+    profile = None
+    if args.profile:
+        with open(args.profile, "r") as f:
+            profile = json.load(f)
+    result = run(args.days, args.config, profile, args.seed, verbose=args.verbose)
+    print(json.dumps(result, indent=2) if args.json else report(result))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
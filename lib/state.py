@@ -1,86 +1,187 @@
 
+import time
 import datetime
+import functools
 import lib.config as config
 import lib.wifi as wifi
+import lib.network as network
 import lib.notification
+import lib.batch as batch
+import lib.worker as worker
+import lib.recovery as recovery
+import lib.offline as offline
 
 from lib.logger import logger
+from lib.deadline import Deadline, DeadlineExceeded
 from lib.utilities import sync_time
 from lib.gopro import GoPro
+from lib.scheduler import Action, scheduler, planner
 
 class State:
+    """
+    One handler per state. Handlers don't set config.state, they return what happened
+    ("photo_due", "done", "failed", "offline"..) or None to stay, and lib/machine decides where that leads.
+    """
 
     def __init__(self):
         self.config = config.global_config
         self.wifi = wifi.wifi
-        self.gopro = GoPro()
+        self.network = network.network
+        # Camera calls in a child process we can kill if it hangs, unless that's turned off
+        self.gopro = worker.WorkerGoPro() if self.config.camera_worker_config.get("enabled") else GoPro()
+        self.scheduler = scheduler
+        self.planner = planner
         self.notification = lib.notification.Notification()
+        self.recovery = recovery.recovery
+        self.offline = offline.offline
+        # What handle_waiting last started, so the handler it hands over to knows which planned action it runs
+        self.action = None
+
+        # What the router window does. The clock runs alone and first, so everything after has the right time.
+        # Then lower priority starts first.
+        window_config = self.config.update_window_config
+        timeouts = window_config.get("timeouts", {})
+        self.update_batch = batch.TaskBatch("update window", workers=window_config.get("workers", 3))
+        self.update_batch.register("ntp", functools.partial(self._sync_time, timeouts.get("ntp", 20)), priority=0,
+                                   timeout=timeouts.get("ntp", 20), alone=True)
+        self.update_batch.register("status_push", self.notification.send_status, priority=1,
+                                   timeout=timeouts.get("status_push", 20))
+        self.update_batch.register("save_state", self.config.save_current_configs, priority=2,
+                                   timeout=timeouts.get("save_state", 5))
 
     def handle_waiting(self):
-        now = datetime.datetime.now()
-        minute = now.minute
-        second = now.second
-
-        if minute in self.config.photo_timer and second < 30:
-            if self.config.last_photo_minute != minute:
-                logger.info("It's time to take a photo. Transitioning to TAKE_PHOTO.")
-                self.config.state = "TAKE_PHOTO"
+        """
+        Sleeps until the next planned action (photo, keep-alive or update window) and starts it.
+        Photos start early, by as long as the wake usually takes, so the shutter fires on the target second.
+        """
+        actions = self.planner.upcoming(datetime.datetime.now())
+        if not actions:
+            logger.warning("Nothing planned for the next 24 hours. Check photo_timer, keep_alive and sun_plan in config.json.")
+            time.sleep(self.config.scheduler_config.get("max_idle_seconds", 30))
+            return None
+
+        logger.info("Next up: " + ", ".join(f"{a.kind} at {a.at:%H:%M:%S}" for a in actions))
+        # The switches for the hour. The handlers switch where this says to (NetworkPlanner.switch_for).
+        self.network.hour_plan(datetime.datetime.now())
+        action = actions[0]
+        self.action = action
+        self.recovery.planned(action)
+        if not self.planner.sleep_until(action.at):
+            # Not yet, we'll re-plan and keep waiting. One iwgetid, so a dropped GoPro Wi-Fi shows up now
+            # and not only when the next photo needs it.
+            return self._check_ssid()
+
+        if action.kind == "photo":
+            logger.info(f"It's time to take a photo for {action.slot:%H:%M:%S}. Transitioning to TAKE_PHOTO.")
+            self.config.next_photo_target = action.slot
+            return "photo_due"
+        elif action.kind == "keep_alive":
+            self.config.last_keep_alive_slot = action.slot
+            self.recovery.slot_done()
+            if self.config.capture_engine == "in_camera":
+                # Never power cycle the camera while it runs its own lapse. The status check keeps the wifi up.
+                try:
+                    self.gopro.supervise_lapse()
+                except Exception as e:
+                    logger.error(f"Error supervising the in-camera lapse: {e}")
             else:
-                logger.debug("Already took a photo this minute. Doing nothing.")
-        # Only 20 sec. here, because it usually takes 25 seconds to complete, and there's no need to do it twice
-        elif minute in self.config.keep_alive_timer and second < 20:
-            self.wifi.keep_alive(True)
-        else:
-            self.wifi.keep_alive(False)
+                # Whatever is left of it when the next photo has to start gets dropped, or handed over to the photo
+                next_photo = next((a for a in actions if a.kind == "photo"), None)
+                deadline = Deadline.at(next_photo.at if next_photo else None, "keep_alive")
+                try:
+                    on_gopro = self.network.switch_for(action, deadline)
+                except DeadlineExceeded as e:
+                    logger.warning(f"{e} Leaving this keep-alive to the photo.")
+                    return None
+                if not on_gopro or not self.gopro.keep_alive(deadline=deadline):
+                    return "offline"
+        elif action.kind == "send_update":
+            self.config.last_update_slot = action.slot
+            self.recovery.slot_done()
+            logger.info("Update window. Transitioning to SEND_UPDATE.")
+            return "update_due"
+        return None
+
+    def _started(self, kind, otherwise):
+        """The action handle_waiting started, if it was a `kind`. `otherwise` if we got here some other way (a restart)."""
+        return self.action if self.action is not None and self.action.kind == kind else otherwise
+
+    def _check_ssid(self):
+        if self.network.current() == "gopro":
+            return None
+        logger.warning("Not on the GoPro Wi-Fi anymore while waiting. Reconnecting.")
+        return None if self.network.ensure("gopro") else "offline"
 
     def handle_taking_photo(self):
         now = datetime.datetime.now()
-        minute = now.minute
-        second = now.second
+        target = self.config.next_photo_target or now.replace(second=0, microsecond=0)
+        # The slot is lost late_seconds after its target, so that's all the time the switch and the capture get
+        late = self.config.scheduler_config.get("late_seconds", 30)
+        deadline = Deadline.at(target + datetime.timedelta(seconds=late), f"photo {target:%H:%M:%S}")
 
-        gopro_ssid = self.config.gopro_config["ssid"]
-        if not self.wifi.ensure_wifi_connected(gopro_ssid):
+        try:
+            on_gopro = self.network.switch_for(self._started("photo", Action("photo", now, target)), deadline)
+        except DeadlineExceeded as e:
+            logger.error(f"{e} Giving up on this photo.")
+            return "failed"
+        if not on_gopro:
             # If we can’t connect to GoPro Wi-Fi, error out
-            logger.error(f"Failed to connect to GoPro Wi-Fi. We are in [{self.config.state}].")
-            return
+            logger.error("Failed to connect to GoPro Wi-Fi. Going OFFLINE_ALERT.")
+            return "offline"
 
         try:
-            self.gopro.take_photo()
-            self.config.last_photo_minute = datetime.datetime.now().minute
+            if self.config.capture_engine == "in_camera":
+                self.gopro.supervise_lapse()
+            else:
+                self.gopro.take_photo(deadline)
+                self.scheduler.record(target, now, self.gopro.last_shutter_at, waits=self.gopro.last_capture,
+                                      mode=self.gopro.last_plan, frames=self.gopro.last_frames)
+            self.config.last_photo_minute = target.minute
+            self.config.last_photo_target = target
+            self.recovery.captured(target, self.gopro.last_shutter_at if self.config.capture_engine != "in_camera" else None)
+            self.offline.reset()
+        except DeadlineExceeded as e:
+            # A missed slot, not a camera error: it doesn't count towards giving up on the camera
+            logger.error(f"{e} Giving up on this photo.")
+            return "failed"
         except Exception as e:
             logger.error(f"Error taking photo: {e}. Check logs for more info.")
             self.config.photo_capture_error_counter += 1
-            self.config.state = "ERROR"
+            return "failed"
 
-        if (minute == 51 and second > 20) or (minute == 52 and second < 30):
-            self.config.state = "SEND_UPDATE"
-        else:
-            self.config.state = "WAITING"
+        # The update window is planned on its own now (send_update.minutes), not squeezed in after a photo
+        return "done"
 
     def handle_sending_update(self):
         """
-        Switch to router Wi-Fi, time sync, send status, save state,
+        Switch to router Wi-Fi, run the update batch (time sync, status push, save state) under one budget,
         then switch back to GoPro Wi-Fi to keep it alive. Return to WAITING when done.
         """
-        router_ssid = self.config.router_config["ssid"]
+        # Going anyway means coming back late for the camera, or bouncing between SSIDs. Next window, a few times.
+        if self.network.skip_window():
+            return "done"
 
-        if not self.wifi.ensure_wifi_connected(router_ssid):
-            logger.error(f"Failed to connect to {router_ssid}. ERROR.")
-            self.config.state = "ERROR"
-            return
+        now = datetime.datetime.now()
+        if not self.network.switch_for(self._started("send_update", Action("send_update", now, now))):
+            logger.error("Failed to connect to the router Wi-Fi. ERROR.")
+            return "failed"
 
-        sync_time()
-        self.notification.send_status()
-        self.config.save_current_configs()
+        self.update_batch.run(self.network.window_budget())
+        self.network.window_done()
 
-        gopro_ssid = self.config.gopro_config["ssid"]
-        if not self.wifi.ensure_wifi_connected(gopro_ssid):
-            logger.error(f"Failed to reconnect to {gopro_ssid} after sending status. ERROR.")
-            self.config.state = "ERROR"
-            return
+        # The plan's switch back is timed for the next photo/keep-alive, we take it as soon as the window is done
+        if not self.network.ensure("gopro"):
+            logger.error("Failed to reconnect to the GoPro Wi-Fi after sending status. ERROR.")
+            return "failed"
 
         logger.info("Update complete. Returning to WAITING.")
-        self.config.state = "WAITING"
+        return "done"
+
+    def _sync_time(self, timeout):
+        if not sync_time(timeout=timeout):
+            return False
+        self.config.last_time_sync = datetime.datetime.now()
+        return True
 
     def handle_errors(self):
         """
@@ -91,28 +192,26 @@ class State:
 
         if self.config.error_retries_counter < self.config.max_error_retries:
             logger.info("Will attempt to recover by returning to WAITING.")
-            self.config.state = "WAITING"
+            return "retry"
         elif self.config.photo_capture_error_counter > 3:
             logger.error \
-                (f"Too many photo capture errors {self.config.photo_capture_error_counter}. Will attempt to recover by returning to WAITING.")
-            self.config.state = "OFFLINE_ALERT"
+                (f"Too many photo capture errors {self.config.photo_capture_error_counter}. Going OFFLINE_ALERT.")
+            return "give_up"
         else:
             logger.error("Exceeded max error retries. Considering a forced reboot or state reset.")
             # if more than 5 minutes passed.. there is a good chance GoPro is off, so we can't recover.
             # todo: add a check to see if GoPro is reachable before rebooting
-            self.config.state = "WAITING"
             self.config.error_retries_counter = 0
+            return "retry"
 
     def handle_being_offline(self):
         """
-        Repeatedly tries to connect to router Wi-Fi,
-        then attempts GoPro Wi-Fi. If both fail, remains offline.
+        Tries to get back on the GoPro Wi-Fi, with exponential backoff between tries and cheap checks first
+        (see lib/offline). Between tries we just wait, no radio.
 
         - Send one immediate 'GoPro offline' notification if this is the first time.
-        - Then send repeated notifications every 20 minutes if it remains offline (and there's internet).
+        - Then send repeated notifications every 20 minutes while it stays offline (and the router is there).
         """
-        router_ssid = self.config.router_config["ssid"]
-        gopro_ssid = self.config.gopro_config["ssid"]
         now = datetime.datetime.now()
 
         # Make sure the attribute exists
@@ -120,48 +219,36 @@ class State:
             # We have no recorded time in config, so treat this as “offline for 30 minutes already”
             self.config.last_offline_alert_time = now - datetime.timedelta(minutes=30)
 
-        router_is_up = self.wifi.ensure_wifi_connected(router_ssid)
-        gopro_is_up = False
-
-        if router_is_up:
-            gopro_is_up = self.wifi.ensure_wifi_connected(gopro_ssid)
-
-        if router_is_up and gopro_is_up:
-            # Fully online: reset everything
-            logger.info("Router AND GoPro reconnected. Returning to WAITING.")
-            self.notification.send_status()
-            self.config.state = "WAITING"
+        if self.offline.due(now) and self.offline.attempt(now):
+            # Fully online: reset everything. The next update window tells the phone.
+            logger.info("GoPro reconnected. Returning to WAITING.")
             self.config.last_offline_alert_time = None
             self.config.sending_alert_every_20_min = False
-        else:
-            # Either router is down, or GoPro is down (or both)
-            if not self.config.last_offline_alert_time:
-                self.config.last_offline_alert_time = now
-
-            time_since_last_offline = now - self.config.last_offline_alert_time
-
-            # If the router is offline, you might restart or do something else here...
-            if not router_is_up:
-                logger.warning("Router is offline, remain in OFFLINE_ALERT.")
-                # self.restart_wifi()
-                # Possibly bail out early, since we can’t reach the GoPro if router is off
-                return
-
-            # Otherwise, router is up but GoPro is offline
-            if time_since_last_offline.total_seconds() >= 1200:  # 20-minute repeat
+            return "online"
+
+        time_since_last_offline = now - self.config.last_offline_alert_time
+        repeat = time_since_last_offline.total_seconds() >= 1200  # 20-minute repeat
+        if repeat or not self.config.sending_alert_every_20_min:
+            # Alerts need the router. Not counted against the radio budget, you want to hear about this.
+            if not self.network.ensure("router"):
+                logger.warning("Router is offline too, remain in OFFLINE_ALERT.")
+            elif repeat:
                 self.notification.send_alert(
                     title="GoPro OFFLINE!",
-                    message=f"STILL cannot connect to GoPro. [20 min repeat]."
+                    message=f"STILL cannot connect to GoPro. [20 min repeat]. {self.offline.summary()}"
                 )
                 self.config.last_offline_alert_time = now
             else:
                 # If we haven't started the repeating cycle, send that immediate “first offline” alert
-                if not self.config.sending_alert_every_20_min:
-                    self.notification.send_alert(
-                        title="GoPro OFFLINE!",
-                        message="I cannot connect to GoPro. Sending first-time alert now."
-                    )
-                    self.config.sending_alert_every_20_min = True
-                    self.config.last_offline_alert_time = now
+                self.notification.send_alert(
+                    title="GoPro OFFLINE!",
+                    message=f"I cannot connect to GoPro. Sending first-time alert now. {self.offline.summary()}"
+                )
+                self.config.sending_alert_every_20_min = True
+                self.config.last_offline_alert_time = now
+
+        if self.offline.next_attempt is not None:
+            self.planner.sleep_until(self.offline.next_attempt)
+        return None
 
 handler = State()
\ No newline at end of file
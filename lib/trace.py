@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+
+# A bad night in the field used to be a log file and a guess. With trace.record on in config.json, every call that
+# leaves the Pi is written to data_path/traces: nmcli, ping, ntpdate and vcgencmd (subprocess.run), camera HTTP
+# (session probes and goprocam), PushBullet, each with how long it took and the wall clock offset at the time.
+# Replay feeds that back into the real Timelapse loop on a replay clock, so the same night runs on a dev box,
+# and a change can be shown to cut cycle time or radio time on the very same inputs:
+#
+#   python -m lib.trace replay /home/timelapse/data/traces/trace_2025_03_21_020000.jsonl [--json] [--verbose]
+#
+# One line per call: [seconds since start, wall - monotonic offset, kind, key, seconds it took, result].
+# The first line is the header: config.json (no passwords or API key) and the data files as they were at the start.
+# Passwords are taken out of commands before they're written. Only what we read back is kept, nothing is streamed.
+# The camera worker picks the recording up where the main process is (Recorder.resume), both write whole lines
+# to the same file.
+
+import os
+import re
+import sys
+import json
+import time
+import base64
+import shutil
+import socket
+import argparse
+import datetime
+import tempfile
+import threading
+import subprocess
+import collections
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from lib.logger import logger
+from lib.simulation import SimulationOver, simulation_config, virtual_time, dwell_stats, dwell_lines
+
+TRACE_VERSION = 1
+REDACTED = base64.b64encode(b"redacted").decode()
+SECRETS = [(re.compile(r"password '[^']*'"), "password '***'"), (re.compile(r"password (?!')\S+"), "password ***")]
+# Whatever runs nmcli is on the radio
+RADIO_COMMANDS = ("nmcli",)
+
+
+def command_key(args):
+    text = args if isinstance(args, str) else " ".join(str(a) for a in args)
+    for pattern, replacement in SECRETS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def url_key(url):
+    # The camera's IP changes between setups, the path is what matters
+    parts = urllib.parse.urlsplit(url if isinstance(url, str) else url.full_url)
+    return parts.path + ("?" + parts.query if parts.query else "")
+
+
+def _text(value):
+    if value is None:
+        return None
+    return value.decode("utf-8", "replace") if isinstance(value, bytes) else value
+
+
+class _Body:
+    """What urlopen returns, after we've read it all."""
+
+    def __init__(self, body):
+        self.body = body
+
+    def read(self, *args):
+        return self.body
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _PushResponse:
+
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+
+class Recorder:
+
+    def __init__(self):
+        self.fd = None
+        self.path = None
+        self.started = None
+        self.real = {}
+
+    def start(self, directory=None):
+        """Starts recording if trace.record is on in config.json. Returns the trace path, or None."""
+        import lib.config as config
+        trace_config = config.global_config.trace_config
+        if not trace_config.get("record"):
+            return None
+        directory = directory or trace_config.get("path") or os.path.join(config.global_config.data_path, "traces")
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"trace_{datetime.datetime.now():%Y_%m_%d_%H%M%S}.jsonl")
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        self.started = time.monotonic()
+        self._write({"trace": TRACE_VERSION, "at": datetime.datetime.now().isoformat(timespec="milliseconds"),
+                     "monotonic": self.started, "offset": round(time.time() - self.started, 3),
+                     "config": redacted_config(config.global_config.config),
+                     "files": snapshot(config.global_config.data_path)})
+        self.install()
+        logger.info(f"Recording a trace to {self.path}")
+        return self.path
+
+    def resume(self, path, started):
+        """Carries on with the main process's trace, in the camera worker (lib/worker)."""
+        self.path, self.started = path, started
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+        self.install()
+
+    def install(self):
+        import requests
+        self.real = {"run": subprocess.run, "urlopen": urllib.request.urlopen, "post": requests.post}
+        subprocess.run = self.run
+        urllib.request.urlopen = self.urlopen
+        requests.post = self.post
+
+    def _write(self, row):
+        os.write(self.fd, (json.dumps(row, separators=(",", ":")) + "\n").encode())
+
+    def event(self, kind, key, started, result):
+        now = time.monotonic()
+        self._write([round(started - self.started, 3), round(time.time() - now, 3), kind, key,
+                     round(now - started, 3), result])
+
+    def run(self, args, *a, **kwargs):
+        started = time.monotonic()
+        key = command_key(args)
+        try:
+            result = self.real["run"](args, *a, **kwargs)
+        except subprocess.TimeoutExpired:
+            self.event("run", key, started, {"x": "timeout"})
+            raise
+        except subprocess.CalledProcessError as e:
+            self.event("run", key, started, {"rc": e.returncode, "out": _text(e.stdout), "err": _text(e.stderr)})
+            raise
+        except OSError as e:
+            self.event("run", key, started, {"x": "oserror", "m": str(e)})
+            raise
+        self.event("run", key, started, {"rc": result.returncode, "out": _text(result.stdout), "err": _text(result.stderr)})
+        return result
+
+    def urlopen(self, url, *a, **kwargs):
+        started = time.monotonic()
+        key = url_key(url)
+        try:
+            body = self.real["urlopen"](url, *a, **kwargs).read()
+        except urllib.error.HTTPError as e:
+            self.event("http", key, started, {"x": "http", "c": e.code})
+            raise
+        except Exception as e:
+            self.event("http", key, started, {"x": type(e).__name__, "m": str(e)})
+            raise
+        self.event("http", key, started, {"b": _text(body)})
+        return _Body(body)
+
+    def post(self, url, *a, **kwargs):
+        # PushBullet: the title says which push it was, the token and the body stay out of the trace
+        started = time.monotonic()
+        key = "push:" + (kwargs.get("json") or {}).get("title", "")
+        try:
+            resp = self.real["post"](url, *a, **kwargs)
+        except Exception as e:
+            self.event("push", key, started, {"x": type(e).__name__, "m": str(e)})
+            raise
+        self.event("push", key, started, {"s": resp.status_code, "t": resp.text[:200]})
+        return resp
+
+
+def redacted_config(raw):
+    cfg = json.loads(json.dumps(raw))
+    for section in ("router", "gopro"):
+        if "pwd" in cfg.get(section, {}):
+            cfg[section]["pwd"] = REDACTED
+    if "api_key" in cfg.get("pushbullet", {}):
+        cfg["pushbullet"]["api_key"] = "redacted"
+    return cfg
+
+
+def snapshot(data_path):
+    """The JSON files in data_path: what the loop had learned when the recording started."""
+    files = {}
+    try:
+        names = sorted(os.listdir(data_path))
+    except OSError:
+        return files
+    for name in names:
+        if name.endswith(".json"):
+            try:
+                with open(os.path.join(data_path, name), "r") as f:
+                    files[name] = json.load(f)
+            except (OSError, ValueError):
+                pass
+    return files
+
+
+def load(path):
+    """(header, rows) of a trace file. A line cut short by a crash is skipped."""
+    header, rows = None, []
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(row, dict):
+                header = header or row
+            else:
+                rows.append(row)
+    if header is None:
+        raise ValueError(f"{path} has no trace header")
+    rows.sort(key=lambda row: row[0])
+    return header, rows
+
+
+class ReplayClock:
+    """Monotonic clock that only moves when a call or a sleep says so. The wall clock follows the trace's offset."""
+
+    def __init__(self, start, offset, end):
+        self.mono = start
+        self.offset = offset
+        self.end = end
+        self.lock = threading.Lock()
+
+    def time(self):
+        return self.mono + self.offset
+
+    def monotonic(self):
+        return self.mono
+
+    def advance(self, seconds):
+        with self.lock:
+            self.mono += max(0.0, seconds)
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+        if self.mono >= self.end:
+            raise SimulationOver()
+
+
+class Replay:
+    """
+    Hands out the recorded results, per kind and key in the order they were recorded. Each call costs the
+    recorded time, unless the code now gives it a shorter timeout. Calls the trace doesn't have get the last
+    result for the same key again, or a failure if the key was never seen. Both are counted.
+    """
+
+    def __init__(self, header, rows, clock):
+        self.clock = clock
+        self.queues = collections.defaultdict(collections.deque)
+        for row in rows:
+            self.queues[(row[2], row[3])].append(row)
+        self.last = {}
+        self.matched = 0
+        self.repeated = 0
+        self.missing = collections.Counter()
+        self.seconds = collections.Counter()   # replayed seconds per program / kind
+
+    def take(self, kind, key):
+        queue = self.queues.get((kind, key))
+        if queue:
+            row = queue.popleft()
+            self.matched += 1
+            self.last[(kind, key)] = row
+        elif (kind, key) in self.last:
+            row = self.last[(kind, key)]
+            self.repeated += 1
+        else:
+            self.missing[f"{kind} {key}"] += 1
+            return None
+        self.clock.offset = row[1]
+        return row
+
+    def _spend(self, label, seconds, timeout):
+        # True if the call ran into the timeout the code gave it
+        cut = timeout is not None and seconds > timeout
+        seconds = timeout if cut else seconds
+        self.clock.advance(seconds)
+        self.seconds[label] += seconds
+        return cut
+
+    def run(self, args, *a, **kwargs):
+        key = command_key(args)
+        program = next((p for p in RADIO_COMMANDS if p in key), key.replace("sudo ", "").split(" ")[0])
+        row = self.take("run", key)
+        if row is None:
+            self._spend(program, 0.1, None)
+            result = {"rc": 1, "out": "", "err": "not in the trace"}
+        else:
+            result = row[5]
+            if self._spend(program, row[4], kwargs.get("timeout")) or result.get("x") == "timeout":
+                raise subprocess.TimeoutExpired(args, kwargs.get("timeout") or row[4])
+            if result.get("x") == "oserror":
+                raise OSError(result.get("m"))
+
+        def output(name, value):
+            # Only what the caller asked to capture, as str or bytes like the real thing
+            if not (kwargs.get("capture_output") or kwargs.get(name) == subprocess.PIPE):
+                return None
+            value = value or ""
+            return value if kwargs.get("text") or kwargs.get("universal_newlines") else value.encode()
+
+        out, err = output("stdout", result.get("out")), output("stderr", result.get("err"))
+        if kwargs.get("check") and result["rc"] != 0:
+            raise subprocess.CalledProcessError(result["rc"], args, out, err)
+        return subprocess.CompletedProcess(args, result["rc"], out, err)
+
+    def urlopen(self, url, *a, **kwargs):
+        key = url_key(url)
+        row = self.take("http", key)
+        if row is None:
+            self._spend("http", 1.0, kwargs.get("timeout"))
+            raise urllib.error.URLError("not in the trace")
+        result, seconds = row[5], row[4]
+        if self._spend("http", seconds, kwargs.get("timeout")):
+            raise socket.timeout("timed out")
+        if result.get("x") == "http":
+            raise urllib.error.HTTPError(url if isinstance(url, str) else url.full_url, result["c"], "", None, None)
+        if "x" in result:
+            if result["x"] in ("timeout", "TimeoutError"):
+                raise socket.timeout(result.get("m"))
+            raise urllib.error.URLError(result.get("m"))
+        return _Body(result["b"].encode())
+
+    def post(self, url, *a, **kwargs):
+        import requests
+        key = "push:" + (kwargs.get("json") or {}).get("title", "")
+        row = self.take("push", key)
+        if row is None:
+            self._spend("push", 0.5, None)
+            return _PushResponse(503, "not in the trace")
+        result, seconds = row[5], row[4]
+        if self._spend("push", seconds, kwargs.get("timeout")):
+            raise requests.exceptions.Timeout("timed out")
+        if "x" in result:
+            raise requests.exceptions.ConnectionError(result.get("m"))
+        return _PushResponse(result["s"], result["t"])
+
+
+class _NoSocket:
+    """Keep-alive datagrams and WOL packets: on replay they go nowhere."""
+
+    AF_INET = socket.AF_INET
+    SOCK_DGRAM = socket.SOCK_DGRAM
+    SOL_SOCKET = socket.SOL_SOCKET
+    SO_BROADCAST = socket.SO_BROADCAST
+    timeout = socket.timeout
+
+    def socket(self, *args):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def recorded_summary(rows):
+    seconds = collections.Counter()
+    for row in rows:
+        if row[2] == "run":
+            seconds["radio" if any(p in row[3] for p in RADIO_COMMANDS) else "commands"] += row[4]
+        else:
+            seconds[row[2]] += row[4]
+    return {"seconds": round(rows[-1][0] + rows[-1][4], 1) if rows else 0.0, "calls": len(rows),
+            "radio_seconds": round(seconds["radio"], 1), "http_seconds": round(seconds["http"], 1)}
+
+
+def replay(path, verbose=False):
+    """Runs the real main loop on the trace at `path` and returns the numbers, next to the recorded ones."""
+    header, rows = load(path)
+    workdir = tempfile.mkdtemp(prefix="timelapse-replay-")
+    recorded_config = os.path.join(workdir, "recorded.json")
+    with open(recorded_config, "w") as f:
+        json.dump(header["config"], f)
+    # Same config as in the field, so the loop re-plans as often as it did there
+    os.environ["TIMELAPSE_CONFIG"] = simulation_config(recorded_config, workdir, max_idle_seconds=None)
+    os.environ.pop("NOTIFY_SOCKET", None)
+    data_path = os.path.join(workdir, "data")
+
+    import logging
+    import requests
+    import goprocam.GoProCamera as GoProCamera
+    import lib.config as config
+    import lib.wifi as wifi
+    import lib.machine as machine
+    import lib.utilities as utilities
+    from timelapse import Timelapse
+
+    if config.global_config.config_path != os.environ["TIMELAPSE_CONFIG"]:
+        raise RuntimeError("lib was imported before the replay could point it to the recorded config. "
+                           "Run it in a fresh interpreter: python -m lib.trace replay")
+    if not verbose:
+        logger.setLevel(logging.CRITICAL)
+
+    end = header["monotonic"] + (rows[-1][0] + rows[-1][4] if rows else 0.0)
+    clock = ReplayClock(header["monotonic"], header["offset"], end)
+    source = Replay(header, rows, clock)
+
+    dwell = {}
+    record = machine.machine._record
+
+    def recording(state_name, event, target, now, seconds):
+        dwell.setdefault(state_name, []).append(seconds)
+        record(state_name, event, target, now, seconds)
+
+    machine.machine._record = recording
+    no_socket = _NoSocket()
+    patches = [
+        (subprocess, "run", source.run),
+        (urllib.request, "urlopen", source.urlopen),
+        (requests, "post", source.post),
+        (wifi, "socket", no_socket),
+        (GoProCamera, "socket", no_socket),
+    ]
+    # In memory like in the simulator, starting from what was on disk when the recording started
+    files = {os.path.join(data_path, name): content for name, content in header.get("files", {}).items()}
+    for module in list(sys.modules.values()):
+        if getattr(module, "__name__", "").startswith("lib.") and getattr(module, "save_json", None) is utilities.save_json:
+            patches.append((module, "save_json", files.__setitem__))
+            patches.append((module, "load_json", files.get))
+    originals = [(module, name, getattr(module, name)) for module, name, _ in patches]
+    for module, name, value in patches:
+        setattr(module, name, value)
+
+    start = clock.monotonic()
+    wall_start = time.perf_counter()
+    try:
+        with virtual_time(clock):
+            try:
+                Timelapse().main_loop()
+            except SimulationOver:
+                pass
+    finally:
+        for module, name, value in originals:
+            setattr(module, name, value)
+        machine.machine._record = record
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    radio = sum(seconds for label, seconds in source.seconds.items() if label in RADIO_COMMANDS)
+    return {
+        "trace": path,
+        "recorded": recorded_summary(rows),
+        "replayed": {
+            "seconds": round(clock.monotonic() - start, 1),
+            "calls": source.matched,
+            "radio_seconds": round(radio, 1),
+            "http_seconds": round(source.seconds["http"], 1),
+        },
+        "repeated": source.repeated,
+        "missing": dict(source.missing.most_common(10)),
+        "unused": sum(len(queue) for queue in source.queues.values()),
+        "wall_seconds": round(time.perf_counter() - wall_start, 1),
+        "dwell": dwell_stats(dwell),
+    }
+
+
+def report(result):
+    recorded, replayed = result["recorded"], result["replayed"]
+    lines = [
+        f"Replayed {result['trace']} in {result['wall_seconds']}s.",
+        f"  {'':<10} {'seconds':>10} {'calls':>7} {'radio s':>9} {'http s':>8}",
+        f"  {'recorded':<10} {recorded['seconds']:>10} {recorded['calls']:>7} {recorded['radio_seconds']:>9} "
+        f"{recorded['http_seconds']:>8}",
+        f"  {'replayed':<10} {replayed['seconds']:>10} {replayed['calls']:>7} {replayed['radio_seconds']:>9} "
+        f"{replayed['http_seconds']:>8}",
+        f"Calls not in the trace: {sum(result['missing'].values())}, answered again: {result['repeated']}, "
+        f"recorded but never asked for: {result['unused']}",
+    ]
+    lines += [f"  {count:>5}x {call}" for call, count in result["missing"].items()]
+    return "\n".join(lines + dwell_lines(result["dwell"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded trace through the time-lapse main loop.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    replay_parser = commands.add_parser("replay", help="run the main loop on a recorded trace")
+    replay_parser.add_argument("trace")
+    replay_parser.add_argument("--json", action="store_true", help="print the numbers as JSON")
+    replay_parser.add_argument("--verbose", action="store_true", help="keep the log on")
+    args = parser.parse_args(argv)
+
+    result = replay(args.trace, verbose=args.verbose)
+    print(json.dumps(result, indent=2) if args.json else report(result))
+
+
+recorder = Recorder()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
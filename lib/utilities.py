@@ -1,20 +1,24 @@
 
+import os
+import json
 import datetime
 import subprocess
 from lib.logger import logger
 
 # This class is a collection of utility functions that are used in multiple places
 
-def sync_time():
+def sync_time(timeout=20):
     try:
         logger.info("Syncing time via ntpdate..")
         subprocess.run(["sudo", "ntpdate", "-u", "pool.ntp.org"], check=True,
-                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                       stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
         logger.info("Time sync successful.")
+        return True
     except subprocess.CalledProcessError as e:
         logger.error(f"Time sync failed: {e}")
     except Exception as e:
         logger.error(f"Unexpected error in time sync: {e}")
+    return False
 
 def rpi_temp():
     try:
@@ -34,3 +38,37 @@ def from_iso_format_fallback(iso_string):  # Python 3.6 compatibility
         return datetime.datetime.strptime(iso_string, "%Y-%m-%dT%H:%M:%S.%f")
     except ValueError:
         return datetime.datetime.strptime(iso_string, "%Y-%m-%dT%H:%M:%S")
+
+def load_json(path, default):
+    # Small persisted files (history, learned values..). A missing or broken file just means we start fresh.
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except Exception as e:
+        logger.error(f"Could not load {path}, starting fresh: {e}")
+        return default
+
+# Only the main process writes the data files. The camera worker (lib/worker) sets this to a dict, and what it
+# would have saved ends up here as {path: text}, for the main process to write.
+held_writes = None
+
+def save_json(path, data):
+    try:
+        # One compact dumps is the C encoder, indent or dump() fall back to the pure Python one. Some of these
+        # files are rewritten after every photo.
+        text = json.dumps(data, separators=(",", ":"))
+        if held_writes is not None:
+            held_writes[path] = text
+            return
+        write_text(path, text)
+    except Exception as e:
+        logger.error(f"Failed to save {path}: {e}")
+
+def write_text(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)  # never leave a half written file behind
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+# systemd's watchdog instead of the cron job that restarted us when the log went quiet for 40 seconds.
+# With Type=notify and WatchdogSec in service/timelapse.service, we tell systemd we're up (READY=1) and keep
+# telling it we're alive (WATCHDOG=1) from the main loop and from every loop that waits on something.
+# If the pings stop for WatchdogSec, systemd kills and restarts the service. A quiet log is fine now.
+# It's the sd_notify protocol itself (one datagram on a unix socket), no python-systemd needed.
+
+import os
+import time
+import socket
+
+from lib.logger import logger
+
+
+class Watchdog:
+
+    def __init__(self, environ=None):
+        environ = os.environ if environ is None else environ
+        self.pid = os.getpid()
+        self.socket_path = environ.get("NOTIFY_SOCKET")
+        usec = environ.get("WATCHDOG_USEC")
+        watchdog_pid = environ.get("WATCHDOG_PID")
+        # WATCHDOG_PID says who the watchdog is meant for. Not us (a shell in ExecStart that didn't exec), no pings.
+        self.foreign_pid = int(watchdog_pid) if watchdog_pid and int(watchdog_pid) != self.pid else None
+        self.seconds = int(usec) / 1e6 if usec and self.foreign_pid is None else None
+        self.last_ping = None
+        self.status = None
+        self.pings = 0
+        self.failed = False
+
+    def enabled(self):
+        # Only the main process talks to systemd. The camera worker has its own copy of this object, but not the job.
+        return self.socket_path is not None and os.getpid() == self.pid
+
+    def notify(self, *lines):
+        """Sends one sd_notify message ("READY=1", "WATCHDOG=1", "STATUS=..."). False if there's no one to tell."""
+        if not self.enabled():
+            return False
+        address = self.socket_path
+        if address.startswith("@"):
+            address = "\0" + address[1:]  # abstract namespace
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+                sock.sendto("\n".join(lines).encode(), address)
+            self.failed = False
+            return True
+        except OSError as e:
+            # log it once, not on every ping
+            if not self.failed:
+                logger.error(f"Couldn't notify systemd at {self.socket_path}: {e}")
+            self.failed = True
+            return False
+
+    def ready(self, status=None):
+        if self.foreign_pid is not None:
+            logger.error(f"systemd's watchdog is meant for pid {self.foreign_pid}, not us ({self.pid}). No pings, so "
+                         f"systemd will restart us. Does ExecStart exec python?")
+        lines = ["READY=1"] + ([f"STATUS={status}"] if status else [])
+        if self.notify(*lines):
+            self.status = status
+            self.last_ping = time.monotonic()
+            logger.info(f"Told systemd we're up. Watchdog: "
+                        + (f"{self.seconds:.0f}s." if self.seconds else "off."))
+
+    def ping(self, status=None):
+        """
+        WATCHDOG=1, at most every quarter of WatchdogSec so it's cheap to call from any loop.
+        A new `status` (shown in systemctl status) goes out right away.
+        """
+        if self.seconds is None and status is None:
+            return False
+        now = time.monotonic()
+        changed = status is not None and status != self.status
+        due = self.seconds is not None and (self.last_ping is None or now - self.last_ping >= self.seconds / 4)
+        if not changed and not due:
+            return False
+        lines = (["WATCHDOG=1"] if self.seconds is not None else []) + ([f"STATUS={status}"] if changed else [])
+        if not self.notify(*lines):
+            return False
+        if changed:
+            self.status = status
+        if self.seconds is not None:
+            self.last_ping = now
+            self.pings += 1
+        return True
+
+    def stopping(self):
+        self.notify("STOPPING=1")
+
+watchdog = Watchdog()
@@ -6,8 +6,8 @@ import time
 import socket
 import lib.config as config
 
-from goprocam import GoProCamera, constants
 from lib.logger import logger
+from lib.watchdog import watchdog
 
 
 class Wifi:
@@ -15,17 +15,22 @@ class Wifi:
     def __init__(self):
         self.config = config.global_config
 
-    def check_network_reachable(self, ip, retries=5, delay=4):
+    def check_network_reachable(self, ip, retries=5, delay=4, deadline=None):
+        if deadline is not None:
+            # a ping takes a second or so, plus the delay before the next one
+            retries = deadline.tries(retries, delay + 1, f"ping {ip}")
         for attempt in range(retries):
             try:
-                subprocess.run(["ping", "-c", "1", ip], check=True, stdout=subprocess.DEVNULL)
+                timeout = None if deadline is None else deadline.clamp(10, f"ping {ip}")
+                subprocess.run(["ping", "-c", "1", ip], check=True, stdout=subprocess.DEVNULL, timeout=timeout)
                 logger.info(f"Network is reachable at {ip}")
                 return True
-            except subprocess.CalledProcessError:
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
                 logger.warning(f"Ping to {ip} failed. Attempt {attempt + 1}/{retries}.")
                 if attempt == 5:
                     self.restart_wifi()
-                time.sleep(delay)
+                if attempt + 1 < retries:
+                    time.sleep(self._settle(delay, deadline))
         logger.error(f"Network not reachable after {retries} attempts.")
         return False
 
@@ -37,31 +42,58 @@ class Wifi:
 
         logger.info(f"Connecting to Wi-Fi: {ssid}")
         if not self.switch_wifi(ssid):
-            config.global_config.state = "OFFLINE_ALERT"
-            logger.error(f"Could not connect to {ssid} ->  We are in [{config.global_config.state}].")
+            logger.error(f"Could not connect to {ssid}.")
             return False
         return True
 
-    def switch_wifi(self, target_ssid):
+    def switch_wifi(self, target_ssid, deadline=None):
+        """
+        nmcli connect, up to 5 tries. With a `deadline` (lib.deadline) only the tries that still fit are made,
+        nmcli gets killed when it runs past it and the settle sleeps are cut to what's left.
+        """
         pwd = self.choose_wifi_password(target_ssid)
-        max_tries = 5
+        max_tries = 5 if deadline is None else deadline.tries(5, 10, f"connect {target_ssid}")
         for attempt in range(max_tries):
             logger.info(f"Trying to connect to {target_ssid}, attempt {attempt + 1}/{max_tries}")
+            watchdog.ping()
             try:
-                cmd = f"sudo nmcli dev wifi connect '{target_ssid}' password '{pwd}'"
-                subprocess.run(cmd, shell=True, check=True)
-                time.sleep(5)  # wait for wi-fi to settle
+                # -w 30: nmcli waits up to 90s by default, longer than the systemd watchdog gives us
+                cmd = f"sudo nmcli -w 30 dev wifi connect '{target_ssid}' password '{pwd}'"
+                started = time.monotonic()
+                subprocess.run(cmd, shell=True, check=True,
+                               timeout=None if deadline is None else deadline.clamp(30, f"connect {target_ssid}"))
+                time.sleep(self._settle(5, deadline))  # wait for wi-fi to settle
+                if deadline is not None:
+                    deadline.spent(f"connect {target_ssid}", time.monotonic() - started)
                 if (self.get_current_wifi() or "").lower() == target_ssid.lower():
                     logger.info(f"Connected to {target_ssid} successfully.")
                     return True
-            except subprocess.CalledProcessError as e:
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
                 logger.warning(f"sudo nmcli connect attempt failed. SSID not found or password is incorrect. Message: {e}")
                 logger.debug(f"ssid: {target_ssid}, pwd: {pwd}")
-                time.sleep(3)
+                time.sleep(self._settle(3, deadline))
 
         logger.error(f"Failed to connect to {target_ssid} after {max_tries} tries.")
         return False
 
+    @staticmethod
+    def _settle(seconds, deadline):
+        return seconds if deadline is None else max(0.0, min(seconds, deadline.remaining()))
+
+    def visible_ssids(self, timeout=15):
+        """SSIDs in range, from one nmcli scan. No connect, nothing changes. None if the scan itself failed."""
+        try:
+            result = subprocess.run(["sudo", "nmcli", "-t", "-f", "ssid", "dev", "wifi", "list", "--rescan", "yes"],
+                                    capture_output=True, text=True, timeout=timeout)
+        except (subprocess.TimeoutExpired, OSError) as e:
+            logger.warning(f"Wi-Fi scan failed: {e}")
+            return None
+        if result.returncode != 0:
+            logger.warning(f"Wi-Fi scan failed: {result.stderr.strip()}")
+            return None
+        # -t escapes colons in SSIDs
+        return {line.replace("\\:", ":") for line in result.stdout.splitlines() if line}
+
     def restart_wifi(self):
         logger.info("Restarting Wi-Fi interface..")
         subprocess.run(["sudo", "ifdown", "wlan0"])
@@ -73,42 +105,13 @@ class Wifi:
         else:
             logger.error("Wi-Fi restart failed. Manual intervention required.")
 
-    def keep_alive(self, send_wol):
-        logger.info("Attempting to keep GoPro Wi-Fi alive..")
-
+    def keep_alive(self):
+        """Makes sure we stay on the GoPro Wi-Fi. The camera side of the keep-alive lives in lib/gopro (shared session)."""
         gopro_ssid = self.config.gopro_config["ssid"]
         if not self.ensure_wifi_connected(gopro_ssid):
             logger.warning("Cannot keep alive because we can't connect to GoPro Wi-Fi.")
-            return  # We’re probably in OFFLINE_ALERT or ERROR now
-
-        if send_wol:
-            self.send_wol(self.config.gopro_config["mac"])
-            time.sleep(3)  # short sleep to let the packet settle
-            self.send_wol(self.config.gopro_config["mac"])
-
-            if not self.check_network_reachable(self.config.gopro_config["ip"]):
-                logger.error("GoPro not reachable even after sending WOL. Possibly off already. But why?!")
-                return
-
-            try:
-                gopro = GoProCamera.GoPro(self.config.gopro_config["ip"])
-                logger.info(f"Connected to GoPro. {gopro}")
-                gopro.power_on()
-                time.sleep(2)
-                gopro.mode(constants.Mode.PhotoMode)
-                time.sleep(3)
-            except Exception as e:
-                logger.error(f"Error controlling GoPro in keep_alive: {e}")
-                return
-
-            try:
-                logger.info("Coolio. Going back to sleep for now.. Still in WAITING.")
-                gopro.power_off()
-                time.sleep(3)
-            except Exception as e:
-                logger.error(f"Error powering off GoPro in keep_alive: {e}")
-                return
-        logger.info("keep_alive sequence completed.")
+            return False
+        return True
 
     def send_wol(self, mac_address):
         try:
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+# Camera calls sometimes just hang, and the only cure used to be the heartbeat restarting the whole service.
+# Now the camera work (capture, keep-alive, lapse supervision, listing..) runs in a child process we talk to
+# over a pipe. If it doesn't answer in time we kill it and start a new one, which takes a fraction of a second,
+# and the state machine carries on with its timers as if the call had failed.
+# The main process owns the state: every request carries it to the child, every reply carries back what the call
+# changed and the files it would have written, and only the main process writes them (utilities.held_writes).
+
+import copy
+import time
+import signal
+import datetime
+import collections
+import multiprocessing
+import multiprocessing.forkserver
+import lib.config as config
+import lib.clock as clock
+import lib.forecast as forecast
+import lib.keepalive as keepalive
+import lib.network as network
+import lib.session as session
+import lib.trace as trace
+import lib.utilities as utilities
+import lib.watchdog as watchdog
+
+from lib.gopro import GoPro
+from lib.logger import logger
+
+# Workers are forked from a forkserver, never from the main process. The main process has threads (the update
+# window's, a task left running past its timeout) and a fork copies whatever lock one of them held, logging's
+# included, into a child that then deadlocks on it. The forkserver is a fresh, single-threaded interpreter with lib
+# already imported: it takes a second or two to start once, and every worker after that is ready in milliseconds.
+CONTEXT = multiprocessing.get_context("forkserver")
+CONTEXT.set_forkserver_preload(["lib.worker"])
+
+# What a call may run past its deadline before we kill the worker: the child gives up at the deadline by itself,
+# this is only for the power off after a photo, which isn't part of the capture budget
+DEADLINE_GRACE_SECONDS = 10
+
+# What the GoPro object remembers about the last call, copied back to the parent after every call
+ATTRIBUTES = ["last_capture", "last_shutter_at", "last_frames", "last_plan", "last_keep_alive"]
+
+PLAIN = (type(None), bool, int, float, str, datetime.datetime, datetime.date, datetime.timedelta)
+
+
+def holders():
+    # The singletons the camera code works with. What travels is everything on them that is plain data (see plain()),
+    # so a new attribute doesn't need to be added anywhere. Objects (the camera, the config, a deadline) stay put.
+    return {"config": config.global_config, "keep_alive": keepalive.controller, "forecast": forecast.forecaster,
+            "clock": clock.camera_clock, "session": session.camera_session, "network": network.network}
+
+
+def plain(value):
+    if isinstance(value, PLAIN):
+        return True
+    if isinstance(value, (list, tuple, set, frozenset, collections.deque)):
+        return all(plain(item) for item in value)
+    if isinstance(value, dict):
+        return all(plain(key) and plain(item) for key, item in value.items())
+    return False
+
+
+def snapshot():
+    """{holder: {attribute: value}} for every plain attribute."""
+    return {name: {key: value for key, value in vars(holder).items() if plain(value)}
+            for name, holder in holders().items()}
+
+
+def changes(before, after):
+    """What's new or different in `after`, the same shape as snapshot()."""
+    missing = object()
+    return {name: {key: value for key, value in values.items() if before.get(name, {}).get(key, missing) != value}
+            for name, values in after.items()}
+
+
+def restore(state):
+    for name, holder in holders().items():
+        for key, value in state.get(name, {}).items():
+            setattr(holder, key, value)
+
+
+def _serve(conn, factory, attributes, recording):
+    # Child side: one call at a time, until the parent hangs up
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    utilities.held_writes = {}
+    if recording[0] is not None:
+        trace.recorder.resume(*recording)
+    camera = factory()
+    while True:
+        try:
+            method, args, kwargs, state = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        # the call changes the restored values in place, so what it started from is a copy
+        before = copy.deepcopy(state)
+        restore(state)
+        utilities.held_writes.clear()
+        value, error = None, None
+        try:
+            value = getattr(camera, method)(*args, **kwargs)
+        except Exception as e:
+            error = e
+        reply = (value, error, {name: getattr(camera, name, None) for name in attributes},
+                 changes(before, snapshot()), dict(utilities.held_writes))
+        try:
+            conn.send(reply)
+        except Exception:
+            # the exception (or value) didn't pickle, send what we can
+            conn.send((None, RuntimeError(repr(error or value)),) + reply[2:])
+
+
+class CameraWorker:
+    """
+    Parent side. call() runs a method of the camera object in the child and returns its result, re-raising
+    whatever it raised. A call that runs past its timeout gets the child killed and replaced, and raises TimeoutError.
+    """
+
+    def __init__(self, factory=GoPro, attributes=ATTRIBUTES, timeouts=None):
+        self.factory = factory
+        self.attributes = attributes
+        self.timeouts = timeouts if timeouts is not None else config.global_config.camera_worker_config.get("timeouts", {})
+        self.process = None
+        self.conn = None
+        self.kills = 0
+
+    def start(self):
+        parent_conn, child_conn = CONTEXT.Pipe()
+        recording = (trace.recorder.path, trace.recorder.started) if trace.recorder.fd is not None else (None, None)
+        self.process = CONTEXT.Process(target=_serve, args=(child_conn, self.factory, self.attributes, recording),
+                                       name="camera-worker", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        logger.info(f"Camera worker started (pid {self.process.pid}).")
+
+    def call(self, method, *args, timeout=None, **kwargs):
+        if self.process is None or not self.process.is_alive():
+            self.start()
+        timeout = timeout or self.timeouts.get(method, self.timeouts.get("default", 60))
+        deadline = kwargs.get("deadline")
+        if deadline is not None:
+            timeout = max(0.0, min(timeout, deadline.remaining() + DEADLINE_GRACE_SECONDS))
+
+        self.conn.send((method, args, kwargs, snapshot()))
+        if not self._wait_reply(timeout):
+            self.kill(f"{method} didn't finish in {timeout:.0f}s")
+            raise TimeoutError(f"Camera worker hung in {method}. Killed it after {timeout:.0f}s.")
+        try:
+            value, error, attributes, changed, writes = self.conn.recv()
+        except EOFError:
+            self.kill(f"{method}: worker died")
+            raise RuntimeError(f"Camera worker died during {method}.")
+
+        restore(changed)
+        for path, text in writes.items():
+            try:
+                utilities.write_text(path, text)
+            except OSError as e:
+                logger.error(f"Failed to save {path}: {e}")
+        for name, attribute in attributes.items():
+            setattr(self, name, attribute)
+        if error is not None:
+            raise error
+        return value
+
+    def _wait_reply(self, timeout):
+        # A hung child is our problem (see kill), not systemd's, so we keep the watchdog fed while we wait
+        give_up = time.monotonic() + timeout
+        while not self.conn.poll(max(0.0, min(5.0, give_up - time.monotonic()))):
+            watchdog.watchdog.ping()
+            if time.monotonic() >= give_up:
+                return False
+        return True
+
+    def kill(self, reason):
+        start = time.monotonic()
+        self.kills += 1
+        config.global_config.camera_worker_kills += 1
+        logger.error(f"Killing the camera worker (pid {self.process.pid}): {reason}. Kill #{self.kills}.")
+        self.process.kill()
+        self.process.join(1)
+        self.conn.close()
+        self.process = None
+        self.start()
+        logger.info(f"Camera worker replaced in {time.monotonic() - start:.2f}s.")
+
+    def stop(self):
+        if self.process is not None:
+            self.conn.close()
+            self.process.join(2)
+            if self.process.is_alive():
+                self.process.kill()
+            self.process = None
+
+
+class WorkerGoPro(CameraWorker):
+    """Stands in for lib.gopro.GoPro in the state handlers, with every camera call going through the worker."""
+
+    def __init__(self):
+        super().__init__()
+        for name in ATTRIBUTES:
+            setattr(self, name, None)
+        # The forkserver's second or two now, at start, and not out of the first photo's budget
+        multiprocessing.forkserver.ensure_running()
+
+    def take_photo(self, deadline=None):
+        return self.call("take_photo", deadline=deadline)
+
+    def keep_alive(self, deadline=None):
+        return self.call("keep_alive", deadline=deadline)
+
+    def supervise_lapse(self):
+        return self.call("supervise_lapse")
+
+    def list_media(self):
+        return self.call("list_media")
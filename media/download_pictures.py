@@ -7,6 +7,7 @@ import json
 
 from goprocam import GoProCamera
 from lib.logger import logger
+from media.manifest import manifest_path, load_manifest, save_manifest, record_offload
 
 # This is using the GoPro API to download photos from a GoPro camera.
 # The laptop must be connected to the GoPro camera's Wi-Fi network.
@@ -55,9 +56,13 @@ def main(working_directory="/Users/mrbigheart/workspace/personal/code/gopro_down
             logger.info("No media found on GoPro, or could not retrieve list.")
             return
 
+        # The manifest is what prune_camera.py trusts before deleting anything from the card
+        manifest_file = manifest_path(working_directory, config)
+        manifest = load_manifest(manifest_file)
+
         photos = []
         for item in media_list:
-            folder, filename = item[0], item[1]
+            folder, filename, size = item[0], item[1], item[2]
             # only pick up .jpg / .jpeg
             if filename.lower().endswith((".jpg", ".jpeg")):
                 # ----------------------------------------------------------------------
@@ -65,6 +70,11 @@ def main(working_directory="/Users/mrbigheart/workspace/personal/code/gopro_down
                 # ----------------------------------------------------------------------
                 if filename.lower() not in local_photos:
                     photos.append((folder, filename))
+                elif filename.upper() not in manifest:
+                    # Downloaded before we kept a manifest. Only record it if it's complete.
+                    local_path = os.path.join(working_directory, filename)
+                    if os.path.exists(local_path) and os.path.getsize(local_path) == int(size):
+                        record_offload(manifest, folder, filename, local_path)
                 # ----------------------------------------------------------------------
 
         logger.info(f"Found {len(photos)} new photos to download.")
@@ -79,10 +89,14 @@ def main(working_directory="/Users/mrbigheart/workspace/personal/code/gopro_down
                     continue
                 logger.info(f"Downloading {folder}/{filename} -> {local_path}")
                 gopro.downloadMedia(folder, filename, custom_filename=local_path)
+                if os.path.exists(local_path):
+                    record_offload(manifest, folder, filename, local_path)
                 # time.sleep(1)
+            save_manifest(manifest_file, manifest)
             logger.info(f"Finished batch {i//batch_size + 1}.")
             time.sleep(1)  # small pause between batches
 
+        save_manifest(manifest_file, manifest)
         logger.info("All downloads complete.")
     except Exception as e:
         logger.error(f"Failed to list or download media: {e}")
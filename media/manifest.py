@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import hashlib
+import datetime
+
+# Keeps track of what we already offloaded from the GoPro, and how it looked when we did.
+# download_pictures.py writes it, prune_camera.py only deletes from the card what's in here and still verifies.
+#
+# {
+#   "GOPR0001.JPG": {"folder": "100GOPRO", "size": 4123456, "sha256": "...", "offloaded_at": "2025-03-21T10:00:00"},
+#   ...
+# }
+
+MANIFEST_NAME = "offload_manifest.json"
+
+
+def manifest_path(working_directory, config=None):
+    if config and config.get("pruning", {}).get("manifest"):
+        return config["pruning"]["manifest"]
+    return os.path.join(working_directory, MANIFEST_NAME)
+
+
+def load_manifest(path):
+    if not os.path.isfile(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(path, manifest):
+    # Write to a temp file first, so a crash mid-write doesn't cost us the whole manifest
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def sha256_of(file_path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def record_offload(manifest, folder, filename, local_path):
+    manifest[filename.upper()] = {
+        "folder": folder,
+        "size": os.path.getsize(local_path),
+        "sha256": sha256_of(local_path),
+        "offloaded_at": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def is_verified(manifest, folder, filename, camera_size, working_directory):
+    """
+    True only if the file was offloaded, the local copy still has the hash we recorded,
+    and its size matches what the camera reports. Anything else stays on the card.
+    """
+    entry = manifest.get(filename.upper())
+    if not entry or entry["folder"] != folder:
+        return False
+    local_path = os.path.join(working_directory, filename)
+    if not os.path.isfile(local_path):
+        return False
+    if int(camera_size) != entry["size"] or os.path.getsize(local_path) != entry["size"]:
+        return False
+    return sha256_of(local_path) == entry["sha256"]
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+import json
+import datetime
+
+from goprocam import GoProCamera
+from lib.logger import logger
+from media.manifest import manifest_path, load_manifest, is_verified
+
+# Deletes photos from the GoPro SD card, but only the ones download_pictures.py already offloaded
+# and that still match the hash in the offload manifest. The newest `keep_last` files always stay on the camera.
+# Like the download script, the laptop must be connected to the GoPro Wi-Fi.
+# Every deleted file is appended to the prune log (one JSON per line), so we know what's gone and when.
+
+# author: mrbigheart
+
+def load_config(config_path="config.json"):
+    try:
+        with open(config_path, "r") as f:
+            return json.load(f)
+    except Exception as e:
+        logger.error(f"Could not load config.json: {e}")
+        sys.exit(1)
+
+config = load_config()
+gopro_ip = config["gopro"]["ip"]
+pruning_config = config.get("pruning", {})
+
+
+def select_prunable(media_list, manifest, working_directory, keep_last):
+    """
+    media_list is what listMedia(format=True, media_array=True) returns: [folder, filename, size, mod].
+    Returns the (folder, filename, size) entries that can go, oldest first.
+    """
+    ordered = sorted(media_list, key=lambda item: (int(item[3]), item[0], item[1]))
+    candidates = ordered[:-keep_last] if keep_last > 0 else ordered
+
+    prunable = []
+    for folder, filename, size, _ in candidates:
+        if is_verified(manifest, folder, filename, size, working_directory):
+            prunable.append((folder, filename, size))
+        else:
+            logger.debug(f"{folder}/{filename} is not offloaded and verified. Keeping it.")
+    return prunable
+
+
+def record_removal(log_path, folder, filename, size):
+    with open(log_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({
+            "folder": folder,
+            "file": filename,
+            "size": int(size),
+            "deleted_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        }) + "\n")
+
+
+def main(working_directory="/Users/mrbigheart/workspace/personal/code/gopro_downloads/media"):
+    keep_last = pruning_config.get("keep_last", 500)
+    batch_size = pruning_config.get("batch_size", 20)
+    log_path = pruning_config.get("log", os.path.join(working_directory, "prune_log.jsonl"))
+
+    manifest = load_manifest(manifest_path(working_directory, config))
+    if not manifest:
+        logger.info("Offload manifest is empty. Run download_pictures.py first. Nothing to prune.")
+        return
+
+    gopro = GoProCamera.GoPro(gopro_ip)
+    logger.info("Connected to GoPro. Fetching media list...")
+
+    try:
+        media_list = gopro.listMedia(format=True, media_array=True)
+        if not media_list:
+            logger.info("No media found on GoPro, or could not retrieve list.")
+            return
+
+        prunable = select_prunable(media_list, manifest, working_directory, keep_last)
+        logger.info(f"{len(media_list)} files on camera. {len(prunable)} can be pruned, keeping the newest {keep_last}.")
+
+        deleted = 0
+        for i in range(0, len(prunable), batch_size):
+            batch = prunable[i : i + batch_size]
+            for folder, filename, size in batch:
+                logger.info(f"Deleting {folder}/{filename} from the camera.")
+                if gopro.deleteFile(folder, filename) == "":
+                    # timeouts and HTTP errors come back as empty strings
+                    logger.warning(f"Camera didn't confirm deleting {folder}/{filename}. Will retry next run.")
+                    continue
+                record_removal(log_path, folder, filename, size)
+                deleted += 1
+            logger.info(f"Finished batch {i//batch_size + 1}.")
+            time.sleep(1)  # give the camera a moment to update its media index
+
+        logger.info(f"Pruning complete. Deleted {deleted} files, removals logged to {log_path}.")
+    except Exception as e:
+        logger.error(f"Failed to prune media: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import time
+from unittest import TestCase
+
+from lib.batch import TaskBatch
+
+
+class TestTaskBatch(TestCase):
+
+    def test_runs_everything_concurrently(self):
+        batch = TaskBatch("test", workers=3)
+        for name in ("a", "b", "c"):
+            batch.register(name, lambda: time.sleep(0.2))
+        start = time.monotonic()
+        self.assertEqual(batch.run(budget=5), {"a": "done", "b": "done", "c": "done"})
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_priorities_timeouts_and_failures(self):
+        batch = TaskBatch("test", workers=1)
+        started = []
+        batch.register("slow", lambda: started.append("slow") or time.sleep(1), priority=2, timeout=0.1)
+        batch.register("broken", lambda: started.append("broken") or 1 / 0, priority=1)
+        batch.register("false", lambda: started.append("false") or False, priority=0)
+        results = batch.run(budget=5)
+        self.assertEqual(started, ["false", "broken", "slow"])
+        self.assertEqual(results, {"false": "failed", "broken": "failed", "slow": "timeout"})
+
+    def test_budget_leaves_the_rest_unstarted(self):
+        batch = TaskBatch("test", workers=1)
+        batch.register("first", lambda: time.sleep(1), priority=0)
+        batch.register("second", lambda: None, priority=1)
+        start = time.monotonic()
+        self.assertEqual(batch.run(budget=0.2), {"first": "timeout", "second": "skipped"})
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertIn("unfinished: first, second", batch.summary())
+
+    def test_alone_runs_first_and_by_itself(self):
+        batch = TaskBatch("test", workers=3)
+        events = []
+        batch.register("push", lambda: events.append("push"), priority=0)
+        batch.register("clock", lambda: events.append("clock start") or time.sleep(0.2) or events.append("clock end"),
+                       priority=5, alone=True)
+        batch.register("save", lambda: events.append("save"), priority=1)
+        self.assertEqual(batch.run(budget=5), {"clock": "done", "push": "done", "save": "done"})
+        self.assertEqual(events[:2], ["clock start", "clock end"])
+
+    def test_nothing_queued_behind_a_timed_out_task_runs_after_the_batch(self):
+        batch = TaskBatch("test", workers=1)
+        started = []
+        batch.register("stuck", lambda: time.sleep(0.5), priority=0, timeout=0.1)
+        batch.register("late", lambda: started.append("late"), priority=1)
+        self.assertEqual(batch.run(budget=0.2), {"stuck": "timeout", "late": "timeout"})
+        time.sleep(0.6)
+        self.assertEqual(started, [])
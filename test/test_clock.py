@@ -0,0 +1,38 @@
+import datetime
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from lib.clock import CameraClock
+
+
+class TestCameraClock(TestCase):
+
+    def test_camera_time_from_status(self):
+        status = {"40": "%19%03%15%0E%1A%2B"}
+        self.assertEqual(CameraClock.camera_time_from_status(status), datetime.datetime(2025, 3, 21, 14, 26, 43))
+
+    def test_camera_time_missing(self):
+        self.assertIsNone(CameraClock.camera_time_from_status({}))
+        self.assertIsNone(CameraClock.camera_time_from_status({"40": "garbage"}))
+
+    def test_media_time_inside_the_capture_is_no_drift(self):
+        shutter = datetime.datetime(2025, 3, 21, 14, 26, 43, 600000)
+        saved = shutter + datetime.timedelta(seconds=2)
+        # stamped in whole seconds, while the photo was being saved
+        self.assertEqual(CameraClock.media_drift(datetime.datetime(2025, 3, 21, 14, 26, 43), (shutter, saved)), 0.0)
+        self.assertEqual(CameraClock.media_drift(datetime.datetime(2025, 3, 21, 14, 26, 45), (shutter, saved)), 0.0)
+
+    def test_media_time_outside_the_capture_is_drift(self):
+        shutter = datetime.datetime(2025, 3, 21, 14, 26, 43)
+        saved = shutter + datetime.timedelta(seconds=2)
+        self.assertEqual(CameraClock.media_drift(datetime.datetime(2025, 3, 21, 14, 26, 55), (shutter, saved)), 10.0)
+        self.assertEqual(CameraClock.media_drift(datetime.datetime(2025, 3, 21, 14, 26, 30), (shutter, saved)), -12.0)
+
+    @patch("lib.clock.save_json")
+    def test_media_fallback_without_capture_time_doesnt_sync(self, save_json):
+        camera_clock = CameraClock()
+        camera_clock.config = MagicMock(last_time_sync=datetime.datetime.now())
+        gopro = MagicMock()
+        gopro.listMedia.return_value = [["100GOPRO", "GOPR0001.JPG", "5", "1742567203"]]
+        self.assertIsNone(camera_clock.check(gopro, {}))
+        gopro.syncTime.assert_not_called()
@@ -0,0 +1,63 @@
+import time
+import datetime
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from lib.deadline import Deadline, DeadlineExceeded
+from lib.session import CameraSession
+
+
+class TestDeadline(TestCase):
+
+    def test_no_limit(self):
+        deadline = Deadline()
+        self.assertFalse(deadline.expired())
+        self.assertEqual(deadline.clamp(5), 5)
+        self.assertEqual(deadline.tries(5, 10), 5)
+
+    def test_clamp_and_tries(self):
+        deadline = Deadline(12)
+        self.assertLessEqual(deadline.clamp(30), 12)
+        self.assertEqual(deadline.clamp(3), 3)
+        self.assertEqual(deadline.tries(5, 5), 2)
+        # one try always fits, as long as there's any time left
+        self.assertEqual(deadline.tries(5, 60), 1)
+
+    def test_expired_raises(self):
+        deadline = Deadline(0, "photo")
+        with self.assertRaises(DeadlineExceeded) as raised:
+            deadline.clamp(5, "wake")
+        self.assertEqual(raised.exception.step, "wake")
+        self.assertIsInstance(raised.exception, TimeoutError)
+
+    def test_at(self):
+        deadline = Deadline.at(datetime.datetime.now() + datetime.timedelta(seconds=30))
+        self.assertAlmostEqual(deadline.remaining(), 30, delta=1)
+        self.assertEqual(Deadline.at(None).remaining(), float("inf"))
+
+
+class TestSessionDeadline(TestCase):
+
+    def test_wait_is_cut_by_deadline(self):
+        session = CameraSession()
+        with session.within(Deadline(0.3, "photo")) as deadline:
+            start = time.monotonic()
+            with self.assertRaises(DeadlineExceeded):
+                session.wait_until("wake", lambda: None, 15, interval=0.05)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(deadline.spent_on[0][0], "wake")
+        self.assertIsNone(session.deadline)
+
+    def test_wait_within_budget_times_out_normally(self):
+        session = CameraSession()
+        with session.within(Deadline(10)):
+            self.assertIsNone(session.wait_until("mode", lambda: None, 0.1, interval=0.05))
+
+    def test_cut_wake_is_not_observed(self):
+        session = CameraSession()
+        session.keep_alive = MagicMock(last_contact=None)
+        session.wifi = MagicMock()
+        with patch.object(session, "probe", return_value=None), session.within(Deadline(0.2)):
+            with self.assertRaises(DeadlineExceeded):
+                session.wake()
+        session.keep_alive.observe.assert_not_called()
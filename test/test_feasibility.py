@@ -0,0 +1,71 @@
+import os
+import json
+import datetime
+import tempfile
+from unittest import TestCase
+
+from lib.config import Config
+from lib.feasibility import FeasibilityCheck, report, clock
+
+REPO_CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.json")
+DAY = datetime.date(2025, 3, 21)
+
+
+class TestFeasibilityCheck(TestCase):
+
+    def check(self, profile=None, date=DAY, **changes):
+        with open(REPO_CONFIG, "r") as f:
+            raw = json.load(f)
+        for path, value in changes.items():
+            section, key = path.split("__")
+            raw[section][key] = value
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            json.dump(raw, f)
+        self.addCleanup(os.remove, f.name)
+        return FeasibilityCheck(Config(f.name), profile).run(date)
+
+    @staticmethod
+    def problems(results, level):
+        return [p.message for _, _, hour_problems in results for p in hour_problems if p.level == level]
+
+    def test_repo_config_is_feasible(self):
+        results, overall = self.check()
+        self.assertEqual(len(results), 24)
+        self.assertEqual(overall, [])
+        self.assertEqual(self.problems(results, "error"), [])
+        photo = next(s for s in results[10][1] if s.kind == "photo")
+        self.assertEqual((clock(photo.start), clock(photo.shutter)), ("02:54.000", "03:02.000"))
+
+    def test_update_window_into_a_photo_never_runs(self):
+        results, overall = self.check(send_update__minutes=[56])
+        self.assertIn("send_update 56:00.000 is never run, it would run into photo 57:00.000",
+                      self.problems(results, "warning"))
+        self.assertEqual(len(overall), 1)
+
+    def test_router_and_gopro_on_the_same_ssid(self):
+        _, overall = self.check(router__ssid="timelapse", gopro__ssid="timelapse")
+        self.assertEqual([p.level for p in overall], ["error"])
+        self.assertIn("same SSID", overall[0].message)
+
+    def test_camera_wifi_left_alone_too_long(self):
+        results, _ = self.check({"camera_wifi_sleep_seconds": 300}, keep_alive__minutes=[0, 6])
+        errors = self.problems(results, "error")
+        self.assertTrue(any("camera Wi-Fi left alone" in e for e in errors))
+
+    def test_camera_wifi_sleep_range_counts_as_its_low_end(self):
+        results, _ = self.check({"camera_wifi_sleep_seconds": [150, 600]})
+        self.assertTrue(any("it sleeps after 150000 ms" in e for e in self.problems(results, "error")))
+
+    def test_sun_plan_keeps_the_camera_wifi_up(self):
+        for date in (DAY, datetime.date(2025, 6, 21), datetime.date(2025, 12, 21)):
+            results, _ = self.check(date=date, sun_plan__enabled=True)
+            errors = self.problems(results, "error")
+            self.assertFalse(any("camera Wi-Fi left alone" in e for e in errors), (date, errors))
+
+    def test_slow_wake_misses_the_slot(self):
+        results, overall = self.check({"wake_seconds": [3, 40]})
+        errors = self.problems(results, "error")
+        self.assertIn("photo 03:00.000 misses its slot: shutter at 03:34.000, 34000 ms after the target", errors)
+        text, count = report(results, overall, "config.json", 0.002, quiet=True)
+        self.assertEqual(count, len(errors))
+        self.assertIn("Hours 00, 01", text)
@@ -0,0 +1,47 @@
+from unittest import TestCase
+
+from lib.forecast import Forecaster, SECONDS_PER_DAY
+
+
+class TestForecast(TestCase):
+
+    def test_days_until_linear_drain(self):
+        # 100 photos per day, 1000 left -> 10 days
+        samples = [{"at": day * SECONDS_PER_DAY, "rem_photos": 2000 - 100 * day} for day in range(11)]
+        self.assertAlmostEqual(Forecaster.days_until(samples, "rem_photos", 0), 10.0)
+
+    def test_days_until_no_trend(self):
+        samples = [{"at": hour * 3600, "battery": 100} for hour in range(5)]
+        self.assertIsNone(Forecaster.days_until(samples, "battery", 15))
+
+    def test_days_until_ignores_samples_before_refill(self):
+        samples = [{"at": 0, "rem_photos": 10}, {"at": SECONDS_PER_DAY, "rem_photos": 5},
+                   {"at": 2 * SECONDS_PER_DAY, "rem_photos": 1000}, {"at": 3 * SECONDS_PER_DAY, "rem_photos": 900}]
+        self.assertAlmostEqual(Forecaster.days_until(samples, "rem_photos", 0), 9.0)
+
+    def test_days_until_keeps_history_through_jitter(self):
+        # the battery reading jumps up a couple of percent now and then, that's not a charge
+        samples = [{"at": hour * 3600, "battery": 90 - hour + (2 if hour % 4 == 0 else 0)} for hour in range(24)]
+        # ~1% an hour over the whole day, not just the few hours since the last uptick
+        self.assertAlmostEqual(Forecaster.days_until(samples, "battery", 15, refill_jump=10), 52 / 24, delta=0.1)
+        samples.append({"at": 24 * 3600, "battery": 100})
+        samples.append({"at": 25 * 3600, "battery": 99})
+        self.assertAlmostEqual(Forecaster.days_until(samples, "battery", 15, refill_jump=10), 84 / 24)
+
+    def _forecaster(self, samples):
+        forecaster = Forecaster()
+        forecaster.samples = samples
+        forecaster.forecast_config = {}
+        return forecaster
+
+    def test_storage_forecast_uses_free_space(self):
+        samples = [{"at": day * SECONDS_PER_DAY, "rem_space": 2000000 - 100000 * day, "rem_photos": 500, "sd_status": 0}
+                   for day in range(5)]
+        self.assertAlmostEqual(self._forecaster(samples).forecast()["storage_days"], 16.0)
+
+    def test_unknown_sd_status_is_not_a_problem(self):
+        forecaster = self._forecaster([{"at": 0, "rem_photos": 500, "sd_status": None}])
+        self.assertIsNone(forecaster.forecast()["sd_ok"])
+        self.assertNotIn("SD CARD", forecaster.summary())
+        forecaster.samples[-1]["sd_status"] = 2
+        self.assertIn("SD CARD PROBLEM", forecaster.summary())
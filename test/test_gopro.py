@@ -1,4 +1,10 @@
+import datetime
+import subprocess
 from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from lib.gopro import GoPro
+from lib.deadline import Deadline, DeadlineExceeded
 
 
 class TestGoPro(TestCase):
@@ -11,3 +17,220 @@ class TestGoPro(TestCase):
 
     def test_start_beeper(self):
         self.fail()
+
+    def test_frame_plan(self):
+        gopro = GoPro()
+        gopro.config.capture_windows = [
+            {"from": "19:30", "to": "21:00", "mode": "bracket", "ev": [-1, 0, 1]},
+            {"from": "23:00", "to": "01:00", "mode": "burst", "frames": 2},
+        ]
+        self.assertEqual(gopro.frame_plan(datetime.datetime(2025, 3, 21, 20, 0)), ("bracket", [-1.0, 0.0, 1.0]))
+        self.assertEqual(gopro.frame_plan(datetime.datetime(2025, 3, 21, 0, 30)), ("burst", [None, None]))
+        self.assertEqual(gopro.frame_plan(datetime.datetime(2025, 3, 21, 12, 0)), ("single", [None]))
+
+    def test_ev_option(self):
+        self.assertEqual(GoPro.ev_option(2), "0")
+        self.assertEqual(GoPro.ev_option(0), "4")
+        self.assertEqual(GoPro.ev_option(-1.5), "7")
+        with self.assertRaises(ValueError):
+            GoPro.ev_option(0.3)
+
+    def _keep_alive_gopro(self):
+        gopro = GoPro()
+        gopro.network = MagicMock()
+        gopro.network.on = "gopro"
+        gopro.session = MagicMock()
+        gopro.config.keep_alive_preemptions = 0
+        return gopro
+
+    def test_keep_alive_does_not_look_at_the_wifi_again(self):
+        gopro = self._keep_alive_gopro()
+        self.assertTrue(gopro.keep_alive())
+        gopro.network.current.assert_not_called()
+        gopro.network.ensure.assert_not_called()
+        gopro.network.on = "router"
+        self.assertFalse(gopro.keep_alive())
+
+    def test_keep_alive_without_deadline_runs_through(self):
+        gopro = self._keep_alive_gopro()
+        self.assertTrue(gopro.keep_alive())
+        gopro.session.sleep.assert_called_once()
+        self.assertEqual(gopro.last_keep_alive, "done")
+
+    def test_keep_alive_aborts_when_photo_is_due(self):
+        gopro = self._keep_alive_gopro()
+        self.assertTrue(gopro.keep_alive(deadline=Deadline(0)))
+        gopro.session.wake.assert_not_called()
+        self.assertEqual(gopro.last_keep_alive, "aborted")
+        self.assertEqual(gopro.config.keep_alive_preemptions, 1)
+
+    def test_keep_alive_folds_into_photo_once_awake(self):
+        gopro = self._keep_alive_gopro()
+        scheduler_config = gopro.config.scheduler_config
+        self.addCleanup(scheduler_config.pop, "preempt_margin_seconds", None)
+
+        def slow_wake():
+            # the wake eats up the time that was left before the photo
+            scheduler_config["preempt_margin_seconds"] = 60
+            return MagicMock()
+
+        gopro.session.wake.side_effect = slow_wake
+        self.assertTrue(gopro.keep_alive(deadline=Deadline(10)))
+        gopro.session.set_mode.assert_not_called()
+        gopro.session.sleep.assert_not_called()
+        self.assertEqual(gopro.last_keep_alive, "folded")
+
+    def test_keep_alive_wake_cut_by_deadline_is_a_preemption(self):
+        gopro = self._keep_alive_gopro()
+        deadline = Deadline(10)
+        gopro.session.wake.side_effect = DeadlineExceeded(deadline, "wake")
+        self.assertTrue(gopro.keep_alive(deadline=deadline))
+        gopro.session.mark_failed.assert_not_called()
+        self.assertEqual(gopro.last_keep_alive, "aborted")
+
+    def test_light_keep_alive_leaves_camera_asleep(self):
+        gopro = self._keep_alive_gopro()
+        gopro.session.keep_alive.tier.return_value = "light"
+        gopro.session.nudge.return_value = True
+        self.assertTrue(gopro.keep_alive())
+        gopro.session.wake.assert_not_called()
+        self.assertEqual(gopro.last_keep_alive, "light")
+
+    def test_light_keep_alive_without_answer_falls_back_to_heavy(self):
+        gopro = self._keep_alive_gopro()
+        gopro.session.keep_alive.tier.return_value = "light"
+        gopro.session.nudge.return_value = False
+        self.assertTrue(gopro.keep_alive())
+        gopro.session.wake.assert_called_once()
+        self.assertEqual(gopro.last_keep_alive, "done")
+
+    def _preview_gopro(self):
+        gopro = GoPro()
+        gopro.session = MagicMock()
+        gopro.preview_config = {"budget_seconds": 8}
+        return gopro
+
+    @patch("lib.gopro.subprocess.Popen")
+    def test_grab_preview_returns_frame_and_stops_stream(self, popen):
+        gopro = self._preview_gopro()
+        popen.return_value.communicate.return_value = (b"jpeg", None)
+        popen.return_value.returncode = 0
+        self.assertEqual(gopro.grab_preview(), b"jpeg")
+        camera = gopro.session.connect.return_value
+        camera.livestream.assert_called_with("stop")
+
+    @patch("lib.gopro.subprocess.Popen")
+    def test_grab_preview_budget_includes_connecting(self, popen):
+        gopro = self._preview_gopro()
+
+        def slow_detection():
+            # detection ate the whole budget
+            gopro.session.within.call_args[0][0].check("connect")
+
+        gopro.session.connect.side_effect = slow_detection
+        self.assertIsNone(gopro.grab_preview(budget_seconds=0))
+        popen.assert_not_called()
+
+    @patch("lib.gopro.subprocess.Popen")
+    def test_grab_preview_gives_up_when_budget_runs_out(self, popen):
+        gopro = self._preview_gopro()
+        popen.return_value.communicate.side_effect = subprocess.TimeoutExpired("ffmpeg", 0.01)
+        popen.return_value.poll.return_value = None
+        with patch("lib.gopro.os.killpg") as killpg:
+            self.assertIsNone(gopro.grab_preview(budget_seconds=0.05))
+        killpg.assert_called_once()
+        gopro.session.connect.return_value.livestream.assert_called_with("stop")
+
+    def _lapse_gopro(self, status):
+        gopro = GoPro()
+        gopro.wifi = MagicMock()
+        gopro.session = MagicMock()
+        gopro.session.status.return_value = status
+        gopro.lapse_config = {"min_battery_percent": 10}
+        gopro.start_lapse = MagicMock()
+        gopro.config.lapse_restart_counter = 0
+        return gopro
+
+    @patch("lib.gopro.forecast")
+    def test_lapse_recording_is_left_alone(self, forecast):
+        gopro = self._lapse_gopro({"8": 0, "10": 1, "34": 500, "70": 80})
+        gopro.supervise_lapse()
+        gopro.start_lapse.assert_not_called()
+
+    @patch("lib.gopro.forecast")
+    def test_busy_but_not_recording_restarts_lapse(self, forecast):
+        gopro = self._lapse_gopro({"8": 1, "10": 0, "34": 500, "70": 80})
+        gopro.supervise_lapse()
+        gopro.start_lapse.assert_called_once()
+        self.assertEqual(gopro.config.lapse_restart_counter, 1)
+
+    @patch("lib.gopro.forecast")
+    def test_stopped_lapse_with_full_card_is_an_error(self, forecast):
+        gopro = self._lapse_gopro({"8": 0, "10": 0, "34": 0, "70": 80})
+        with self.assertRaises(RuntimeError):
+            gopro.supervise_lapse()
+        gopro.start_lapse.assert_not_called()
+
+    def test_photo_saved_needs_not_busy_and_a_new_photo(self):
+        gopro = GoPro()
+        gopro.session = MagicMock()
+        gopro.session.probe.return_value = {"8": 1, "38": 11}
+        self.assertIsNone(gopro._photo_saved(10))
+        gopro.session.probe.return_value = {"8": 0, "38": 10}
+        self.assertIsNone(gopro._photo_saved(10))
+        gopro.session.probe.return_value = {"8": 0, "38": 11}
+        self.assertEqual(gopro._photo_saved(10), {"8": 0, "38": 11})
+
+    def test_photo_saved_without_counter_goes_by_busy(self):
+        gopro = GoPro()
+        gopro.session = MagicMock()
+        gopro.session.probe.return_value = {"8": 0}
+        self.assertEqual(gopro._photo_saved(None), {"8": 0})
+        gopro.session.probe.return_value = None
+        self.assertIsNone(gopro._photo_saved(None))
+
+    def _capture_gopro(self, ev_values):
+        gopro = GoPro()
+        gopro.session = MagicMock()
+        gopro.session.set_mode.return_value = {"38": 10}
+        gopro.frame_plan = MagicMock(return_value=("bracket", ev_values))
+        gopro.waits_config = {"capture": 1}
+        return gopro
+
+    @patch("lib.gopro.clock")
+    @patch("lib.gopro.forecast")
+    def test_ev_is_reset_when_bracket_frame_fails(self, forecast, clock):
+        gopro = self._capture_gopro([-1.0, 0.0, 1.0])
+        gopro.session.wait_until.side_effect = DeadlineExceeded(Deadline(0), "capture")
+        with self.assertRaises(DeadlineExceeded):
+            gopro.take_photo()
+        camera = gopro.session.wake.return_value
+        self.assertEqual(camera.gpControlSet.call_args_list[-1].args, ("26", "4"))
+        self.assertFalse(gopro.ev_reset_pending)
+
+    @patch("lib.gopro.clock")
+    @patch("lib.gopro.forecast")
+    def test_running_out_of_time_is_not_a_camera_fault(self, forecast, clock):
+        gopro = self._capture_gopro([None])
+        gopro.session.wait_until.side_effect = DeadlineExceeded(Deadline(0), "capture")
+        with self.assertRaises(DeadlineExceeded):
+            gopro.take_photo()
+        gopro.session.mark_failed.assert_not_called()
+
+        gopro.session.wait_until.side_effect = ConnectionError("no answer")
+        with self.assertRaises(ConnectionError):
+            gopro.take_photo()
+        gopro.session.mark_failed.assert_called_once()
+
+    @patch("lib.gopro.clock")
+    @patch("lib.gopro.forecast")
+    def test_failed_ev_reset_is_retried_before_next_frame(self, forecast, clock):
+        gopro = self._capture_gopro([None])
+        gopro.ev_reset_pending = True
+        gopro.session.wait_until.return_value = {"8": 0, "38": 11}
+        gopro.take_photo()
+        camera = gopro.session.wake.return_value
+        self.assertEqual(camera.gpControlSet.call_args_list[0].args, ("26", "4"))
+        names = [c[0] for c in camera.method_calls]
+        self.assertLess(names.index("gpControlSet"), names.index("shutter"))
+        self.assertFalse(gopro.ev_reset_pending)
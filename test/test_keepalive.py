@@ -0,0 +1,69 @@
+import datetime
+from unittest import TestCase
+
+from lib.keepalive import KeepAliveController, SAFE_MAX_SECONDS
+
+
+class TestKeepAliveController(TestCase):
+
+    def setUp(self):
+        self.controller = KeepAliveController()
+        self.controller._save = lambda: None
+        self.controller.adaptive_config = {"enabled": True, "initial_seconds": 180, "min_seconds": 120,
+                                           "max_seconds": 420, "step_seconds": 30, "successes_to_stretch": 2,
+                                           "margin_seconds": 60}
+        self.controller.spacing, self.controller.streak, self.controller.failed_gaps = 180, 0, []
+
+    def test_stretches_after_good_wakes(self):
+        self.controller.observe(170, True)
+        self.assertEqual(self.controller.spacing, 180)
+        self.controller.observe(175, True)
+        self.assertEqual(self.controller.spacing, 210)
+
+    def test_backs_off_and_stays_under_failed_gap(self):
+        self.controller.spacing = 200
+        self.controller.observe(250, False)
+        self.assertEqual(self.controller.spacing, 120)
+        self.assertEqual(self.controller.limit(), 190)
+        for _ in range(20):
+            self.controller.observe(150, True)
+        self.assertEqual(self.controller.spacing, 190)
+
+    def test_never_past_the_safe_gap(self):
+        # max_seconds is 420 here, past the camera Wi-Fi's sleep
+        self.assertEqual(self.controller.limit(), SAFE_MAX_SECONDS)
+        for _ in range(40):
+            self.controller.observe(170, True)
+        self.assertEqual(self.controller.spacing, SAFE_MAX_SECONDS)
+
+    def test_never_below_min(self):
+        self.controller.observe(100, False)
+        self.controller.observe(100, False)
+        self.assertEqual(self.controller.spacing, 120)
+
+    def test_needed(self):
+        contact = datetime.datetime(2025, 3, 21, 10, 0)
+        self.assertFalse(self.controller.needed(contact, contact + datetime.timedelta(seconds=170)))
+        self.assertTrue(self.controller.needed(contact, contact + datetime.timedelta(seconds=200)))
+        self.assertTrue(self.controller.needed(None, contact))
+        self.controller.adaptive_config["enabled"] = False
+        self.assertTrue(self.controller.needed(contact, contact + datetime.timedelta(seconds=10)))
+
+    def test_tier(self):
+        now = datetime.datetime(2025, 3, 21, 10, 0)
+        self.controller.light_config = {"enabled": True, "heavy_every_minutes": 30}
+        self.controller.last_full_wake = None
+        self.assertEqual(self.controller.tier(now), "heavy")
+        self.controller.woke(now - datetime.timedelta(minutes=10))
+        self.assertEqual(self.controller.tier(now), "light")
+        self.controller.ran("light", 0.4, ok=False, at=now)
+        self.assertEqual(self.controller.tier(now), "heavy")
+        self.controller.woke(now)
+        self.assertEqual(self.controller.tier(now + datetime.timedelta(minutes=31)), "heavy")
+
+    def test_report_compares_with_heavy_only(self):
+        now = datetime.datetime.now()
+        self.controller.runs = [{"at": now.isoformat(), "tier": "heavy", "ok": True, "radio": 24.0, "awake": 12.0}] + \
+            [{"at": now.isoformat(), "tier": "light", "ok": True, "radio": 0.0, "awake": 0.0}] * 23
+        self.assertIn("Keep-alive: 1.0/h (1.0 light), radio 1s/h, camera awake 0s/h (all heavy: 24s/h, 12s/h)",
+                      self.controller.report(planned_per_day=48))
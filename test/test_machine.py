@@ -0,0 +1,69 @@
+import datetime
+from unittest import TestCase
+from unittest.mock import patch
+
+from lib.machine import StateMachine, TRANSITIONS, HANDLERS, BUCKETS
+
+
+class TestStateMachine(TestCase):
+
+    def setUp(self):
+        self.machine = StateMachine()
+        self.machine.counts, self.machine.histograms, self.machine.samples = {}, {}, {}
+        self.machine.daily, self.machine.history = {}, []
+        self.machine._save = lambda: None
+        self.machine.config.state = "WAITING"
+
+    def test_every_target_has_a_handler(self):
+        for (state, _), target in TRANSITIONS.items():
+            self.assertIn(target, HANDLERS)
+            self.assertTrue(state == "*" or state in HANDLERS)
+
+    def test_fire_follows_the_table(self):
+        self.assertEqual(self.machine.fire("photo_due"), "TAKE_PHOTO")
+        self.assertEqual(self.machine.fire("done"), "WAITING")
+        self.assertEqual(self.machine.counts, {"WAITING -> TAKE_PHOTO": 1, "TAKE_PHOTO -> WAITING": 1})
+        self.assertEqual([h["event"] for h in self.machine.history], ["photo_due", "done"])
+
+    def test_no_event_stays(self):
+        self.assertEqual(self.machine.fire(None), "WAITING")
+        self.assertEqual(self.machine.counts, {})
+
+    def test_unknown_event_goes_to_error(self):
+        self.assertEqual(self.machine.fire("online"), "ERROR")
+
+    def test_crash_from_anywhere(self):
+        self.machine.config.state = "SEND_UPDATE"
+        self.assertEqual(self.machine.fire("crash"), "ERROR")
+
+    def test_dwell_split_over_midnight(self):
+        now = datetime.datetime(2025, 3, 22, 0, 10)
+        self.machine._record("OFFLINE_ALERT", "online", "WAITING", now, 1800)
+        self.assertEqual(self.machine.daily["2025-03-21"]["OFFLINE_ALERT"], 1200)
+        self.assertEqual(self.machine.daily["2025-03-22"]["OFFLINE_ALERT"], 600)
+        self.assertEqual(self.machine.histograms["OFFLINE_ALERT"][BUCKETS.index(1800)], 1)
+
+    def test_percentile(self):
+        self.machine.samples["TAKE_PHOTO"] = [float(s) for s in range(1, 101)]
+        self.assertEqual(self.machine.percentile("TAKE_PHOTO", 95), 95.0)
+        self.assertIsNone(self.machine.percentile("ERROR", 95))
+
+    def test_bucket(self):
+        self.assertEqual(StateMachine.bucket(0.5), 0)
+        self.assertEqual(StateMachine.bucket(7), BUCKETS.index(10))
+        self.assertEqual(StateMachine.bucket(99999), len(BUCKETS))
+
+    def test_handler_for_unknown_state(self):
+        self.machine.config.state = "NAPPING"
+        with patch("lib.machine.logger"):
+            handler = self.machine.handler(type("Handlers", (), {"handle_errors": lambda self: "retry"})())
+        self.assertEqual(self.machine.config.state, "ERROR")
+        self.assertEqual(handler(), "retry")
+
+    def test_history_size_is_the_machines_own_setting(self):
+        self.machine.machine_config = {"history": 3}
+        with patch.dict(self.machine.config.scheduler_config, {"history": 1}):
+            for _ in range(3):
+                self.machine.fire("photo_due")
+                self.machine.fire("done")
+        self.assertEqual(len(self.machine.history), 3)
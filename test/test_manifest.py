@@ -0,0 +1,41 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from media.manifest import is_verified, load_manifest, record_offload, save_manifest
+
+
+class TestManifest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "GOPR0001.JPG")
+        with open(self.path, "wb") as f:
+            f.write(b"photo")
+        self.manifest = {}
+        record_offload(self.manifest, "100GOPRO", "GOPR0001.JPG", self.path)
+
+    def test_offloaded_copy_is_verified(self):
+        self.assertTrue(is_verified(self.manifest, "100GOPRO", "GOPR0001.JPG", 5, self.directory.name))
+
+    def test_changed_local_copy_is_not_verified(self):
+        with open(self.path, "wb") as f:
+            f.write(b"phot0")
+        self.assertFalse(is_verified(self.manifest, "100GOPRO", "GOPR0001.JPG", 5, self.directory.name))
+
+    def test_size_or_folder_mismatch_is_not_verified(self):
+        self.assertFalse(is_verified(self.manifest, "100GOPRO", "GOPR0001.JPG", 6, self.directory.name))
+        self.assertFalse(is_verified(self.manifest, "101GOPRO", "GOPR0001.JPG", 5, self.directory.name))
+
+    def test_missing_local_copy_is_not_verified(self):
+        os.remove(self.path)
+        self.assertFalse(is_verified(self.manifest, "100GOPRO", "GOPR0001.JPG", 5, self.directory.name))
+
+    def test_missing_manifest_is_empty(self):
+        self.assertEqual(load_manifest(os.path.join(self.directory.name, "nope.json")), {})
+
+    def test_save_and_load(self):
+        path = os.path.join(self.directory.name, "offload_manifest.json")
+        save_manifest(path, self.manifest)
+        self.assertEqual(load_manifest(path), self.manifest)
@@ -0,0 +1,82 @@
+import datetime
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from lib.network import NetworkPlanner, plan_switches
+from lib.scheduler import Action
+
+
+def at(minute, second=0):
+    return datetime.datetime(2025, 3, 21, 10, minute, second)
+
+
+class TestNetworkPlanner(TestCase):
+
+    def setUp(self):
+        self.action_planner = MagicMock()
+        self.network = NetworkPlanner(self.action_planner)
+        self.network.wifi = MagicMock()
+        self.network.switches, self.network.off_gopro = [], []
+        for section, ssid in ((self.network.config.gopro_config, "GP"), (self.network.config.router_config, "Home")):
+            patcher = patch.dict(section, ssid=ssid)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_plan_switches_only_where_network_changes(self):
+        actions = [Action("keep_alive", at(51), at(51)), Action("send_update", at(52), at(52)),
+                   Action("keep_alive", at(54), at(54)), Action("photo", at(56, 54), at(57))]
+        self.assertEqual([(s.network, s.at) for s in plan_switches(actions, "gopro")],
+                         [("router", at(52)), ("gopro", at(54))])
+        self.assertEqual(plan_switches(actions[2:], "gopro"), [])
+
+    def test_window_fits(self):
+        self.action_planner.upcoming.return_value = [Action("photo", at(56, 54), at(57))]
+        self.assertTrue(self.network.window_fits(at(52)))
+        self.assertFalse(self.network.window_fits(at(55, 30)))
+
+    @patch("lib.network.save_json")
+    def test_ensure_counts_switches_and_time_off_gopro(self, _):
+        self.network.wifi.get_current_wifi.return_value = "GP"
+        self.assertTrue(self.network.ensure("gopro"))
+        self.network.wifi.switch_wifi.assert_not_called()
+
+        self.network.wifi.switch_wifi.return_value = True
+        self.network.ensure("router")
+        self.network.wifi.get_current_wifi.return_value = "Home"
+        self.network.ensure("gopro")
+        self.assertEqual([s["to"] for s in self.network.switches], ["router", "gopro"])
+        self.assertEqual(len(self.network.off_gopro), 1)
+        self.assertIn("switches/h (0 failed, 0 unplanned)", self.network.report())
+
+    def test_switches_only_where_the_plan_says(self):
+        self.network.on = "gopro"
+        self.network.ensure = MagicMock(return_value=True)
+        self.action_planner.upcoming.return_value = [Action("keep_alive", at(51), at(51)),
+                                                     Action("send_update", at(52), at(52))]
+        self.network.hour_plan(at(50))
+        self.assertTrue(self.network.switch_for(Action("keep_alive", at(51), at(51))))
+        self.network.ensure.assert_not_called()
+        self.network.wifi.get_current_wifi.assert_not_called()
+        self.assertTrue(self.network.switch_for(Action("send_update", at(52), at(52))))
+        self.network.ensure.assert_called_once_with("router", None)
+        self.assertEqual(self.network.unplanned, 0)
+
+    def test_switch_the_plan_missed_is_counted(self):
+        self.network.on = None
+        self.network.ensure = MagicMock(return_value=True)
+        self.assertTrue(self.network.switch_for(Action("photo", at(56, 54), at(57))))
+        self.network.ensure.assert_called_once_with("gopro", None)
+        self.assertEqual(self.network.unplanned, 1)
+
+    @patch("lib.network.save_json")
+    def test_windows_are_never_skipped_for_good(self, _):
+        self.action_planner.upcoming.return_value = [Action("keep_alive", at(52, 20), at(52, 20))]
+        with patch.dict(self.network.config.update_window_config, max_skipped=2, forced_budget_seconds=20):
+            self.assertTrue(self.network.skip_window(at(52)))
+            self.assertTrue(self.network.skip_window(at(52)))
+            self.assertFalse(self.network.skip_window(at(52)))
+            self.assertEqual(self.network.window_budget(at(52)), 20)
+            self.assertIn("3 update windows skipped in a row", self.network.report())
+            self.network.window_done()
+            self.assertEqual(self.network.skipped_windows, 0)
+            self.assertTrue(self.network.skip_window(at(52)))
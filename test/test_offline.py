@@ -0,0 +1,77 @@
+import datetime
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from lib.offline import OfflineRecovery
+
+
+@patch("lib.offline.save_json")
+class TestOfflineRecovery(TestCase):
+
+    def setUp(self):
+        self.offline = OfflineRecovery()
+        self.offline.failures = 0
+        self.offline.next_attempt = None
+        self.offline.since = None
+        self.offline.radio = []
+        self.offline.offline_config = {"radio_seconds_per_hour": 120}
+        self.offline.backoff_config = {"initial_seconds": 30, "factor": 2, "max_seconds": 300}
+        self.offline.session = MagicMock()
+        self.offline.session.probe.return_value = None
+        self.offline.wifi = MagicMock()
+        self.offline.network = MagicMock()
+        self.offline.network.ssid.return_value = "GP-CAM"
+        self.offline.network.current.return_value = "router"
+        self.now = datetime.datetime(2025, 3, 21, 3, 0)
+
+    def test_camera_answering_is_enough(self, save_json):
+        self.offline.session.probe.return_value = {"1": 1}
+        self.assertTrue(self.offline.attempt(self.now))
+        self.offline.wifi.visible_ssids.assert_not_called()
+        self.offline.network.ensure.assert_not_called()
+
+    def test_no_switch_when_ssid_not_in_range(self, save_json):
+        self.offline.wifi.visible_ssids.return_value = {"HomeRouter"}
+        self.assertFalse(self.offline.attempt(self.now))
+        self.offline.network.ensure.assert_not_called()
+        self.assertEqual(self.offline.last_result, "SSID not in range")
+
+    def test_switch_when_ssid_is_back(self, save_json):
+        self.offline.failures = 3
+        self.offline.wifi.visible_ssids.return_value = {"GP-CAM"}
+        self.offline.network.ensure.return_value = True
+        self.assertTrue(self.offline.attempt(self.now))
+        self.assertEqual(self.offline.failures, 0)
+        self.assertIsNone(self.offline.next_attempt)
+
+    def test_backoff_doubles_up_to_max(self, save_json):
+        self.offline.wifi.visible_ssids.return_value = set()
+        waits = []
+        for _ in range(6):
+            self.offline.attempt(self.now)
+            waits.append((self.offline.next_attempt - self.now).total_seconds())
+        self.assertEqual(waits, [30, 60, 120, 240, 300, 300])
+        self.assertFalse(self.offline.due(self.now))
+        self.assertTrue(self.offline.due(self.offline.next_attempt))
+
+    def test_radio_budget_stops_switching(self, save_json):
+        self.offline.radio = [[(self.now - datetime.timedelta(minutes=10)).isoformat(), 125]]
+        self.offline.wifi.visible_ssids.return_value = {"GP-CAM"}
+        self.assertFalse(self.offline.attempt(self.now))
+        self.offline.network.ensure.assert_not_called()
+        self.assertIn("radio budget", self.offline.last_result)
+
+        # an hour later the old tries don't count anymore
+        self.offline.network.ensure.return_value = True
+        self.assertTrue(self.offline.attempt(self.now + datetime.timedelta(minutes=55)))
+
+    def test_backoff_survives_a_restart(self, save_json):
+        self.offline.wifi.visible_ssids.return_value = set()
+        self.offline.attempt(self.now)
+        self.offline.attempt(self.now)
+        saved = save_json.call_args[0][1]
+
+        with patch("lib.offline.load_json", return_value=saved):
+            restarted = OfflineRecovery()
+        self.assertEqual(restarted.failures, 2)
+        self.assertEqual(restarted.next_attempt, self.now + datetime.timedelta(seconds=60))
@@ -0,0 +1,78 @@
+import datetime
+from unittest import TestCase
+from unittest.mock import patch
+
+import lib.config as config
+from lib.plan import CapturePlan, sun_times, PHOTO, KEEP_ALIVE, SEND_UPDATE
+
+
+class TestSunTimes(TestCase):
+
+    def test_equinox_is_about_twelve_hours(self):
+        sunrise, sunset = sun_times(datetime.date(2025, 3, 20), 46.05, 14.51)
+        daylight = (sunset - sunrise).total_seconds() / 3600
+        self.assertAlmostEqual(daylight, 12.1, delta=0.2)
+
+    def test_summer_is_longer_than_winter(self):
+        summer = sun_times(datetime.date(2025, 6, 21), 46.05, 14.51)
+        winter = sun_times(datetime.date(2025, 12, 21), 46.05, 14.51)
+        self.assertGreater(summer[1] - summer[0], winter[1] - winter[0])
+
+    def test_polar_night_and_midnight_sun(self):
+        self.assertEqual(sun_times(datetime.date(2025, 12, 21), 78.2, 15.6), (None, None))
+        sunrise, sunset = sun_times(datetime.date(2025, 6, 21), 78.2, 15.6)
+        self.assertEqual(sunset - sunrise, datetime.timedelta(days=1))
+
+
+class TestCapturePlan(TestCase):
+
+    def setUp(self):
+        patcher = patch.multiple(config.global_config, photo_timer=[3, 12, 21, 30, 39, 48, 57],
+                                 keep_alive_timer=[0, 6, 9, 15, 18, 24, 27, 33, 36, 42, 45, 51, 54],
+                                 update_timer=[52], sun_plan_config={})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.plan = CapturePlan()
+
+    def test_fixed_plan_is_the_same_every_hour(self):
+        day = datetime.date(2025, 3, 21)
+        for hour in (3, 14):
+            self.assertEqual(self.plan.at(datetime.datetime(2025, 3, 21, hour, 12)), PHOTO)
+            self.assertEqual(self.plan.at(datetime.datetime(2025, 3, 21, hour, 15)), KEEP_ALIVE)
+            self.assertEqual(self.plan.at(datetime.datetime(2025, 3, 21, hour, 52)), SEND_UPDATE)
+        self.assertIs(self.plan.day(day), self.plan.day(day))
+
+    def test_sun_plan_is_dense_at_golden_hour_and_empty_at_night(self):
+        self.plan.config.sun_plan_config = {
+            "enabled": True, "latitude": 46.05, "longitude": 14.51, "golden_hour_minutes": 60, "offset": 3,
+            "every_minutes": {"night": 0, "day": 9, "golden": 3},
+        }
+        day = datetime.date(2025, 3, 21)
+        minutes, sunrise, sunset = self.plan.day(day)
+
+        def photos(start, end):
+            return sum(1 for m in range(start, end) if minutes[m] & PHOTO)
+
+        rise = sunrise.hour * 60 + sunrise.minute
+        midday = (rise + sunset.hour * 60 + sunset.minute) // 2
+        self.assertEqual(photos(60, 180), 0)
+        self.assertEqual(photos(rise - 30, rise + 30), 20)
+        self.assertLess(photos(midday - 30, midday + 30), 8)
+        self.assertTrue(self.plan.has(datetime.datetime(2025, 3, 21, 2, 52), "send_update"))
+
+        # Keep-alives fill every gap between photos, night or day, so the camera Wi-Fi never goes more than
+        # keep_alive_gap_minutes without hearing from us
+        contacts = [m for m in range(len(minutes)) if minutes[m] & (PHOTO | KEEP_ALIVE)]
+        self.assertEqual(contacts[0], 0)
+        self.assertLessEqual(max(b - a for a, b in zip(contacts, contacts[1:])), 3)
+        self.assertFalse(any(minutes[m] & PHOTO and minutes[m] & KEEP_ALIVE for m in contacts))
+
+    @patch.multiple(config.global_config, photo_timer=[3], keep_alive_timer=[], update_timer=[])
+    def test_next_planned_skips_empty_minutes_and_days(self):
+        horizon = datetime.datetime(2025, 3, 23)
+        self.assertEqual(self.plan.next_planned(datetime.datetime(2025, 3, 21, 10, 3), horizon),
+                         datetime.datetime(2025, 3, 21, 10, 3))
+        self.assertEqual(self.plan.next_planned(datetime.datetime(2025, 3, 21, 23, 4), horizon),
+                         datetime.datetime(2025, 3, 22, 0, 3))
+        self.assertIsNone(self.plan.next_planned(datetime.datetime(2025, 3, 21, 23, 4),
+                                                 datetime.datetime(2025, 3, 22, 0, 3)))
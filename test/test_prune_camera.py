@@ -0,0 +1,62 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+import media.prune_camera as prune_camera
+from media.manifest import record_offload, save_manifest, MANIFEST_NAME
+
+
+class TestPruneCamera(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.manifest = {}
+        self.media = []
+        for number in range(1, 6):
+            name = f"GOPR000{number}.JPG"
+            with open(os.path.join(self.directory.name, name), "wb") as f:
+                f.write(b"photo")
+            record_offload(self.manifest, "100GOPRO", name, os.path.join(self.directory.name, name))
+            self.media.append(["100GOPRO", name, "5", str(1000 + number)])
+
+    def test_unverified_file_is_never_pruned(self):
+        with open(os.path.join(self.directory.name, "GOPR0002.JPG"), "wb") as f:
+            f.write(b"other")
+        prunable = prune_camera.select_prunable(self.media, self.manifest, self.directory.name, keep_last=0)
+        self.assertNotIn("GOPR0002.JPG", [name for _, name, _ in prunable])
+        self.assertEqual(len(prunable), 4)
+
+    def test_newest_files_stay(self):
+        prunable = prune_camera.select_prunable(self.media, self.manifest, self.directory.name, keep_last=2)
+        self.assertEqual([name for _, name, _ in prunable], ["GOPR0001.JPG", "GOPR0002.JPG", "GOPR0003.JPG"])
+
+    def test_not_in_manifest_is_never_pruned(self):
+        self.media.append(["100GOPRO", "GOPR0009.JPG", "5", "900"])
+        prunable = prune_camera.select_prunable(self.media, self.manifest, self.directory.name, keep_last=0)
+        self.assertNotIn("GOPR0009.JPG", [name for _, name, _ in prunable])
+
+    @patch("media.prune_camera.time.sleep")
+    @patch("media.prune_camera.GoProCamera")
+    def test_deletes_in_batches(self, camera, sleep):
+        save_manifest(os.path.join(self.directory.name, MANIFEST_NAME), self.manifest)
+        gopro = camera.GoPro.return_value
+        gopro.listMedia.return_value = self.media
+        gopro.deleteFile.return_value = "{}"
+        batches = []
+        gopro.deleteFile.side_effect = lambda folder, name: batches[-1].append(name) or "{}"
+        sleep.side_effect = lambda seconds: batches.append([])
+        batches.append([])
+        with patch.dict(prune_camera.pruning_config, {"keep_last": 0, "batch_size": 2, "manifest": None,
+                                                      "log": os.path.join(self.directory.name, "prune_log.jsonl")}):
+            prune_camera.main(self.directory.name)
+        self.assertEqual([len(batch) for batch in batches if batch], [2, 2, 1])
+        self.assertEqual(sleep.call_count, 3)
+
+    @patch("media.prune_camera.GoProCamera")
+    def test_missing_manifest_prunes_nothing(self, camera):
+        with patch.dict(prune_camera.pruning_config, {"manifest": None}):
+            prune_camera.main(self.directory.name)
+        camera.GoPro.assert_not_called()
+        camera.GoPro.return_value.deleteFile.assert_not_called()
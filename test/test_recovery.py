@@ -0,0 +1,66 @@
+import datetime
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from lib.plan import CapturePlan
+from lib.scheduler import CaptureScheduler, Action
+from lib.recovery import Recovery
+
+
+@patch("lib.recovery.save_json")
+class TestRecovery(TestCase):
+
+    def setUp(self):
+        self.recovery = Recovery()
+        self.recovery.restarts = []
+        self.recovery.session = MagicMock(model=None, interface=None, last_success=None)
+        scheduler = CaptureScheduler()
+        scheduler.records = []
+        scheduler.config.photo_timer = [3, 12, 21, 30, 39, 48, 57]
+        scheduler.config.sun_plan_config = {}
+        scheduler.plan = CapturePlan()
+        self.recovery.scheduler = scheduler
+        self.config = self.recovery.config
+        self.addCleanup(setattr, self.config, "next_photo_target", None)
+
+    def test_live_slot_goes_straight_to_take_photo(self, save_json):
+        self.recovery.saved = {"last_photo_target": "2025-03-21T09:57:00"}
+        state = self.recovery.restore(datetime.datetime(2025, 3, 21, 10, 3, 5))
+        self.assertEqual(state, "TAKE_PHOTO")
+        self.assertEqual(self.config.next_photo_target, datetime.datetime(2025, 3, 21, 10, 3))
+        self.assertEqual(self.config.last_photo_minute, 57)
+
+    def test_slot_already_taken_is_not_retaken(self, save_json):
+        self.recovery.saved = {"last_photo_target": "2025-03-21T10:03:00"}
+        self.assertEqual(self.recovery.restore(datetime.datetime(2025, 3, 21, 10, 3, 10)), "WAITING")
+        self.assertEqual(self.config.last_photo_target, datetime.datetime(2025, 3, 21, 10, 3))
+
+    def test_session_fingerprint(self, save_json):
+        gopro = self.config.gopro_config
+        fingerprint = {"ip": gopro["ip"], "mac": gopro["mac"], "model": "HERO5 Black", "interface": "gpcontrol",
+                       "last_success": "2025-03-21T10:02:00"}
+        self.recovery.saved = {"session": fingerprint}
+        self.recovery.restore(datetime.datetime(2025, 3, 21, 10, 5))
+        self.assertEqual(self.recovery.session.model, "HERO5 Black")
+
+        self.recovery.session.model = None
+        self.recovery.saved = {"session": dict(fingerprint, mac="00:00:00:00:00:00")}
+        self.recovery.restore(datetime.datetime(2025, 3, 21, 10, 5))
+        self.assertIsNone(self.recovery.session.model)
+
+    def test_restart_to_first_photo(self, save_json):
+        self.recovery.saved = {}
+        started = datetime.datetime(2025, 3, 21, 10, 2)
+        self.recovery.restore(started)
+        self.recovery.captured(datetime.datetime(2025, 3, 21, 10, 3), started + datetime.timedelta(seconds=61.5))
+        # only the first photo after the restart counts
+        self.recovery.captured(datetime.datetime(2025, 3, 21, 10, 12), started + datetime.timedelta(minutes=10))
+        self.assertEqual(self.recovery.restarts[-1]["first_photo_seconds"], 61.5)
+        self.assertIn("last 62s", self.recovery.report())
+
+    def test_next_action_is_saved_when_it_changes(self, save_json):
+        action = Action("photo", datetime.datetime(2025, 3, 21, 10, 2, 54), datetime.datetime(2025, 3, 21, 10, 3))
+        self.recovery.planned(action)
+        self.recovery.planned(action)
+        self.assertEqual(save_json.call_count, 1)
+        self.assertEqual(save_json.call_args[0][1]["next_action"]["kind"], "photo")
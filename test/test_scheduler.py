@@ -0,0 +1,124 @@
+import datetime
+from unittest import TestCase
+from unittest.mock import patch
+
+import lib.config as config
+
+from lib.plan import CapturePlan
+from lib.keepalive import KeepAliveController, SAFE_MAX_SECONDS
+from lib.scheduler import CaptureScheduler, ActionPlanner
+
+
+class TestCaptureScheduler(TestCase):
+
+    def setUp(self):
+        # On the shared config, so put it back afterwards or the next test plans with ours
+        patcher = patch.multiple(config.global_config, photo_timer=[3, 12, 21, 30, 39, 48, 57], sun_plan_config={})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.scheduler = CaptureScheduler()
+        self.scheduler.records = []
+        self.scheduler.plan = CapturePlan()
+
+    def test_next_target_is_the_next_photo_minute(self):
+        now = datetime.datetime(2025, 3, 21, 10, 2, 50)
+        self.assertEqual(self.scheduler.next_target(now), datetime.datetime(2025, 3, 21, 10, 3))
+
+    def test_next_target_late_but_not_missed(self):
+        now = datetime.datetime(2025, 3, 21, 10, 3, 20)
+        self.assertEqual(self.scheduler.next_target(now), datetime.datetime(2025, 3, 21, 10, 3))
+
+    def test_next_target_skips_taken_slot(self):
+        now = datetime.datetime(2025, 3, 21, 10, 3, 20)
+        taken = datetime.datetime(2025, 3, 21, 10, 3)
+        self.assertEqual(self.scheduler.next_target(now, taken), datetime.datetime(2025, 3, 21, 10, 12))
+
+    def test_lead_is_median_latency(self):
+        self.scheduler.records = [{"latency": latency} for latency in (4.0, 9.0, 5.0)]
+        self.assertEqual(self.scheduler.lead_seconds(), 5.0)
+
+
+class TestActionPlanner(TestCase):
+
+    def setUp(self):
+        patcher = patch.multiple(config.global_config, photo_timer=[3, 12, 21, 30, 39, 48, 57],
+                                 keep_alive_timer=[0, 6, 9, 15, 18, 24, 27, 33, 36, 42, 45, 51, 54, 56],
+                                 update_timer=[52], sun_plan_config={}, last_photo_target=None,
+                                 last_keep_alive_slot=None, last_update_slot=None, missed_slots=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.scheduler = CaptureScheduler()
+        self.scheduler.records = []
+        self.planner = ActionPlanner(self.scheduler)
+        self.planner.plan = CapturePlan()
+        self.planner.keep_alive = KeepAliveController()
+
+    def test_upcoming_in_order(self):
+        actions = self.planner.upcoming(datetime.datetime(2025, 3, 21, 10, 50))
+        self.assertEqual([a.kind for a in actions], ["keep_alive", "send_update", "keep_alive"])
+        self.assertEqual(actions[0].at, datetime.datetime(2025, 3, 21, 10, 51))
+
+    def test_photo_starts_early_by_lead(self):
+        actions = self.planner.upcoming(datetime.datetime(2025, 3, 21, 10, 2))
+        lead = datetime.timedelta(seconds=self.scheduler.lead_seconds())
+        self.assertEqual(actions[0], ("photo", datetime.datetime(2025, 3, 21, 10, 3) - lead, datetime.datetime(2025, 3, 21, 10, 3)))
+
+    def test_keep_alive_running_into_photo_is_not_planned(self):
+        self.planner.scheduler_config = dict(self.planner.scheduler_config, durations={"keep_alive": 60})
+        actions = self.planner.upcoming(datetime.datetime(2025, 3, 21, 10, 55))
+        self.assertNotIn(datetime.datetime(2025, 3, 21, 10, 56), [a.slot for a in actions])
+        self.assertEqual(actions[0].kind, "photo")
+
+    def test_keep_alive_dropped_when_camera_can_wait(self):
+        keep_alive = self.planner.keep_alive
+        keep_alive.adaptive_config = {"enabled": True}
+        keep_alive.spacing = 400
+        keep_alive.last_contact = datetime.datetime(2025, 3, 21, 10, 48)
+        actions = self.planner.upcoming(datetime.datetime(2025, 3, 21, 10, 50))
+        self.assertEqual([(a.kind, a.slot.minute) for a in actions], [("send_update", 52), ("keep_alive", 54), ("photo", 57)])
+
+    def test_nothing_is_dropped_on_the_three_minute_grid(self):
+        # The shipped minutes: skipping any keep-alive leaves ~6 minutes, past the cap
+        keep_alive = self.planner.keep_alive
+        keep_alive.adaptive_config = {"enabled": True, "max_seconds": 420}
+        keep_alive.spacing = keep_alive.limit()
+        keep_alive.last_contact = datetime.datetime(2025, 3, 21, 10, 0)
+        actions = self.planner.upcoming(datetime.datetime(2025, 3, 21, 10, 0, 30), count=20)
+        self.assertEqual([a.slot.minute for a in actions if a.kind == "keep_alive" and a.slot.minute < 55],
+                         [6, 9, 15, 18, 24, 27, 33, 36, 42, 45, 51, 54])
+
+    def test_keep_alives_dropped_on_a_one_minute_grid(self):
+        keep_alive = self.planner.keep_alive
+        keep_alive.adaptive_config = {"enabled": True}
+        keep_alive.spacing = SAFE_MAX_SECONDS
+        keep_alive.last_contact = datetime.datetime(2025, 3, 21, 10, 21)
+        every_minute = [m for m in range(60) if m not in config.global_config.photo_timer]
+        with patch.multiple(config.global_config, keep_alive_timer=every_minute, update_timer=[]):
+            self.planner.plan = CapturePlan()
+            actions = self.planner.upcoming(datetime.datetime(2025, 3, 21, 10, 21, 30), count=20)
+        kept = [a.slot.minute for a in actions if a.kind == "keep_alive" and a.slot.minute < 30]
+        self.assertEqual(kept, [24, 27])
+        contacts = [keep_alive.last_contact] + [a.at for a in actions]
+        self.assertLessEqual(max((b - a).total_seconds() for a, b in zip(contacts, contacts[1:])), SAFE_MAX_SECONDS)
+
+    def test_slot_that_went_by_while_busy_is_counted_once(self):
+        self.planner.upcoming(datetime.datetime(2025, 3, 21, 10, 2))
+        # TAKE_PHOTO/SEND_UPDATE ran long, the photo at :03 is more than late_seconds ago
+        actions = self.planner.upcoming(datetime.datetime(2025, 3, 21, 10, 5))
+        self.assertNotIn("photo", [a.kind for a in actions if a.slot.minute == 3])
+        self.assertEqual(config.global_config.missed_slots, 1)
+        self.planner.upcoming(datetime.datetime(2025, 3, 21, 10, 5, 30))
+        self.assertEqual(config.global_config.missed_slots, 1)
+
+    def test_slot_taken_is_not_missed(self):
+        self.planner.upcoming(datetime.datetime(2025, 3, 21, 10, 2))
+        config.global_config.last_photo_target = datetime.datetime(2025, 3, 21, 10, 3)
+        self.planner.upcoming(datetime.datetime(2025, 3, 21, 10, 5))
+        self.assertEqual(config.global_config.missed_slots, 0)
+
+    def test_keep_alive_skipped_on_purpose_is_not_missed(self):
+        self.planner.scheduler_config = dict(self.planner.scheduler_config, durations={"keep_alive": 60})
+        self.planner.upcoming(datetime.datetime(2025, 3, 21, 10, 55))
+        config.global_config.last_photo_target = datetime.datetime(2025, 3, 21, 10, 57)
+        self.planner.upcoming(datetime.datetime(2025, 3, 21, 10, 58))
+        self.assertEqual(config.global_config.missed_slots, 0)
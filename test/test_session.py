@@ -0,0 +1,115 @@
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from lib.deadline import Deadline, DeadlineExceeded
+from lib.session import CameraSession
+
+
+@patch("lib.session.GoProCamera")
+class TestCameraSession(TestCase):
+
+    def setUp(self):
+        self.session = CameraSession()
+        self.session.wifi = MagicMock()
+        self.session.keep_alive = MagicMock()
+        self.session.keep_alive.last_contact = None
+        self.session.waits_config = {"wake": 1, "mode": 1, "sleep": 1}
+
+    def test_camera_is_detected_once_and_shared(self, GoProCamera):
+        first = self.session.connect()
+        second = self.session.connect()
+        self.assertIs(first, second)
+        self.assertEqual(GoProCamera.GoPro.call_count, 1)
+        self.assertEqual(self.session.detections, 1)
+
+    def test_failure_forces_detection_on_next_use(self, GoProCamera):
+        GoProCamera.GoPro.side_effect = [MagicMock(), MagicMock()]
+        first = self.session.connect()
+        self.session.mark_failed(ConnectionError("no answer"))
+        self.assertIsNone(self.session.camera)
+        self.assertEqual(self.session.consecutive_failures, 1)
+        self.assertIsNot(self.session.connect(), first)
+        self.assertEqual(self.session.detections, 2)
+
+    def test_mark_ok_resets_failures(self, GoProCamera):
+        self.session.mark_failed(ConnectionError("no answer"))
+        self.session.mark_ok()
+        self.assertEqual(self.session.consecutive_failures, 0)
+        self.assertEqual(self.session.health()["consecutive_failures"], 0)
+
+    def test_undetected_camera_is_not_kept(self, GoProCamera):
+        GoProCamera.GoPro.return_value.whichCam.return_value = ""
+        with self.assertRaises(ConnectionError):
+            self.session.connect()
+        self.assertIsNone(self.session.camera)
+
+    def test_awake_time_from_wake_to_sleep(self, GoProCamera):
+        self.session.probe = MagicMock(side_effect=[{"82": 1}, None])
+        now = [100.0]
+        with patch("lib.session.time.monotonic", lambda: now[0]):
+            self.session.wake()
+            self.assertEqual(self.session.awake_since, 100.0)
+            now[0] = 112.5
+            self.session.sleep()
+        self.assertEqual(self.session.last_awake, 12.5)
+        self.assertIsNone(self.session.awake_since)
+
+    def test_power_off_wait_ends_on_first_failed_probe(self, GoProCamera):
+        self.session.probe = MagicMock(return_value=None)
+        self.session.sleep()
+        self.session.probe.assert_called_once_with(timeout=0.3)
+        self.assertEqual(self.session.waits["sleep"], 0.0)
+
+    def test_wait_until_returns_the_first_answer(self, GoProCamera):
+        answers = iter([None, None, {"8": 0}])
+        with patch("lib.session.time.sleep"):
+            self.assertEqual(self.session.wait_until("capture", lambda: next(answers), 5), {"8": 0})
+        self.assertIn("capture", self.session.waits)
+
+    def test_wait_until_gives_up_after_max_wait(self, GoProCamera):
+        now = [0.0]
+
+        def later(seconds):
+            now[0] += seconds
+
+        with patch("lib.session.time.monotonic", lambda: now[0]), patch("lib.session.time.sleep", later):
+            self.assertIsNone(self.session.wait_until("mode", lambda: None, 2))
+        self.assertEqual(self.session.waits["mode"], 2.0)
+
+    def test_wait_until_cut_short_by_deadline_raises(self, GoProCamera):
+        with self.session.within(Deadline(0.05, name="take_photo")):
+            with self.assertRaises(DeadlineExceeded):
+                self.session.wait_until("wake", lambda: None, 15, interval=0.01)
+
+    def test_probe_parses_status_and_clamps_timeout(self, GoProCamera):
+        with patch("lib.session.urllib.request.urlopen") as urlopen:
+            urlopen.return_value.read.return_value = b'{"status": {"8": 0, "38": 12}}'
+            self.assertEqual(self.session.probe(), {"8": 0, "38": 12})
+            with self.session.within(Deadline(0.5)):
+                self.session.probe()
+            self.assertLessEqual(urlopen.call_args[1]["timeout"], 0.5)
+            urlopen.side_effect = OSError("host is down")
+            self.assertIsNone(self.session.probe())
+
+    def test_set_mode_waits_for_the_camera_to_report_it(self, GoProCamera):
+        self.session.probe = MagicMock(side_effect=[{"43": 0}, {"43": 1}])
+        with patch("lib.session.time.sleep"):
+            self.assertEqual(self.session.set_mode("1"), {"43": 1})
+        self.session.camera.mode.assert_called_once_with("1", "0")
+
+    def test_nudge_sends_goprocams_keep_alive_without_waking(self, GoProCamera):
+        camera = self.session.connect()
+        self.session.probe = MagicMock(return_value={"8": 0})
+        self.assertTrue(self.session.nudge())
+        camera.sendKeepAlive.assert_called_once_with()
+        camera.power_on.assert_not_called()
+        self.session.wifi.send_wol.assert_not_called()
+        self.session.keep_alive.contact.assert_called_once_with()
+
+    def test_nudge_falls_back_to_a_ping_and_never_detects(self, GoProCamera):
+        self.session.probe = MagicMock(return_value=None)
+        self.session.wifi.check_network_reachable.return_value = False
+        self.assertFalse(self.session.nudge())
+        GoProCamera.GoPro.assert_not_called()
+        self.session.wifi.send_wol.assert_not_called()
+        self.session.keep_alive.contact.assert_not_called()
@@ -0,0 +1,92 @@
+import os
+import sys
+import json
+import random
+import shutil
+import tempfile
+import subprocess
+from unittest import TestCase
+
+from lib.simulation import PROFILE, VirtualClock, FakeCamera, SimulationOver, InlineExecutor, simulation_config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _OnGoPro:
+
+    def on_gopro(self):
+        return True
+
+
+class TestVirtualClock(TestCase):
+
+    def test_sleep_takes_no_real_time_and_ends_the_run(self):
+        clock = VirtualClock(1000.0, 1060.0)
+        clock.sleep(30)
+        self.assertEqual(clock.time(), 1030.0)
+        self.assertEqual(clock.monotonic(), 1030.0)
+        with self.assertRaises(SimulationOver):
+            clock.sleep(30)
+
+
+class TestFakeCamera(TestCase):
+
+    def setUp(self):
+        self.clock = VirtualClock(0.0, 10 ** 9)
+        self.camera = FakeCamera(self.clock, random.Random(1), dict(PROFILE, wake_failure=0))
+        self.camera.wifi = _OnGoPro()
+
+    def test_wake_takes_the_profile_wake_time(self):
+        self.camera.wol()
+        self.assertIsNone(self.camera.status())
+        self.clock.advance(PROFILE["wake_seconds"][1])
+        self.assertIsNotNone(self.camera.status())
+        self.camera.shutter()
+        self.assertEqual(len(self.camera.shots), 1)
+
+    def test_wifi_dies_without_contact(self):
+        self.clock.advance(PROFILE["camera_wifi_sleep_seconds"] + 1)
+        self.assertFalse(self.camera.alive())
+        self.assertEqual(self.camera.wifi_deaths, 1)
+        self.clock.advance(PROFILE["camera_reset_hours"] * 3600)
+        self.assertTrue(self.camera.alive())
+
+
+class TestInlineExecutor(TestCase):
+
+    def test_tasks_are_done_when_submitted(self):
+        executor = InlineExecutor(max_workers=2)
+        self.assertEqual(executor.submit(lambda a, b: a + b, 1, b=2).result(timeout=0), 3)
+        failed = executor.submit(lambda: 1 / 0)
+        self.assertTrue(failed.done())
+        self.assertIsInstance(failed.exception(timeout=0), ZeroDivisionError)
+
+
+class TestSimulationConfig(TestCase):
+
+    def test_same_ssid_for_router_and_gopro_is_split(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir)
+        source = os.path.join(workdir, "source.json")
+        with open(os.path.join(ROOT, "config.json"), "r") as f:
+            raw = json.load(f)
+        raw["router"]["ssid"] = raw["gopro"]["ssid"] = "ssid_here"
+        with open(source, "w") as f:
+            json.dump(raw, f)
+        with open(simulation_config(source, workdir), "r") as f:
+            sim = json.load(f)
+        self.assertNotEqual(sim["router"]["ssid"], sim["gopro"]["ssid"])
+
+
+class TestSimulation(TestCase):
+
+    def test_two_days(self):
+        # lib is already imported here with the test config, the simulation needs a fresh interpreter
+        result = subprocess.run([sys.executable, "-m", "lib.simulation", "--days", "2", "--json"],
+                                cwd=ROOT, capture_output=True, text=True, timeout=300)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        numbers = json.loads(result.stdout)
+        self.assertGreater(numbers["slots"], 0)
+        self.assertGreater(numbers["hit_rate"], 0.9)
+        self.assertIn("TAKE_PHOTO", numbers["dwell"])
+        self.assertLess(numbers["radio_seconds_per_hour"], 120)
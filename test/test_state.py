@@ -1,4 +1,11 @@
+import datetime
 from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from lib.deadline import Deadline, DeadlineExceeded
+from lib.gopro import GoPro
+from lib.scheduler import Action
+from lib.state import State
 
 
 class TestState(TestCase):
@@ -8,3 +15,98 @@ class TestState(TestCase):
 
     def test_save_state(self):
         self.fail()
+
+
+class TestWaiting(TestCase):
+
+    def setUp(self):
+        self.state = State()
+        self.state.planner = MagicMock()
+        self.state.network = MagicMock()
+        self.state.recovery = MagicMock()
+        at = datetime.datetime.now() + datetime.timedelta(minutes=5)
+        self.state.planner.upcoming.return_value = [Action("photo", at, at)]
+        self.state.planner.sleep_until.return_value = False
+
+    def test_idle_wake_on_gopro_wifi_keeps_waiting(self):
+        self.state.network.current.return_value = "gopro"
+        self.assertIsNone(self.state.handle_waiting())
+        self.state.network.ensure.assert_not_called()
+
+    def test_idle_wake_reconnects_a_dropped_gopro_wifi(self):
+        self.state.network.current.return_value = None
+        self.state.network.ensure.return_value = True
+        self.assertIsNone(self.state.handle_waiting())
+        self.state.network.ensure.assert_called_once_with("gopro")
+
+    def test_idle_wake_goes_offline_if_it_cant_reconnect(self):
+        self.state.network.current.return_value = "router"
+        self.state.network.ensure.return_value = False
+        self.assertEqual(self.state.handle_waiting(), "offline")
+
+
+class TestSendingUpdate(TestCase):
+
+    def setUp(self):
+        self.state = State()
+        self.state.network = MagicMock()
+        self.state.update_batch = MagicMock()
+        at = datetime.datetime.now()
+        self.state.action = Action("send_update", at, at)
+
+    def test_window_follows_the_plan(self):
+        self.state.network.skip_window.return_value = False
+        self.state.network.window_budget.return_value = 40
+        self.assertEqual(self.state.handle_sending_update(), "done")
+        self.state.network.switch_for.assert_called_once_with(self.state.action)
+        self.state.update_batch.run.assert_called_once_with(40)
+        self.state.network.window_done.assert_called_once_with()
+        self.state.network.ensure.assert_called_once_with("gopro")
+
+    def test_skipped_window_doesnt_leave_the_gopro_wifi(self):
+        self.state.network.skip_window.return_value = True
+        self.assertEqual(self.state.handle_sending_update(), "done")
+        self.state.network.switch_for.assert_not_called()
+        self.state.update_batch.run.assert_not_called()
+
+    @patch("lib.state.sync_time", return_value=True)
+    def test_clock_runs_alone_first_with_its_timeout(self, sync_time):
+        ntp = State().update_batch.tasks[0]
+        self.assertEqual((ntp.name, ntp.alone), ("ntp", True))
+        ntp.run()
+        sync_time.assert_called_once_with(timeout=ntp.timeout)
+
+
+class TestTakingPhoto(TestCase):
+
+    def setUp(self):
+        self.state = State()
+        self.state.network = MagicMock()
+        self.state.gopro = MagicMock()
+        self.state.scheduler = MagicMock()
+        self.state.recovery = MagicMock()
+        self.state.network.switch_for.return_value = True
+        patcher = patch.object(self.state.config, "photo_capture_error_counter", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_missed_slot_is_not_a_camera_error(self):
+        self.state.gopro.take_photo.side_effect = DeadlineExceeded(Deadline(0, "photo"), "wake")
+        self.assertEqual(self.state.handle_taking_photo(), "failed")
+        self.assertEqual(self.state.config.photo_capture_error_counter, 0)
+
+    def test_camera_that_never_wakes_is_a_failed_capture(self):
+        gopro = GoPro()
+        gopro.session = MagicMock()
+        gopro.session.wake.return_value = None
+        self.state.gopro = gopro
+        self.assertEqual(self.state.handle_taking_photo(), "failed")
+        self.assertEqual(self.state.config.photo_capture_error_counter, 1)
+        gopro.session.mark_failed.assert_called_once()
+        self.state.scheduler.record.assert_not_called()
+        self.state.recovery.captured.assert_not_called()
+
+    def test_camera_error_is_counted_once(self):
+        self.state.gopro.take_photo.side_effect = ConnectionError("GoPro was not detected.")
+        self.assertEqual(self.state.handle_taking_photo(), "failed")
+        self.assertEqual(self.state.config.photo_capture_error_counter, 1)
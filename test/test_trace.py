@@ -0,0 +1,101 @@
+import os
+import json
+import socket
+import tempfile
+import subprocess
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from lib.trace import Recorder, Replay, ReplayClock, command_key, load, url_key
+
+
+class TestKeys(TestCase):
+
+    def test_passwords_are_redacted(self):
+        self.assertEqual(command_key(["sudo", "nmcli", "dev", "wifi", "connect", "'GP-CAM'", "password", "'s3cret'"]),
+                         "sudo nmcli dev wifi connect 'GP-CAM' password '***'")
+        self.assertEqual(command_key("nmcli dev wifi connect GP-CAM password s3cret"),
+                         "nmcli dev wifi connect GP-CAM password ***")
+
+    def test_url_key_drops_the_host(self):
+        self.assertEqual(url_key("http://10.5.5.9/gp/gpControl/command/shutter?p=1"), "/gp/gpControl/command/shutter?p=1")
+
+
+class TestRecorder(TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".jsonl")
+        os.write(fd, b'{"trace": 1, "monotonic": 0, "offset": 0}\n')
+        self.recorder = Recorder()
+        self.recorder.fd = fd
+        self.recorder.started = 0.0
+        self.addCleanup(os.remove, self.path)
+        self.addCleanup(os.close, fd)
+
+    def rows(self):
+        return load(self.path)[1]
+
+    def test_run_is_recorded(self):
+        self.recorder.real["run"] = lambda args, **kwargs: subprocess.CompletedProcess(args, 0, b"GP-CAM\n", b"")
+        result = self.recorder.run(["iwgetid", "-r"], capture_output=True)
+        self.assertEqual(result.stdout, b"GP-CAM\n")
+        row = self.rows()[0]
+        self.assertEqual(row[2:4], ["run", "iwgetid -r"])
+        self.assertEqual(row[5], {"rc": 0, "out": "GP-CAM\n", "err": ""})
+
+    def test_timeout_is_recorded_and_raised(self):
+        def run(args, **kwargs):
+            raise subprocess.TimeoutExpired(args, 30)
+        self.recorder.real["run"] = run
+        with self.assertRaises(subprocess.TimeoutExpired):
+            self.recorder.run("sudo nmcli -w 30 dev wifi connect 'GP-CAM' password 'x'", shell=True)
+        self.assertEqual(self.rows()[0][5], {"x": "timeout"})
+        self.assertNotIn("'x'", self.rows()[0][3])
+
+    def test_push_keeps_only_the_title(self):
+        self.recorder.real["post"] = MagicMock(return_value=MagicMock(status_code=200, text="{}"))
+        self.recorder.post("https://api.pushbullet.com/v2/pushes", json={"title": "Status", "body": "all good"},
+                           headers={"Access-Token": "token"})
+        row = self.rows()[0]
+        self.assertEqual(row[2:4], ["push", "push:Status"])
+        self.assertNotIn("token", json.dumps(row))
+
+
+class TestReplay(TestCase):
+
+    def setUp(self):
+        rows = [
+            [0.0, 100.0, "run", "iwgetid -r", 0.5, {"rc": 0, "out": "GP-CAM\n", "err": ""}],
+            [1.0, 100.0, "run", "iwgetid -r", 0.5, {"rc": 0, "out": "Router\n", "err": ""}],
+            [2.0, 100.0, "run", "nmcli dev wifi rescan", 20.0, {"rc": 0, "out": "", "err": ""}],
+            [3.0, 100.0, "run", "false", 0.1, {"rc": 1, "out": "", "err": "nope"}],
+            [4.0, 100.0, "http", "/gp/gpControl/status", 2.0, {"x": "timeout", "m": "timed out"}],
+        ]
+        self.clock = ReplayClock(1000.0, 100.0, 2000.0)
+        self.replay = Replay({}, rows, self.clock)
+
+    def test_results_in_recorded_order_then_repeated(self):
+        outputs = [self.replay.run(["iwgetid", "-r"], capture_output=True, text=True).stdout for _ in range(3)]
+        self.assertEqual(outputs, ["GP-CAM\n", "Router\n", "Router\n"])
+        self.assertEqual((self.replay.matched, self.replay.repeated), (2, 1))
+        self.assertEqual(self.clock.monotonic(), 1001.5)
+
+    def test_unknown_call_is_counted_as_missing(self):
+        result = self.replay.run(["nmcli", "radio", "wifi", "off"])
+        self.assertEqual(result.returncode, 1)
+        self.assertEqual(self.replay.missing["run nmcli radio wifi off"], 1)
+
+    def test_shorter_timeout_cuts_the_call(self):
+        with self.assertRaises(subprocess.TimeoutExpired):
+            self.replay.run(["nmcli", "dev", "wifi", "rescan"], timeout=5)
+        self.assertEqual(self.clock.monotonic(), 1005.0)
+        self.assertEqual(self.replay.seconds["nmcli"], 5)
+
+    def test_check_raises_on_failure(self):
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.replay.run(["false"], check=True)
+
+    def test_recorded_http_timeout(self):
+        with self.assertRaises(socket.timeout):
+            self.replay.urlopen("http://10.5.5.9/gp/gpControl/status", timeout=10)
+        self.assertEqual(self.clock.time(), 1002.0 + 100.0)
@@ -0,0 +1,99 @@
+import os
+import socket
+import tempfile
+from unittest import TestCase
+
+from lib.watchdog import Watchdog
+
+
+class NotifySocket:
+    """Stands in for systemd's notify socket: a unix datagram socket in a temp dir that collects what we send."""
+
+    def __init__(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "notify")
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        self.sock.setblocking(False)
+
+    def environ(self, watchdog_seconds=None):
+        environ = {"NOTIFY_SOCKET": self.path}
+        if watchdog_seconds is not None:
+            environ["WATCHDOG_USEC"] = str(int(watchdog_seconds * 1e6))
+            environ["WATCHDOG_PID"] = str(os.getpid())
+        return environ
+
+    def messages(self):
+        received = []
+        while True:
+            try:
+                received.append(self.sock.recv(4096).decode())
+            except BlockingIOError:
+                return received
+
+    def close(self):
+        self.sock.close()
+        self.dir.cleanup()
+
+
+class TestWatchdog(TestCase):
+
+    def setUp(self):
+        self.systemd = NotifySocket()
+        self.addCleanup(self.systemd.close)
+
+    def test_ready(self):
+        watchdog = Watchdog(self.systemd.environ(60))
+        watchdog.ready("WAITING")
+        self.assertEqual(self.systemd.messages(), ["READY=1\nSTATUS=WAITING"])
+
+    def test_watchdog_meant_for_another_pid(self):
+        # e.g. bash in ExecStart without exec: systemd watches the shell, not us
+        environ = dict(self.systemd.environ(60), WATCHDOG_PID=str(os.getpid() + 1))
+        watchdog = Watchdog(environ)
+        self.assertIsNone(watchdog.seconds)
+        with self.assertLogs("CentralLogger", "ERROR") as logs:
+            watchdog.ready()
+        self.assertIn(f"meant for pid {os.getpid() + 1}", logs.output[0])
+        self.assertFalse(watchdog.ping())
+        self.assertEqual(self.systemd.messages(), ["READY=1"])
+
+    def test_pings_are_throttled(self):
+        watchdog = Watchdog(self.systemd.environ(60))
+        self.assertTrue(watchdog.ping())
+        self.assertFalse(watchdog.ping())
+        self.assertEqual(self.systemd.messages(), ["WATCHDOG=1"])
+
+        # a quarter of WatchdogSec later it goes out again
+        watchdog.last_ping -= 15
+        self.assertTrue(watchdog.ping())
+        self.assertEqual(watchdog.pings, 2)
+
+    def test_new_status_goes_out_right_away(self):
+        watchdog = Watchdog(self.systemd.environ(60))
+        watchdog.ping("WAITING")
+        watchdog.ping("TAKE_PHOTO")
+        watchdog.ping("TAKE_PHOTO")
+        self.assertEqual(self.systemd.messages(), ["WATCHDOG=1\nSTATUS=WAITING", "WATCHDOG=1\nSTATUS=TAKE_PHOTO"])
+
+    def test_without_systemd_nothing_happens(self):
+        watchdog = Watchdog({})
+        watchdog.ready("WAITING")
+        self.assertFalse(watchdog.ping("WAITING"))
+        self.assertEqual(self.systemd.messages(), [])
+
+    def test_watchdog_for_another_process_is_ignored(self):
+        environ = self.systemd.environ(60)
+        environ["WATCHDOG_PID"] = str(os.getpid() + 1)
+        watchdog = Watchdog(environ)
+        self.assertIsNone(watchdog.seconds)
+        self.assertFalse(watchdog.ping())
+
+    def test_forked_child_stays_quiet(self):
+        watchdog = Watchdog(self.systemd.environ(60))
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0 if not watchdog.ping() else 1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+        self.assertEqual(self.systemd.messages(), [])
@@ -0,0 +1,93 @@
+import os
+import time
+import tempfile
+from unittest import TestCase
+
+import lib.clock as clock
+import lib.keepalive as keepalive
+import lib.utilities as utilities
+from lib.deadline import Deadline, DeadlineExceeded
+from lib.worker import CameraWorker
+
+
+class FakeCamera:
+
+    def __init__(self):
+        self.last_plan = None
+
+    def echo(self, value):
+        self.last_plan = f"echo {value}"
+        return value
+
+    def hang(self):
+        time.sleep(30)
+
+    def fail(self):
+        raise ConnectionError("GoPro was not detected.")
+
+    def run_out(self):
+        raise DeadlineExceeded(Deadline(0, "photo"), "wake")
+
+    def stretch(self):
+        keepalive.controller.spacing = 333
+
+    def drift(self, path):
+        clock.camera_clock.history.append({"drift": 1.5})
+        utilities.save_json(path, clock.camera_clock.history)
+        return os.path.exists(path)
+
+    def parent(self):
+        return os.getppid()
+
+
+class TestCameraWorker(TestCase):
+
+    def setUp(self):
+        self.worker = CameraWorker(factory=FakeCamera, attributes=["last_plan"], timeouts={"default": 5})
+        self.addCleanup(self.worker.stop)
+
+    def test_call_returns_value_and_attributes(self):
+        self.assertEqual(self.worker.call("echo", 42), 42)
+        self.assertEqual(self.worker.last_plan, "echo 42")
+
+    def test_errors_are_raised_in_the_parent(self):
+        with self.assertRaises(ConnectionError):
+            self.worker.call("fail")
+        self.assertEqual(self.worker.call("echo", 1), 1)
+
+    def test_deadline_exceeded_comes_back_as_itself(self):
+        with self.assertRaises(DeadlineExceeded) as raised:
+            self.worker.call("run_out")
+        self.assertEqual((raised.exception.step, raised.exception.deadline.name), ("wake", "photo"))
+
+    def test_hung_worker_is_killed_and_replaced_quickly(self):
+        self.worker.call("echo", 1)
+        pid = self.worker.process.pid
+        start = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            self.worker.call("hang", timeout=0.3)
+        self.assertLess(time.monotonic() - start, 1.3)
+        self.assertNotEqual(self.worker.process.pid, pid)
+        self.assertEqual(self.worker.call("echo", 2), 2)
+        self.assertEqual(self.worker.kills, 1)
+
+    def test_shared_state_comes_back(self):
+        spacing = keepalive.controller.spacing
+        self.addCleanup(setattr, keepalive.controller, "spacing", spacing)
+        self.worker.call("stretch")
+        self.assertEqual(keepalive.controller.spacing, 333)
+
+    def test_changes_and_files_come_back_to_the_parent(self):
+        history = clock.camera_clock.history
+        self.addCleanup(setattr, clock.camera_clock, "history", history)
+        clock.camera_clock.history = [{"drift": 0.2}]
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "camera_clock.json")
+        # the worker never writes a file, it sends it back
+        self.assertFalse(self.worker.call("drift", path))
+        self.assertEqual(clock.camera_clock.history, [{"drift": 0.2}, {"drift": 1.5}])
+        self.assertEqual(utilities.load_json(path, None), [{"drift": 0.2}, {"drift": 1.5}])
+
+    def test_worker_is_not_forked_from_the_main_process(self):
+        self.assertNotEqual(self.worker.call("parent"), os.getpid())
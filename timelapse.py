@@ -7,8 +7,12 @@ import datetime
 
 import lib.config as config
 import lib.state as state
+import lib.machine as machine
+import lib.recovery as recovery
+import lib.trace as trace
 
 from lib.logger import logger
+from lib.watchdog import watchdog
 
 
 class Timelapse:
@@ -16,6 +20,7 @@ class Timelapse:
     def __init__(self):
         self.config = config.global_config
         self.state_handler = state.handler
+        self.machine = machine.machine
 
     def main_loop(self):
         self.config.load_saved_config()
@@ -28,32 +33,29 @@ class Timelapse:
         """
         self.config.restart_counter += 1
         self.config.execution_start_time = datetime.datetime.now()
+        # Last capture, slots done, camera: from the checkpoint. Straight to TAKE_PHOTO if a slot is due right now.
+        self.config.state = recovery.recovery.restore()
+        # Type=notify: systemd counts us as started from here, and wants a ping every WatchdogSec from now on
+        watchdog.ready(self.config.state)
         while True:
             try:
+                watchdog.ping(self.config.state)
                 logger.info(f"Starting main cycle. Current state = {self.config.state}")
-                if self.config.state == "WAITING":
-                    self.state_handler.handle_waiting()
-                elif self.config.state == "TAKE_PHOTO":
-                    self.state_handler.handle_taking_photo()
-                elif self.config.state == "SEND_UPDATE":
-                    self.state_handler.handle_sending_update()
-                elif self.config.state == "ERROR":
-                    self.state_handler.handle_errors()
-
-                # EMERGENCY STATE: If GoPro is offline, we send alert
-                elif self.config.state == "OFFLINE_ALERT":
-                    self.state_handler.handle_being_offline()
-                else:
-                    logger.error(f"Unknown state: {self.config.state}. Forcing ERROR.")
-                    self.config.state = "ERROR"
-
-                # Wait a few seconds before next loop
-                time.sleep(10)
+                # The handler says what happened, the transition table in lib/machine says where that leads
+                event = self.machine.handler(self.state_handler)()
+                self.machine.fire(event)
+
+                # WAITING sleeps until its next deadline by itself, and TAKE_PHOTO is already timed by the planner.
+                # Everything else (ERROR, OFFLINE_ALERT..) waits a few seconds before the next loop.
+                if self.config.state not in ("WAITING", "TAKE_PHOTO"):
+                    time.sleep(10)
             except Exception as e:
                 logger.error(f"Unexpected error in main cycle: {e}")
-                self.config.state = "ERROR"
+                self.machine.fire("crash")
                 time.sleep(10)
 
 if __name__ == "__main__":
+    # trace.record in config.json: every call that leaves the Pi goes to a trace, see lib/trace
+    trace.recorder.start()
     controller = Timelapse()
     controller.main_loop()